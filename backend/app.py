@@ -1,62 +1,1532 @@
 import os
+import atexit
+import queue
+import base64
+import bisect
+import csv
+import io
+import json
+import re
 import sqlite3
+import threading
 import time
-import random
-from datetime import datetime
-from flask import Flask, request, jsonify
+import zlib
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache, wraps
+import click
+from flask import Flask, Response, g, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 
+try:
+    import orjson
+except ImportError:  # optional: faster JSON encoding when installed
+    orjson = None
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson (same output shape as the default)"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_SORT_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
-DB_PATH = os.path.join(app.instance_path, 'database.db')
-CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
+if orjson is not None:
+    app.json = OrjsonProvider(app)
+DB_PATH = os.environ.get('INVENTORY_DB_PATH') or os.path.join(app.instance_path, 'database.db')
+CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True, expose_headers=["X-Stock-Version", "X-Next-Cursor", "ETag"])
+
+# Connection settings applied once when a pooled connection is opened
+DB_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA cache_size=-65536',      # 64 MiB page cache
+    'PRAGMA mmap_size=268435456',    # 256 MiB memory-mapped I/O
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA temp_store=MEMORY',
+)
+DB_POOL_MAX_IDLE = int(os.environ.get('DB_POOL_MAX_IDLE', 8))
+# Prepared statements kept per connection (sqlite3 reuses them by SQL text)
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get('DB_STATEMENT_CACHE_SIZE', 256))
 
 # Database helper functions
 def get_db_connection():
     """Create a connection to the SQLite database"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row  # This enables column access by name: row['column_name']
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, cached_statements=DB_STATEMENT_CACHE_SIZE)
+    for pragma in DB_PRAGMAS:
+        conn.execute(pragma)
+    # Plain tuples: execute_query maps them to dicts using the column names once per cursor
     return conn
 
-def dict_factory(cursor, row):
-    """Convert database row objects to a dictionary"""
-    d = {}
-    for idx, col in enumerate(cursor.description):
-        d[col[0]] = row[idx]
-    return d
-
-def execute_query(query, params=(), one=False, commit=False):
-    """Execute a query and return results"""
-    conn = get_db_connection()
-    conn.row_factory = dict_factory
+class ConnectionPool:
+    """Keeps opened SQLite connections around so requests reuse them"""
+
+    def __init__(self, max_idle):
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+        self._stats = {'opened': 0, 'closed': 0, 'acquired': 0, 'reused': 0, 'in_use': 0}
+
+    def acquire(self):
+        with self._lock:
+            self._stats['acquired'] += 1
+            self._stats['in_use'] += 1
+            while self._idle:
+                path, conn = self._idle.pop()
+                if path == DB_PATH:
+                    self._stats['reused'] += 1
+                    return conn
+                # DB_PATH was switched; drop connections to the old file
+                conn.close()
+                self._stats['closed'] += 1
+            self._stats['opened'] += 1
+        try:
+            return get_db_connection()
+        except Exception:
+            with self._lock:
+                self._stats['in_use'] -= 1
+            raise
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            self._stats['in_use'] -= 1
+            if len(self._idle) < self.max_idle:
+                self._idle.append((DB_PATH, conn))
+                return
+            self._stats['closed'] += 1
+        conn.close()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._stats['closed'] += len(idle)
+        for _, conn in idle:
+            conn.close()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, idle=len(self._idle), max_idle=self.max_idle)
+
+db_pool = ConnectionPool(DB_POOL_MAX_IDLE)
+atexit.register(db_pool.close_all)
+
+def rows_to_dicts(columns, rows):
+    """Map result tuples to dicts; the column names are looked up once per cursor"""
+    return [dict(zip(columns, row)) for row in rows]
+
+def rows_to_columns(columns, rows):
+    """Column-oriented form of a result: {column: [values...]}"""
+    if not rows:
+        return {col: [] for col in columns}
+    return dict(zip(columns, map(list, zip(*rows))))
+
+# Connection of the transaction open on this thread, if any
+_tx_state = threading.local()
+
+@contextmanager
+def transaction(immediate=True):
+    """Run every execute_query in the block on one connection and commit once.
+
+    BEGIN IMMEDIATE takes the write lock up front so validation reads and the
+    writes that depend on them see the same data. Nested blocks join the
+    outer transaction.
+    """
+    if getattr(_tx_state, 'conn', None) is not None:
+        yield _tx_state.conn
+        return
+
+    conn = db_pool.acquire()
+    _tx_state.conn = conn
+    _tx_state.callbacks = []
+    committed = False
+    try:
+        conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+        yield conn
+        conn.commit()
+        committed = True
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        callbacks = _tx_state.callbacks if committed else []
+        _tx_state.conn = None
+        _tx_state.callbacks = []
+        db_pool.release(conn)
+    for callback in callbacks:
+        callback()
+
+def after_commit(callback):
+    """Call callback once the open transaction commits (right away if none is open)"""
+    if getattr(_tx_state, 'conn', None) is None:
+        callback()
+    else:
+        _tx_state.callbacks.append(callback)
+
+class _Rollback(Exception):
+    """Raised inside transactional() to discard the work of a failed request"""
+
+    def __init__(self, rv):
+        self.rv = rv
+
+def transactional(view):
+    """Wrap a view in transaction(); error responses (status >= 400) roll back.
+
+    Successful writes bump data_version once they are committed.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            with transaction():
+                rv = view(*args, **kwargs)
+                status = rv[1] if isinstance(rv, tuple) else getattr(rv, 'status_code', 200)
+                if status >= 400:
+                    raise _Rollback(rv)
+                after_commit(data_version.bump)
+        except _Rollback as rollback:
+            return rollback.rv
+        return rv
+    return wrapper
+
+class DataVersion:
+    """Monotonic counter of committed writes made by this process.
+
+    Listeners react to local writes at once (the stock stream, the response
+    cache); ETags use the database-wide change_version instead.
+    """
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def bump(self):
+        with self._lock:
+            self.value += 1
+            value = self.value
+        for listener in self._listeners:
+            listener(value)
+
+    def subscribe(self, listener):
+        self._listeners.append(listener)
+
+data_version = DataVersion()
+
+# Request and query instrumentation, exposed in Prometheus text format on /metrics
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+@lru_cache(maxsize=1024)
+def query_template(query):
+    """Collapse whitespace and expanded IN lists so one statement is one label"""
+    return re.sub(r'\?(?:\s*,\s*\?)+', '?, ...', ' '.join(query.split()))
+
+def metric_labels(**labels):
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels.items()
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+class Histogram:
+    """Latency histogram with Prometheus bucket semantics (le is inclusive)"""
+
+    __slots__ = ('buckets', 'sum', 'count')
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def render(self, name, **labels):
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), self.buckets):
+            cumulative += count
+            yield f'{name}_bucket{metric_labels(**labels, le=bound)} {cumulative}'
+        yield f'{name}_sum{metric_labels(**labels)} {self.sum}'
+        yield f'{name}_count{metric_labels(**labels)} {self.count}'
+
+class Metrics:
+    """Per-route and per-query counters; observe_* are no-ops while disabled.
+
+    Queries slower than slow_query_ms are logged with their EXPLAIN QUERY PLAN.
+    """
+
+    def __init__(self, enabled, slow_query_ms):
+        self.enabled = enabled
+        self.slow_query_ms = slow_query_ms
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._routes = {}      # (method, route) -> Histogram
+            self._responses = {}   # (method, route, status) -> count
+            self._queries = {}     # template -> [count, seconds, max_seconds, rows]
+            self.slow_queries = 0
+
+    def observe_request(self, method, route, status, seconds):
+        with self._lock:
+            histogram = self._routes.get((method, route))
+            if histogram is None:
+                histogram = self._routes[(method, route)] = Histogram()
+            histogram.observe(seconds)
+            key = (method, route, status)
+            self._responses[key] = self._responses.get(key, 0) + 1
+
+    def observe_query(self, conn, query, params, seconds, rows):
+        template = query_template(query)
+        with self._lock:
+            stats = self._queries.get(template)
+            if stats is None:
+                stats = self._queries[template] = [0, 0.0, 0.0, 0]
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+            stats[3] += rows
+            slow = seconds * 1000 >= self.slow_query_ms
+            if slow:
+                self.slow_queries += 1
+        if slow:
+            self.log_slow_query(conn, query, params, seconds, rows)
+
+    def log_slow_query(self, conn, query, params, seconds, rows):
+        try:
+            plan = '\n'.join(f'  {row[3]}' for row in conn.execute(f'EXPLAIN QUERY PLAN {query}', params))
+        except sqlite3.Error as e:
+            plan = f'  (no plan: {e})'
+        app.logger.warning('Slow query (%.1f ms, %d rows): %s\n%s', seconds * 1000, rows, query_template(query), plan)
+
+    def render(self):
+        with self._lock:
+            routes = {key: (list(h.buckets), h.sum, h.count) for key, h in self._routes.items()}
+            responses = dict(self._responses)
+            queries = {template: list(stats) for template, stats in self._queries.items()}
+            slow_queries = self.slow_queries
+
+        lines = [
+            '# HELP inventory_http_requests_total Responses by route and status',
+            '# TYPE inventory_http_requests_total counter',
+        ]
+        for (method, route, status), count in sorted(responses.items()):
+            lines.append(f'inventory_http_requests_total{metric_labels(method=method, route=route, status=status)} {count}')
+        lines += [
+            '# HELP inventory_http_request_duration_seconds Time spent in the view until the response starts',
+            '# TYPE inventory_http_request_duration_seconds histogram',
+        ]
+        for (method, route), (buckets, total, count) in sorted(routes.items()):
+            histogram = Histogram()
+            histogram.buckets, histogram.sum, histogram.count = buckets, total, count
+            lines.extend(histogram.render('inventory_http_request_duration_seconds', method=method, route=route))
+
+        for name, index, kind, help_text in (
+            ('inventory_db_queries_total', 0, 'counter', 'Executions per query template'),
+            ('inventory_db_query_seconds_total', 1, 'counter', 'Time spent per query template'),
+            ('inventory_db_query_max_seconds', 2, 'gauge', 'Slowest execution per query template'),
+            ('inventory_db_query_rows_total', 3, 'counter', 'Rows returned or changed per query template'),
+        ):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+            for template, stats in sorted(queries.items()):
+                lines.append(f'{name}{metric_labels(query=template)} {stats[index]}')
+        lines += [
+            '# HELP inventory_db_slow_queries_total Queries slower than the slow query threshold',
+            '# TYPE inventory_db_slow_queries_total counter',
+            f'inventory_db_slow_queries_total {slow_queries}',
+        ]
+        return lines
+
+metrics = Metrics(METRICS_ENABLED, SLOW_QUERY_MS)
+
+@app.before_request
+def start_request_timer():
+    if metrics.enabled:
+        g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+        metrics.observe_request(request.method, route, response.status_code, time.perf_counter() - started)
+    return response
+
+def execute_query(query, params=(), one=False, commit=False, raw=False):
+    """Execute a query and return results.
+
+    Inside transaction() the shared connection is used and commit=True is
+    deferred to the end of the block. raw=True returns (columns, tuples)
+    instead of a list of dicts.
+    """
+    tx_conn = getattr(_tx_state, 'conn', None)
+    conn = tx_conn if tx_conn is not None else db_pool.acquire()
     cursor = conn.cursor()
+    started = time.perf_counter() if metrics.enabled else None
     
     try:
         cursor.execute(query, params)
         
         if commit:
-            conn.commit()
+            if tx_conn is None:
+                conn.commit()
             last_id = cursor.lastrowid
             result = {"lastrowid": last_id} if last_id else {}
+            rows = max(cursor.rowcount, 0)
         else:
+            columns = [col[0] for col in cursor.description]
             if one:
-                result = cursor.fetchone()
+                row = cursor.fetchone()
+                result = dict(zip(columns, row)) if row is not None else None
+                rows = int(row is not None)
+            elif raw:
+                result = (columns, cursor.fetchall())
+                rows = len(result[1])
             else:
-                result = cursor.fetchall()
+                result = rows_to_dicts(columns, cursor.fetchall())
+                rows = len(result)
+        if started is not None:
+            metrics.observe_query(conn, query, params, time.perf_counter() - started, rows)
     except Exception as e:
-        conn.rollback() if commit else None
+        conn.rollback() if commit and tx_conn is None else None
         raise e
     finally:
         cursor.close()
-        conn.close()
+        if tx_conn is None:
+            db_pool.release(conn)
         
     return result
 
+# In-process read-through cache for product and location rows
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 10000))
+CACHE_TTL_SECONDS = float(os.environ.get('CACHE_TTL_SECONDS', 60))
+
+class LookupCache:
+    """Thread-safe LRU of rows keyed by ID; entries expire after ttl seconds"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    def get(self, key):
+        """Return the cached row, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return value
+                del self._entries[key]
+                self._stats['expirations'] += 1
+            self._stats['misses'] += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, size=len(self._entries), max_entries=self.maxsize, ttl=self.ttl)
+
+product_cache = LookupCache(CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS)
+location_cache = LookupCache(CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS)
+
+PRODUCT_ROW_QUERY = '''
+SELECT product_id, name, description, total_quantity, location_id
+FROM product
+WHERE product_id = ?
+'''
+LOCATION_ROW_QUERY = '''
+SELECT location_id, name, address
+FROM location
+WHERE location_id = ?
+'''
+AVAILABLE_STOCK_QUERY = 'SELECT qty FROM stock_balance WHERE product_id = ? AND location_id = ?'
+
+def get_product_row(product_id):
+    """Product row by ID through product_cache (None if it does not exist)"""
+    row = product_cache.get(product_id)
+    if row is None:
+        row = execute_query(PRODUCT_ROW_QUERY, (product_id,), one=True)
+        if row is not None:
+            product_cache.set(product_id, row)
+    return row
+
+def get_location_row(location_id):
+    """Location row by ID through location_cache (None if it does not exist)"""
+    row = location_cache.get(location_id)
+    if row is None:
+        row = execute_query(LOCATION_ROW_QUERY, (location_id,), one=True)
+        if row is not None:
+            location_cache.set(location_id, row)
+    return row
+
+def existing_ids(cache, ids, query):
+    """Subset of ids that exist, asking the database only for cache misses"""
+    found = set()
+    missing = []
+    for id_ in ids:
+        if cache.get(id_) is not None:
+            found.add(id_)
+        else:
+            missing.append(id_)
+    key_column = 'product_id' if cache is product_cache else 'location_id'
+    for row in query_in(query, missing):
+        cache.set(row[key_column], row)
+        found.add(row[key_column])
+    return found
+
+def invalidate_cached(cache, key):
+    """Drop key now and again after commit, so no reader re-caches the old row"""
+    cache.invalidate(key)
+    after_commit(lambda: cache.invalidate(key))
+
+# Serialized list/report bodies keyed by (ETag, URL)
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 256))
+RESPONSE_CACHE_TTL_SECONDS = float(os.environ.get('RESPONSE_CACHE_TTL_SECONDS', 300))
+response_cache = LookupCache(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL_SECONDS)
+# Bodies tagged with an older version can no longer be hit; free them after local writes
+data_version.subscribe(lambda _: response_cache.clear())
+
+def current_etag():
+    """ETag for the current database contents (see CHANGE_VERSION_SCHEMA)"""
+    row = execute_query(CHANGE_VERSION_QUERY, one=True)
+    return f"{row['epoch']}-{row['version']}"
+
+def conditional(view):
+    """ETag/If-None-Match support for a read-only view.
+
+    The ETag is the database's change version, so a 304 costs one
+    primary-key read, and a 200 body is reused until the next write by any
+    process.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        # Read the version first: a write racing with the view can only make
+        # the body newer than its tag, never older.
+        etag = current_etag()
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            key = (etag, request.full_path)
+            cached = response_cache.get(key)
+            if cached is not None:
+                body, headers = cached
+                response = Response(body, headers=headers)
+            else:
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                response_cache.set(key, (response.get_data(), list(response.headers.items())))
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return wrapper
+
+def execute_many(query, seq_of_params):
+    """Execute one statement for every parameter tuple and return the row count"""
+    tx_conn = getattr(_tx_state, 'conn', None)
+    conn = tx_conn if tx_conn is not None else db_pool.acquire()
+    cursor = conn.cursor()
+
+    started = time.perf_counter() if metrics.enabled else None
+    if started is not None and not isinstance(seq_of_params, (list, tuple)):
+        seq_of_params = list(seq_of_params)
+
+    try:
+        cursor.executemany(query, seq_of_params)
+        if tx_conn is None:
+            conn.commit()
+        result = cursor.rowcount
+        if started is not None:
+            # The first parameter set stands in for all of them in a slow query plan
+            first = seq_of_params[0] if seq_of_params else ()
+            metrics.observe_query(conn, query, first, time.perf_counter() - started, max(result, 0))
+    except Exception as e:
+        conn.rollback() if tx_conn is None else None
+        raise e
+    finally:
+        cursor.close()
+        if tx_conn is None:
+            db_pool.release(conn)
+
+    return result
+
+# Stay well below SQLite's bound-parameter limit when expanding IN lists
+IN_CHUNK_SIZE = 500
+
+def query_in(query, values, extra_params=()):
+    """Run a query containing an '{in}' placeholder once per chunk of values"""
+    values = list(values)
+    results = []
+    for start in range(0, len(values), IN_CHUNK_SIZE):
+        chunk = values[start:start + IN_CHUNK_SIZE]
+        placeholders = ', '.join('?' * len(chunk))
+        results.extend(execute_query(query.format(placeholders), tuple(chunk) + tuple(extra_params)))
+    return results
+
+# stock_balance holds the running in - out per (product, location). The triggers
+# keep it in step with product_movement inside the same transaction as the write,
+# and stamp every touched row with the bumped stock_version so /report can
+# return only what changed since a version the client already holds.
+STOCK_BALANCE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS stock_balance (
+    product_id TEXT NOT NULL,
+    location_id TEXT NOT NULL,
+    qty INTEGER NOT NULL DEFAULT 0,
+    version INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (product_id, location_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_stock_balance_location ON stock_balance (location_id);
+CREATE INDEX IF NOT EXISTS idx_stock_balance_version ON stock_balance (version);
+
+CREATE TABLE IF NOT EXISTS stock_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO stock_version (id, version) VALUES (1, 0);
+
+DROP TRIGGER IF EXISTS trg_movement_insert_balance;
+CREATE TRIGGER trg_movement_insert_balance
+AFTER INSERT ON product_movement
+BEGIN
+    UPDATE stock_version SET version = version + 1;
+    INSERT INTO stock_balance (product_id, location_id, qty, version)
+    SELECT NEW.product_id, NEW.to_location, NEW.qty, (SELECT version FROM stock_version)
+    WHERE NEW.to_location IS NOT NULL
+    ON CONFLICT (product_id, location_id) DO UPDATE SET qty = qty + excluded.qty, version = excluded.version;
+    INSERT INTO stock_balance (product_id, location_id, qty, version)
+    SELECT NEW.product_id, NEW.from_location, -NEW.qty, (SELECT version FROM stock_version)
+    WHERE NEW.from_location IS NOT NULL
+    ON CONFLICT (product_id, location_id) DO UPDATE SET qty = qty + excluded.qty, version = excluded.version;
+END;
+
+DROP TRIGGER IF EXISTS trg_movement_delete_balance;
+CREATE TRIGGER trg_movement_delete_balance
+AFTER DELETE ON product_movement
+BEGIN
+    UPDATE stock_version SET version = version + 1;
+    UPDATE stock_balance SET qty = qty - OLD.qty, version = (SELECT version FROM stock_version)
+    WHERE OLD.to_location IS NOT NULL AND product_id = OLD.product_id AND location_id = OLD.to_location;
+    UPDATE stock_balance SET qty = qty + OLD.qty, version = (SELECT version FROM stock_version)
+    WHERE OLD.from_location IS NOT NULL AND product_id = OLD.product_id AND location_id = OLD.from_location;
+END;
+
+DROP TRIGGER IF EXISTS trg_movement_update_balance;
+CREATE TRIGGER trg_movement_update_balance
+AFTER UPDATE OF product_id, from_location, to_location, qty ON product_movement
+BEGIN
+    UPDATE stock_version SET version = version + 1;
+    UPDATE stock_balance SET qty = qty - OLD.qty, version = (SELECT version FROM stock_version)
+    WHERE OLD.to_location IS NOT NULL AND product_id = OLD.product_id AND location_id = OLD.to_location;
+    UPDATE stock_balance SET qty = qty + OLD.qty, version = (SELECT version FROM stock_version)
+    WHERE OLD.from_location IS NOT NULL AND product_id = OLD.product_id AND location_id = OLD.from_location;
+    INSERT INTO stock_balance (product_id, location_id, qty, version)
+    SELECT NEW.product_id, NEW.to_location, NEW.qty, (SELECT version FROM stock_version)
+    WHERE NEW.to_location IS NOT NULL
+    ON CONFLICT (product_id, location_id) DO UPDATE SET qty = qty + excluded.qty, version = excluded.version;
+    INSERT INTO stock_balance (product_id, location_id, qty, version)
+    SELECT NEW.product_id, NEW.from_location, -NEW.qty, (SELECT version FROM stock_version)
+    WHERE NEW.from_location IS NOT NULL
+    ON CONFLICT (product_id, location_id) DO UPDATE SET qty = qty + excluded.qty, version = excluded.version;
+END;
+'''
+
+# Zero every row first (instead of deleting) so clients syncing with
+# ?since_version= also see balances that the rebuild cleared.
+STOCK_BALANCE_REBUILD_QUERY = '''
+INSERT INTO stock_balance (product_id, location_id, qty, version)
+SELECT product_id, location_id, SUM(qty), (SELECT version FROM stock_version)
+FROM (
+    SELECT product_id, to_location as location_id, qty
+    FROM product_movement WHERE to_location IS NOT NULL
+    UNION ALL
+    SELECT product_id, from_location as location_id, -qty
+    FROM product_movement WHERE from_location IS NOT NULL
+)
+WHERE true
+GROUP BY product_id, location_id
+ON CONFLICT (product_id, location_id) DO UPDATE SET qty = excluded.qty, version = excluded.version
+'''
+
+# Indexes backing the keyset-paginated, filtered list endpoints
+LIST_INDEXES = '''
+CREATE INDEX IF NOT EXISTS idx_product_location ON product (location_id, product_id);
+CREATE INDEX IF NOT EXISTS idx_movement_timestamp ON product_movement (timestamp, movement_id);
+CREATE INDEX IF NOT EXISTS idx_movement_product_ts ON product_movement (product_id, timestamp, movement_id);
+CREATE INDEX IF NOT EXISTS idx_movement_from_ts ON product_movement (from_location, timestamp, movement_id);
+CREATE INDEX IF NOT EXISTS idx_movement_to_ts ON product_movement (to_location, timestamp, movement_id);
+'''
+
+# Covering indexes so per-(product, location) ledger sums and the GROUP BY
+# aggregations (rebuild, verify, historical replay) never touch table rows
+LEDGER_INDEXES = '''
+CREATE INDEX IF NOT EXISTS idx_movement_product_to_qty ON product_movement (product_id, to_location, qty);
+CREATE INDEX IF NOT EXISTS idx_movement_product_from_qty ON product_movement (product_id, from_location, qty);
+'''
+
+# Point-in-time balances. A checkpoint stores every non-zero balance as of a
+# timestamp; "as of T" loads the nearest checkpoint at or before T and replays
+# only the movements after it. Editing or back-dating a movement at or before
+# a checkpoint drops that checkpoint and every later one.
+CHECKPOINT_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS stock_checkpoint (
+    checkpoint_id INTEGER PRIMARY KEY,
+    as_of TEXT NOT NULL UNIQUE,
+    created_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS stock_checkpoint_balance (
+    checkpoint_id INTEGER NOT NULL,
+    product_id TEXT NOT NULL,
+    location_id TEXT NOT NULL,
+    qty INTEGER NOT NULL,
+    PRIMARY KEY (checkpoint_id, product_id, location_id)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS trg_movement_insert_checkpoint
+AFTER INSERT ON product_movement
+WHEN NEW.timestamp <= (SELECT MAX(as_of) FROM stock_checkpoint)
+BEGIN
+    DELETE FROM stock_checkpoint_balance WHERE checkpoint_id IN (
+        SELECT checkpoint_id FROM stock_checkpoint WHERE as_of >= NEW.timestamp);
+    DELETE FROM stock_checkpoint WHERE as_of >= NEW.timestamp;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_movement_delete_checkpoint
+AFTER DELETE ON product_movement
+WHEN OLD.timestamp <= (SELECT MAX(as_of) FROM stock_checkpoint)
+BEGIN
+    DELETE FROM stock_checkpoint_balance WHERE checkpoint_id IN (
+        SELECT checkpoint_id FROM stock_checkpoint WHERE as_of >= OLD.timestamp);
+    DELETE FROM stock_checkpoint WHERE as_of >= OLD.timestamp;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_movement_update_checkpoint
+AFTER UPDATE ON product_movement
+WHEN MIN(OLD.timestamp, NEW.timestamp) <= (SELECT MAX(as_of) FROM stock_checkpoint)
+BEGIN
+    DELETE FROM stock_checkpoint_balance WHERE checkpoint_id IN (
+        SELECT checkpoint_id FROM stock_checkpoint WHERE as_of >= MIN(OLD.timestamp, NEW.timestamp));
+    DELETE FROM stock_checkpoint WHERE as_of >= MIN(OLD.timestamp, NEW.timestamp);
+END;
+'''
+
+# Closed months are moved out of product_movement into movement_archive. What
+# stays behind starts with one OPEN- movement per (product, location) carrying
+# the balance at the cutoff, so balances and recent reads only touch the hot
+# table. movement_history is the full ledger, without the opening movements.
+ARCHIVE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS movement_archive (
+    movement_id TEXT PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    from_location TEXT,
+    to_location TEXT,
+    product_id TEXT NOT NULL,
+    qty INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_archive_timestamp ON movement_archive (timestamp, movement_id);
+CREATE INDEX IF NOT EXISTS idx_archive_product_ts ON movement_archive (product_id, timestamp, movement_id);
+CREATE INDEX IF NOT EXISTS idx_archive_from_ts ON movement_archive (from_location, timestamp, movement_id);
+CREATE INDEX IF NOT EXISTS idx_archive_to_ts ON movement_archive (to_location, timestamp, movement_id);
+
+CREATE TABLE IF NOT EXISTS archive_period (
+    period TEXT PRIMARY KEY,
+    cutoff TEXT NOT NULL,
+    movements INTEGER NOT NULL,
+    archived_at TEXT NOT NULL
+);
+
+CREATE VIEW IF NOT EXISTS movement_history AS
+SELECT movement_id, timestamp, from_location, to_location, product_id, qty FROM movement_archive
+UNION ALL
+SELECT movement_id, timestamp, from_location, to_location, product_id, qty FROM product_movement
+WHERE movement_id NOT LIKE 'OPEN-%';
+'''
+
+# Integer-keyed ledger storage. Product and location IDs are stored once in
+# ledger_product / ledger_location and referenced by integer key, and the
+# secondary indexes carry (key, timestamp) plus the rowid instead of repeated
+# TEXT IDs. The dictionaries only grow: movements keep their IDs after a
+# product or location row is deleted. product_movement is a view with the
+# original columns, so every query and the REST API keep using string IDs.
+MOVEMENT_LEDGER_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS ledger_product (
+    product_key INTEGER PRIMARY KEY,
+    product_id TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS ledger_location (
+    location_key INTEGER PRIMARY KEY,
+    location_id TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS movement_ledger (
+    movement_key INTEGER PRIMARY KEY,
+    movement_id TEXT NOT NULL UNIQUE,
+    timestamp TEXT,
+    product_key INTEGER NOT NULL REFERENCES ledger_product (product_key),
+    from_key INTEGER REFERENCES ledger_location (location_key),
+    to_key INTEGER REFERENCES ledger_location (location_key),
+    qty INTEGER NOT NULL
+);
+'''
+
+# The time indexes end in movement_id, the keyset tiebreaker of the list
+# endpoints, so ORDER BY timestamp, movement_id needs no sort. The qty
+# indexes also carry the other location key, which the product_movement
+# view joins on, so per-(product, location) sums through the view stay
+# index-only.
+MOVEMENT_LEDGER_INDEX_COLUMNS = (
+    ('idx_ledger_timestamp', ('timestamp', 'movement_id')),
+    ('idx_ledger_product_ts', ('product_key', 'timestamp', 'movement_id')),
+    ('idx_ledger_from_ts', ('from_key', 'timestamp', 'movement_id')),
+    ('idx_ledger_to_ts', ('to_key', 'timestamp', 'movement_id')),
+    ('idx_ledger_product_to_qty', ('product_key', 'to_key', 'qty', 'from_key')),
+    ('idx_ledger_product_from_qty', ('product_key', 'from_key', 'qty', 'to_key')),
+)
+MOVEMENT_LEDGER_INDEXES = ''.join(
+    f'CREATE INDEX IF NOT EXISTS {name} ON movement_ledger ({", ".join(columns)});\n'
+    for name, columns in MOVEMENT_LEDGER_INDEX_COLUMNS
+)
+
+MOVEMENT_LEDGER_VIEW = '''
+CREATE VIEW IF NOT EXISTS product_movement AS
+SELECT m.movement_id, m.timestamp, f.location_id AS from_location, t.location_id AS to_location,
+       p.product_id, m.qty
+FROM movement_ledger m
+LEFT JOIN ledger_product p ON p.product_key = m.product_key
+LEFT JOIN ledger_location f ON f.location_key = m.from_key
+LEFT JOIN ledger_location t ON t.location_key = m.to_key;
+
+CREATE TRIGGER IF NOT EXISTS trg_product_movement_insert
+INSTEAD OF INSERT ON product_movement
+BEGIN
+    INSERT OR IGNORE INTO ledger_product (product_id) VALUES (NEW.product_id);
+    INSERT OR IGNORE INTO ledger_location (location_id)
+    SELECT NEW.from_location WHERE NEW.from_location IS NOT NULL
+    UNION ALL SELECT NEW.to_location WHERE NEW.to_location IS NOT NULL;
+    INSERT INTO movement_ledger (movement_id, timestamp, product_key, from_key, to_key, qty)
+    VALUES (
+        NEW.movement_id, COALESCE(NEW.timestamp, strftime('%Y-%m-%dT%H:%M:%f', 'now')),
+        (SELECT product_key FROM ledger_product WHERE product_id = NEW.product_id),
+        (SELECT location_key FROM ledger_location WHERE location_id = NEW.from_location),
+        (SELECT location_key FROM ledger_location WHERE location_id = NEW.to_location),
+        NEW.qty);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_product_movement_update
+INSTEAD OF UPDATE ON product_movement
+BEGIN
+    INSERT OR IGNORE INTO ledger_product (product_id) VALUES (NEW.product_id);
+    INSERT OR IGNORE INTO ledger_location (location_id)
+    SELECT NEW.from_location WHERE NEW.from_location IS NOT NULL
+    UNION ALL SELECT NEW.to_location WHERE NEW.to_location IS NOT NULL;
+    UPDATE movement_ledger SET
+        movement_id = NEW.movement_id,
+        timestamp = NEW.timestamp,
+        product_key = (SELECT product_key FROM ledger_product WHERE product_id = NEW.product_id),
+        from_key = (SELECT location_key FROM ledger_location WHERE location_id = NEW.from_location),
+        to_key = (SELECT location_key FROM ledger_location WHERE location_id = NEW.to_location),
+        qty = NEW.qty
+    WHERE movement_id = OLD.movement_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_product_movement_delete
+INSTEAD OF DELETE ON product_movement
+BEGIN
+    DELETE FROM movement_ledger WHERE movement_id = OLD.movement_id;
+END;
+'''
+
+# stock_balance and checkpoint maintenance (as in STOCK_BALANCE_SCHEMA and
+# CHECKPOINT_SCHEMA) moved onto movement_ledger, resolving keys back to IDs
+MOVEMENT_LEDGER_TRIGGERS = '''
+DROP TRIGGER IF EXISTS trg_movement_insert_balance;
+CREATE TRIGGER trg_movement_insert_balance
+AFTER INSERT ON movement_ledger
+BEGIN
+    UPDATE stock_version SET version = version + 1;
+    INSERT INTO stock_balance (product_id, location_id, qty, version)
+    SELECT p.product_id, l.location_id, NEW.qty, (SELECT version FROM stock_version)
+    FROM ledger_product p, ledger_location l
+    WHERE p.product_key = NEW.product_key AND l.location_key = NEW.to_key
+    ON CONFLICT (product_id, location_id) DO UPDATE SET qty = qty + excluded.qty, version = excluded.version;
+    INSERT INTO stock_balance (product_id, location_id, qty, version)
+    SELECT p.product_id, l.location_id, -NEW.qty, (SELECT version FROM stock_version)
+    FROM ledger_product p, ledger_location l
+    WHERE p.product_key = NEW.product_key AND l.location_key = NEW.from_key
+    ON CONFLICT (product_id, location_id) DO UPDATE SET qty = qty + excluded.qty, version = excluded.version;
+END;
+
+DROP TRIGGER IF EXISTS trg_movement_delete_balance;
+CREATE TRIGGER trg_movement_delete_balance
+AFTER DELETE ON movement_ledger
+BEGIN
+    UPDATE stock_version SET version = version + 1;
+    UPDATE stock_balance SET qty = qty - OLD.qty, version = (SELECT version FROM stock_version)
+    WHERE OLD.to_key IS NOT NULL
+      AND product_id = (SELECT product_id FROM ledger_product WHERE product_key = OLD.product_key)
+      AND location_id = (SELECT location_id FROM ledger_location WHERE location_key = OLD.to_key);
+    UPDATE stock_balance SET qty = qty + OLD.qty, version = (SELECT version FROM stock_version)
+    WHERE OLD.from_key IS NOT NULL
+      AND product_id = (SELECT product_id FROM ledger_product WHERE product_key = OLD.product_key)
+      AND location_id = (SELECT location_id FROM ledger_location WHERE location_key = OLD.from_key);
+END;
+
+DROP TRIGGER IF EXISTS trg_movement_update_balance;
+CREATE TRIGGER trg_movement_update_balance
+AFTER UPDATE OF product_key, from_key, to_key, qty ON movement_ledger
+BEGIN
+    UPDATE stock_version SET version = version + 1;
+    UPDATE stock_balance SET qty = qty - OLD.qty, version = (SELECT version FROM stock_version)
+    WHERE OLD.to_key IS NOT NULL
+      AND product_id = (SELECT product_id FROM ledger_product WHERE product_key = OLD.product_key)
+      AND location_id = (SELECT location_id FROM ledger_location WHERE location_key = OLD.to_key);
+    UPDATE stock_balance SET qty = qty + OLD.qty, version = (SELECT version FROM stock_version)
+    WHERE OLD.from_key IS NOT NULL
+      AND product_id = (SELECT product_id FROM ledger_product WHERE product_key = OLD.product_key)
+      AND location_id = (SELECT location_id FROM ledger_location WHERE location_key = OLD.from_key);
+    INSERT INTO stock_balance (product_id, location_id, qty, version)
+    SELECT p.product_id, l.location_id, NEW.qty, (SELECT version FROM stock_version)
+    FROM ledger_product p, ledger_location l
+    WHERE p.product_key = NEW.product_key AND l.location_key = NEW.to_key
+    ON CONFLICT (product_id, location_id) DO UPDATE SET qty = qty + excluded.qty, version = excluded.version;
+    INSERT INTO stock_balance (product_id, location_id, qty, version)
+    SELECT p.product_id, l.location_id, -NEW.qty, (SELECT version FROM stock_version)
+    FROM ledger_product p, ledger_location l
+    WHERE p.product_key = NEW.product_key AND l.location_key = NEW.from_key
+    ON CONFLICT (product_id, location_id) DO UPDATE SET qty = qty + excluded.qty, version = excluded.version;
+END;
+
+DROP TRIGGER IF EXISTS trg_movement_insert_checkpoint;
+CREATE TRIGGER trg_movement_insert_checkpoint
+AFTER INSERT ON movement_ledger
+WHEN NEW.timestamp <= (SELECT MAX(as_of) FROM stock_checkpoint)
+BEGIN
+    DELETE FROM stock_checkpoint_balance WHERE checkpoint_id IN (
+        SELECT checkpoint_id FROM stock_checkpoint WHERE as_of >= NEW.timestamp);
+    DELETE FROM stock_checkpoint WHERE as_of >= NEW.timestamp;
+END;
+
+DROP TRIGGER IF EXISTS trg_movement_delete_checkpoint;
+CREATE TRIGGER trg_movement_delete_checkpoint
+AFTER DELETE ON movement_ledger
+WHEN OLD.timestamp <= (SELECT MAX(as_of) FROM stock_checkpoint)
+BEGIN
+    DELETE FROM stock_checkpoint_balance WHERE checkpoint_id IN (
+        SELECT checkpoint_id FROM stock_checkpoint WHERE as_of >= OLD.timestamp);
+    DELETE FROM stock_checkpoint WHERE as_of >= OLD.timestamp;
+END;
+
+DROP TRIGGER IF EXISTS trg_movement_update_checkpoint;
+CREATE TRIGGER trg_movement_update_checkpoint
+AFTER UPDATE ON movement_ledger
+WHEN MIN(OLD.timestamp, NEW.timestamp) <= (SELECT MAX(as_of) FROM stock_checkpoint)
+BEGIN
+    DELETE FROM stock_checkpoint_balance WHERE checkpoint_id IN (
+        SELECT checkpoint_id FROM stock_checkpoint WHERE as_of >= MIN(OLD.timestamp, NEW.timestamp));
+    DELETE FROM stock_checkpoint WHERE as_of >= MIN(OLD.timestamp, NEW.timestamp);
+END;
+'''
+
+# Per-(product_key, location_key) ledger sums. Each side is grouped straight
+# off its covering (product_key, *_key, qty) index, so neither needs a sort
+LEDGER_KEY_BALANCES = '''
+SELECT product_key, location_key, SUM(qty) as qty
+FROM (
+    SELECT product_key, to_key as location_key, SUM(qty) as qty
+    FROM movement_ledger WHERE to_key IS NOT NULL
+    GROUP BY product_key, to_key
+    UNION ALL
+    SELECT product_key, from_key, -SUM(qty)
+    FROM movement_ledger WHERE from_key IS NOT NULL
+    GROUP BY product_key, from_key
+)
+GROUP BY product_key, location_key
+'''
+
+# stock_balance rebuild aggregated on integer keys; IDs are joined in once per group
+LEDGER_BALANCE_REBUILD_QUERY = f'''
+INSERT INTO stock_balance (product_id, location_id, qty, version)
+SELECT p.product_id, l.location_id, b.qty, (SELECT version FROM stock_version)
+FROM ({LEDGER_KEY_BALANCES}) b
+JOIN ledger_product p ON p.product_key = b.product_key
+JOIN ledger_location l ON l.location_key = b.location_key
+WHERE true
+ON CONFLICT (product_id, location_id) DO UPDATE SET qty = excluded.qty, version = excluded.version
+'''
+
+# Reorder points per (product, location) and the balances currently at or
+# below them. Triggers on stock_balance re-check only the balances a write
+# touched (one primary-key lookup each), so alerting costs scale with the
+# movement rate rather than with products x locations.
+ALERT_NOW = "strftime('%Y-%m-%dT%H:%M:%f', 'now')"
+
+ALERT_SCHEMA = f'''
+CREATE TABLE IF NOT EXISTS reorder_threshold (
+    product_id TEXT NOT NULL,
+    location_id TEXT NOT NULL,
+    reorder_point INTEGER NOT NULL,
+    PRIMARY KEY (product_id, location_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_reorder_threshold_location ON reorder_threshold (location_id);
+
+CREATE TABLE IF NOT EXISTS stock_alert (
+    product_id TEXT NOT NULL,
+    location_id TEXT NOT NULL,
+    qty INTEGER NOT NULL,
+    reorder_point INTEGER NOT NULL,
+    since TEXT NOT NULL,
+    PRIMARY KEY (product_id, location_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_stock_alert_location ON stock_alert (location_id);
+
+DROP TRIGGER IF EXISTS trg_balance_insert_alert;
+CREATE TRIGGER trg_balance_insert_alert
+AFTER INSERT ON stock_balance
+BEGIN
+    INSERT INTO stock_alert (product_id, location_id, qty, reorder_point, since)
+    SELECT product_id, location_id, NEW.qty, reorder_point, {ALERT_NOW}
+    FROM reorder_threshold
+    WHERE product_id = NEW.product_id AND location_id = NEW.location_id AND NEW.qty <= reorder_point
+    ON CONFLICT (product_id, location_id) DO UPDATE SET qty = excluded.qty;
+    -- A threshold set before the balance existed alerted at qty 0
+    DELETE FROM stock_alert
+    WHERE product_id = NEW.product_id AND location_id = NEW.location_id AND NEW.qty > reorder_point;
+END;
+
+DROP TRIGGER IF EXISTS trg_balance_update_alert;
+CREATE TRIGGER trg_balance_update_alert
+AFTER UPDATE OF qty ON stock_balance
+WHEN NEW.qty <> OLD.qty
+BEGIN
+    INSERT INTO stock_alert (product_id, location_id, qty, reorder_point, since)
+    SELECT product_id, location_id, NEW.qty, reorder_point, {ALERT_NOW}
+    FROM reorder_threshold
+    WHERE product_id = NEW.product_id AND location_id = NEW.location_id AND NEW.qty <= reorder_point
+    ON CONFLICT (product_id, location_id) DO UPDATE SET qty = excluded.qty;
+    DELETE FROM stock_alert
+    WHERE product_id = NEW.product_id AND location_id = NEW.location_id AND NEW.qty > reorder_point;
+END;
+
+DROP TRIGGER IF EXISTS trg_threshold_insert_alert;
+CREATE TRIGGER trg_threshold_insert_alert
+AFTER INSERT ON reorder_threshold
+BEGIN
+    INSERT INTO stock_alert (product_id, location_id, qty, reorder_point, since)
+    SELECT NEW.product_id, NEW.location_id, b.qty, NEW.reorder_point, {ALERT_NOW}
+    FROM (SELECT COALESCE((SELECT qty FROM stock_balance
+                           WHERE product_id = NEW.product_id AND location_id = NEW.location_id), 0) AS qty) b
+    WHERE b.qty <= NEW.reorder_point;
+END;
+
+DROP TRIGGER IF EXISTS trg_threshold_update_alert;
+CREATE TRIGGER trg_threshold_update_alert
+AFTER UPDATE OF reorder_point ON reorder_threshold
+BEGIN
+    INSERT INTO stock_alert (product_id, location_id, qty, reorder_point, since)
+    SELECT NEW.product_id, NEW.location_id, b.qty, NEW.reorder_point, {ALERT_NOW}
+    FROM (SELECT COALESCE((SELECT qty FROM stock_balance
+                           WHERE product_id = NEW.product_id AND location_id = NEW.location_id), 0) AS qty) b
+    WHERE b.qty <= NEW.reorder_point
+    ON CONFLICT (product_id, location_id) DO UPDATE SET reorder_point = excluded.reorder_point;
+    DELETE FROM stock_alert
+    WHERE product_id = NEW.product_id AND location_id = NEW.location_id AND qty > NEW.reorder_point;
+END;
+
+DROP TRIGGER IF EXISTS trg_threshold_delete_alert;
+CREATE TRIGGER trg_threshold_delete_alert
+AFTER DELETE ON reorder_threshold
+BEGIN
+    DELETE FROM stock_alert WHERE product_id = OLD.product_id AND location_id = OLD.location_id;
+END;
+
+DROP TRIGGER IF EXISTS trg_product_delete_threshold;
+CREATE TRIGGER trg_product_delete_threshold
+AFTER DELETE ON product
+BEGIN
+    DELETE FROM reorder_threshold WHERE product_id = OLD.product_id;
+END;
+
+DROP TRIGGER IF EXISTS trg_location_delete_threshold;
+CREATE TRIGGER trg_location_delete_threshold
+AFTER DELETE ON location
+BEGIN
+    DELETE FROM reorder_threshold WHERE location_id = OLD.location_id;
+END;
+'''
+
+# Database-wide change counter behind the ETags of the @conditional views.
+# Triggers bump it on every row written to the tables those views read, so
+# writes from other worker processes and from the CLI commands count too.
+# epoch tells a recreated database apart from an older file at the same version.
+CHANGE_VERSION_TABLES = ('product', 'location', 'movement_ledger', 'stock_balance', 'reorder_threshold')
+CHANGE_VERSION_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS change_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL,
+    epoch TEXT NOT NULL
+);
+INSERT OR IGNORE INTO change_version (id, version, epoch) VALUES (1, 0, lower(hex(randomblob(4))));
+''' + ''.join(f'''
+DROP TRIGGER IF EXISTS trg_{table}_{event.lower()}_change;
+CREATE TRIGGER trg_{table}_{event.lower()}_change
+AFTER {event} ON {table}
+BEGIN
+    UPDATE change_version SET version = version + 1;
+END;
+''' for table in CHANGE_VERSION_TABLES for event in ('INSERT', 'UPDATE', 'DELETE'))
+
+CHANGE_VERSION_QUERY = 'SELECT epoch, version FROM change_version WHERE id = 1'
+
+# Timestamps are compared as strings, so every stored one has to use the
+# naive UTC 'YYYY-MM-DDTHH:MM:SS' form the API writes. The baseline schema's
+# CURRENT_TIMESTAMP default wrote 'YYYY-MM-DD HH:MM:SS', which sorts before
+# any 'T' timestamp of the same day.
+TIMESTAMP_FORMAT_SCHEMA = '''
+UPDATE movement_ledger SET timestamp = replace(timestamp, ' ', 'T') WHERE timestamp LIKE '____-__-__ %';
+UPDATE movement_archive SET timestamp = replace(timestamp, ' ', 'T') WHERE timestamp LIKE '____-__-__ %';
+DROP TRIGGER IF EXISTS trg_product_movement_insert;
+''' + MOVEMENT_LEDGER_VIEW
+
+# The ledger indexes of migration 6 under their old definitions; same names,
+# so they are dropped and created again
+LEDGER_KEYSET_INDEXES = ''.join(
+    f'DROP INDEX IF EXISTS {name};\n' for name, _ in MOVEMENT_LEDGER_INDEX_COLUMNS
+) + MOVEMENT_LEDGER_INDEXES
+
+# Monthly summary of every (product, location) in the ledger: the number of
+# movements, their net change and the lowest balance reached, relative to
+# the balance at the start of the month. The triggers keep movements and net
+# exact and clear low when the month changes; lowest_balance_since()
+# recomputes a cleared low from that month alone and stores it. Movements
+# without a timestamp are left out, as they are from every time range.
+STOCK_PERIOD_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS stock_period (
+    product_key INTEGER NOT NULL,
+    location_key INTEGER NOT NULL,
+    period TEXT NOT NULL,
+    movements INTEGER NOT NULL,
+    net INTEGER NOT NULL,
+    low INTEGER,
+    low_at TEXT,
+    PRIMARY KEY (product_key, location_key, period)
+) WITHOUT ROWID;
+'''
+
+def _stock_period_add(row):
+    return ''.join(f'''
+    INSERT INTO stock_period (product_key, location_key, period, movements, net)
+    SELECT {row}.product_key, {row}.{side}_key, substr({row}.timestamp, 1, 7), 1, {sign}{row}.qty
+    WHERE {row}.{side}_key IS NOT NULL AND {row}.timestamp IS NOT NULL
+    ON CONFLICT (product_key, location_key, period) DO UPDATE SET
+        movements = movements + 1, net = net + excluded.net, low = NULL, low_at = NULL;''' for side, sign in (('to', ''), ('from', '-')))
+
+def _stock_period_remove(row):
+    return ''.join(f'''
+    UPDATE stock_period SET movements = movements - 1, net = net {sign} {row}.qty, low = NULL, low_at = NULL
+    WHERE product_key = {row}.product_key AND location_key = {row}.{side}_key AND period = substr({row}.timestamp, 1, 7);'''
+    for side, sign in (('to', '-'), ('from', '+'))) + f'''
+    DELETE FROM stock_period
+    WHERE product_key = {row}.product_key AND location_key IN ({row}.to_key, {row}.from_key)
+      AND period = substr({row}.timestamp, 1, 7) AND movements = 0;'''
+
+STOCK_PERIOD_TRIGGERS = f'''
+DROP TRIGGER IF EXISTS trg_movement_insert_period;
+CREATE TRIGGER trg_movement_insert_period
+AFTER INSERT ON movement_ledger
+BEGIN{_stock_period_add('NEW')}
+END;
+
+DROP TRIGGER IF EXISTS trg_movement_delete_period;
+CREATE TRIGGER trg_movement_delete_period
+AFTER DELETE ON movement_ledger
+BEGIN{_stock_period_remove('OLD')}
+END;
+
+DROP TRIGGER IF EXISTS trg_movement_update_period;
+CREATE TRIGGER trg_movement_update_period
+AFTER UPDATE OF timestamp, product_key, from_key, to_key, qty ON movement_ledger
+BEGIN{_stock_period_remove('OLD')}{_stock_period_add('NEW')}
+END;
+'''
+
+# stock_period rows for the months in [?, ?), lows included. balance is the
+# change from the start of the month just after each movement; the lowest
+# one and the earliest time it is reached are taken per month.
+STOCK_PERIOD_REBUILD_QUERY = '''
+INSERT INTO stock_period (product_key, location_key, period, movements, net, low, low_at)
+SELECT product_key, location_key, period, COUNT(*), SUM(qty), MIN(balance), MIN(CASE WHEN lowest = 1 THEN timestamp END)
+FROM (
+    SELECT *, row_number() OVER (
+        PARTITION BY product_key, location_key, period ORDER BY balance, timestamp, movement_id) AS lowest
+    FROM (
+        SELECT *, SUM(qty) OVER (
+            PARTITION BY product_key, location_key, period ORDER BY timestamp, movement_id
+            ROWS UNBOUNDED PRECEDING) AS balance
+        FROM (
+            SELECT product_key, to_key AS location_key, substr(timestamp, 1, 7) AS period, timestamp, movement_id, qty
+            FROM movement_ledger WHERE to_key IS NOT NULL AND timestamp >= ? AND timestamp < ?
+            UNION ALL
+            SELECT product_key, from_key, substr(timestamp, 1, 7), timestamp, movement_id, -qty
+            FROM movement_ledger WHERE from_key IS NOT NULL AND timestamp >= ? AND timestamp < ?
+        )
+    )
+)
+GROUP BY product_key, location_key, period
+'''
+
+OPENING_PREFIX = 'OPEN-'
+# Movement ID prefixes of rows the server writes itself (product INIT,
+# archive opening balances, relocations); clients cannot use them
+RESERVED_MOVEMENT_PREFIXES = ('INIT-', OPENING_PREFIX, 'RELOC-')
+
+# Placeholder in balances_as_of_query() params for the as-of timestamp
+AS_OF = object()
+
+def balances_as_of_query(product_id=None, location_id=None, history=False, floor=None):
+    """Per-(product, location) SUM as of a timestamp: nearest checkpoint + replay.
+
+    Returns (query, params) where the query yields product_id, location_id,
+    qty; pass the params through bind_as_of() before executing. history=True
+    replays movement_history instead of the hot table; floor skips checkpoints
+    older than it (see as_of_options()).
+    """
+    def branch(select, conditions, branch_params):
+        if product_id:
+            conditions = conditions + ['product_id = ?']
+            branch_params = branch_params + [product_id]
+        return f"{select} {where_clause(conditions)}", branch_params
+
+    queries = []
+    params = []
+    location_filter = {'location_id': [], 'to_location': [], 'from_location': []}
+    if location_id:
+        location_filter = {col: [f'{col} = ?'] for col in location_filter}
+
+    q, p = branch(
+        'SELECT product_id, location_id, qty FROM stock_checkpoint_balance',
+        ['checkpoint_id = (SELECT checkpoint_id FROM cp)'] + location_filter['location_id'],
+        [location_id] if location_id else [])
+    queries.append(q)
+    params += p
+    for column, sign in (('to_location', ''), ('from_location', '-')):
+        q, p = branch(
+            f'SELECT product_id, {column} as location_id, {sign}qty as qty '
+            f'FROM {"movement_history" if history else "product_movement"}',
+            [f'{column} IS NOT NULL', "timestamp > COALESCE((SELECT as_of FROM cp), '')", 'timestamp <= ?']
+            + location_filter[column],
+            [AS_OF] + ([location_id] if location_id else []))
+        queries.append(q)
+        params += p
+
+    query = f'''
+    WITH cp AS (
+        SELECT checkpoint_id, as_of FROM stock_checkpoint
+        WHERE as_of <= ? {'AND as_of >= ?' if floor else ''} ORDER BY as_of DESC LIMIT 1
+    )
+    SELECT product_id, location_id, SUM(qty) as qty
+    FROM ({' UNION ALL '.join(queries)})
+    GROUP BY product_id, location_id
+    HAVING SUM(qty) <> 0
+    '''
+    return query, [AS_OF] + ([floor] if floor else []) + params
+
+ARCHIVE_CUTOFF_QUERY = 'SELECT MAX(cutoff) as cutoff FROM archive_period'
+
+def archive_cutoff(conn=None):
+    """Timestamp before which movements live in movement_archive (None if none do)"""
+    if conn is not None:
+        return conn.execute(ARCHIVE_CUTOFF_QUERY).fetchone()[0]
+    return execute_query(ARCHIVE_CUTOFF_QUERY, one=True)['cutoff']
+
+def as_of_options(as_of, cutoff):
+    """balances_as_of_query() arguments for a point in time.
+
+    Before the cutoff the archive has to be replayed. From the cutoff on, the
+    hot table is enough, but only checkpoints taken at or after the cutoff
+    can be combined with its opening movements.
+    """
+    if cutoff is None:
+        return {}
+    if as_of < cutoff:
+        return {'history': True}
+    return {'floor': cutoff}
+
+def parse_as_of(value):
+    """Timestamp argument in the stored form: naive UTC, ISO 8601 with a 'T'.
+
+    Values with a UTC offset are converted to UTC; naive ones are taken as UTC.
+    Raises ValueError for anything fromisoformat() does not accept.
+    """
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment.isoformat()
+
+def bind_as_of(params, as_of):
+    return tuple(as_of if p is AS_OF else p for p in params)
+
+def create_checkpoint(conn, as_of):
+    """Store all balances as of the timestamp; returns the checkpoint_id"""
+    existing = conn.execute('SELECT checkpoint_id FROM stock_checkpoint WHERE as_of = ?', (as_of,)).fetchone()
+    if existing:
+        return existing[0]
+    query, params = balances_as_of_query(**as_of_options(as_of, archive_cutoff(conn)))
+    rows = conn.execute(query, bind_as_of(params, as_of)).fetchall()
+    cursor = conn.execute(
+        'INSERT INTO stock_checkpoint (as_of, created_at) VALUES (?, ?)',
+        (as_of, datetime.utcnow().isoformat()))
+    checkpoint_id = cursor.lastrowid
+    conn.executemany(
+        'INSERT INTO stock_checkpoint_balance (checkpoint_id, product_id, location_id, qty) VALUES (?, ?, ?, ?)',
+        ((checkpoint_id, p, l, q) for p, l, q in rows))
+    return checkpoint_id
+
+def compact_checkpoints(conn, keep_recent):
+    """Keep the newest keep_recent checkpoints and one per month before them"""
+    conn.execute('''
+    DELETE FROM stock_checkpoint
+    WHERE checkpoint_id NOT IN (
+        SELECT checkpoint_id FROM stock_checkpoint ORDER BY as_of DESC LIMIT ?
+    )
+    AND as_of NOT IN (
+        SELECT MAX(as_of) FROM stock_checkpoint GROUP BY substr(as_of, 1, 7)
+    )
+    ''', (keep_recent,))
+    removed = conn.execute('SELECT changes()').fetchone()[0]
+    conn.execute('''
+    DELETE FROM stock_checkpoint_balance
+    WHERE checkpoint_id NOT IN (SELECT checkpoint_id FROM stock_checkpoint)
+    ''')
+    return removed
+
+def rebuild_checkpoints(conn):
+    """Drop all checkpoints and recreate one at the start of every month in the ledger"""
+    conn.execute('DELETE FROM stock_checkpoint_balance')
+    conn.execute('DELETE FROM stock_checkpoint')
+    first, last = conn.execute('SELECT MIN(timestamp), MAX(timestamp) FROM movement_history').fetchone()
+    if first is None:
+        return 0
+    year, month = int(first[:4]), int(first[5:7])
+    created = 0
+    while f'{year:04d}-{month:02d}' <= last[:7]:
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        # Replays from the previous month's checkpoint, so each step is one month of movements
+        create_checkpoint(conn, f'{year:04d}-{month:02d}-01T00:00:00')
+        created += 1
+    return created
+
+def next_month(period):
+    year, month = int(period[:4]), int(period[5:7])
+    year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return f'{year:04d}-{month:02d}'
+
+ARCHIVE_SUSPENDED_TRIGGERS = (
+    'trg_movement_insert_balance', 'trg_movement_delete_balance',
+    'trg_movement_insert_checkpoint', 'trg_movement_delete_checkpoint',
+    'trg_movement_insert_period', 'trg_movement_delete_period',
+)
+
+def archive_month(conn, period):
+    """Move the movements of a closed month (YYYY-MM) into movement_archive.
+
+    Everything left in product_movement before the end of the month, older
+    opening movements included, is folded into new OPEN- movements stamped
+    at the cutoff. Run inside a transaction. Returns the number of
+    movements archived.
+    """
+    cutoff = f'{next_month(period)}-01T00:00:00'
+    # Balances and checkpoints come out unchanged, so their triggers are
+    # dropped for the move and recreated before the caller commits. Only the
+    # cutoff month's stock_period rows change; they are rebuilt after it
+    for trigger in ARCHIVE_SUSPENDED_TRIGGERS:
+        conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    # Opening movement IDs use the ledger keys: product and location IDs may
+    # contain '-', so joining the IDs themselves would not be unambiguous
+    opening = conn.execute('''
+    SELECT p.product_id, l.location_id, b.product_key, b.location_key, SUM(b.qty) as qty
+    FROM (
+        SELECT product_key, to_key as location_key, qty FROM movement_ledger
+        WHERE to_key IS NOT NULL AND timestamp < ?
+        UNION ALL
+        SELECT product_key, from_key as location_key, -qty as qty FROM movement_ledger
+        WHERE from_key IS NOT NULL AND timestamp < ?
+    ) b
+    JOIN ledger_product p ON p.product_key = b.product_key
+    JOIN ledger_location l ON l.location_key = b.location_key
+    GROUP BY b.product_key, b.location_key
+    HAVING SUM(b.qty) <> 0
+    ''', (cutoff, cutoff)).fetchall()
+    archived = conn.execute(f'''
+    INSERT INTO movement_archive (movement_id, timestamp, from_location, to_location, product_id, qty)
+    SELECT movement_id, timestamp, from_location, to_location, product_id, qty
+    FROM product_movement
+    WHERE timestamp < ? AND movement_id NOT LIKE '{OPENING_PREFIX}%'
+    ''', (cutoff,)).rowcount
+    conn.execute('DELETE FROM movement_ledger WHERE timestamp < ?', (cutoff,))
+    conn.executemany('''
+    INSERT INTO product_movement (movement_id, timestamp, from_location, to_location, product_id, qty)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ''', (
+        (f'{OPENING_PREFIX}{cutoff[:10]}-{product_key}-{location_key}', cutoff,
+         location_id if qty < 0 else None, location_id if qty > 0 else None, product_id, abs(qty))
+        for product_id, location_id, product_key, location_key, qty in opening
+    ))
+    conn.execute(
+        'INSERT INTO archive_period (period, cutoff, movements, archived_at) VALUES (?, ?, ?, ?)',
+        (period, cutoff, archived, datetime.utcnow().isoformat()))
+    conn.execute('DELETE FROM stock_period WHERE period < ?', (cutoff[:7],))
+    rebuild_stock_periods(conn, cutoff, f'{next_month(cutoff[:7])}-01T00:00:00')
+    run_script(conn, MOVEMENT_LEDGER_TRIGGERS)
+    run_script(conn, STOCK_PERIOD_TRIGGERS)
+    return archived
+
+def run_script(conn, script):
+    """Execute a multi-statement script inside the caller's transaction.
+
+    Unlike executescript() this does not commit first, so a migration can be
+    applied atomically together with its user_version bump.
+    """
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            conn.execute(statement)
+            statement = ''
+    if statement.strip():
+        conn.execute(statement)
+
+def migrate_stock_balance(conn):
+    # Databases from before schema versioning may already have the table
+    columns = [col[1] for col in conn.execute('PRAGMA table_info(stock_balance)')]
+    if columns and 'version' not in columns:
+        conn.execute('ALTER TABLE stock_balance ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+    run_script(conn, STOCK_BALANCE_SCHEMA)
+    rebuild_stock_balance(conn)
+
+def migrate_movement_ledger(conn):
+    run_script(conn, MOVEMENT_LEDGER_SCHEMA)
+    conn.execute('''
+    INSERT OR IGNORE INTO ledger_product (product_id)
+    SELECT product_id FROM product
+    UNION SELECT product_id FROM product_movement
+    ''')
+    conn.execute('''
+    INSERT OR IGNORE INTO ledger_location (location_id)
+    SELECT location_id FROM location
+    UNION SELECT from_location FROM product_movement WHERE from_location IS NOT NULL
+    UNION SELECT to_location FROM product_movement WHERE to_location IS NOT NULL
+    ''')
+    # Copied in ledger order so movement_key follows time
+    conn.execute('''
+    INSERT INTO movement_ledger (movement_id, timestamp, product_key, from_key, to_key, qty)
+    SELECT m.movement_id, m.timestamp, p.product_key, f.location_key, t.location_key, m.qty
+    FROM product_movement m
+    JOIN ledger_product p ON p.product_id = m.product_id
+    LEFT JOIN ledger_location f ON f.location_id = m.from_location
+    LEFT JOIN ledger_location t ON t.location_id = m.to_location
+    ORDER BY m.timestamp, m.movement_id
+    ''')
+    # Drops the old table's indexes and triggers along with it
+    conn.execute('DROP TABLE product_movement')
+    run_script(conn, MOVEMENT_LEDGER_VIEW)
+    run_script(conn, MOVEMENT_LEDGER_INDEXES)
+    run_script(conn, MOVEMENT_LEDGER_TRIGGERS)
+
+def migrate_stock_period(conn):
+    run_script(conn, STOCK_PERIOD_SCHEMA)
+    run_script(conn, STOCK_PERIOD_TRIGGERS)
+    rebuild_stock_periods(conn)
+
+# Ordered schema migrations; PRAGMA user_version records the last one applied
+MIGRATIONS = (
+    (1, 'stock_balance table and triggers', migrate_stock_balance),
+    (2, 'list endpoint indexes', LIST_INDEXES),
+    (3, 'covering indexes for ledger aggregates', LEDGER_INDEXES),
+    (4, 'stock checkpoints for as-of reports', CHECKPOINT_SCHEMA),
+    (5, 'movement archive and movement_history view', ARCHIVE_SCHEMA),
+    (6, 'integer-keyed movement ledger', migrate_movement_ledger),
+    (7, 'reorder thresholds and stock alerts', ALERT_SCHEMA),
+    (8, 'change version for ETags', CHANGE_VERSION_SCHEMA),
+    (9, 'ISO timestamps in the ledger', TIMESTAMP_FORMAT_SCHEMA),
+    (10, 'keyset and covering ledger indexes', LEDGER_KEYSET_INDEXES),
+    (11, 'monthly stock summary for movement edits', migrate_stock_period),
+)
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def apply_migrations(conn):
+    """Apply pending migrations, each in its own transaction; return those applied"""
+    current = conn.execute('PRAGMA user_version').fetchone()[0]
+    applied = []
+    for version, description, step in MIGRATIONS:
+        if version <= current:
+            continue
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if callable(step):
+                step(conn)
+            else:
+                run_script(conn, step)
+            conn.execute(f'PRAGMA user_version = {version}')
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        applied.append((version, description))
+    return applied
+
 def init_db():
-    """Initialize the database with schema"""
+    """Initialize the database with schema and bring it up to SCHEMA_VERSION.
+
+    Raises RuntimeError for a database at a newer schema version.
+    """
     # Create directory if it doesn't exist
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
     
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, isolation_level=None)
+    # An up-to-date file needs no DDL: one PRAGMA read instead of parsing the schema
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        conn.close()
+        if version > SCHEMA_VERSION:
+            # Written by a newer release; its tables and triggers are unknown here
+            raise RuntimeError(
+                f'{DB_PATH} is at schema version {version}, newer than the {SCHEMA_VERSION} this code supports')
+        return []
     cursor = conn.cursor()
     
     # Create tables
@@ -93,36 +1563,941 @@ def init_db():
     )
     ''')
     
-    conn.commit()
-    conn.close()
+    try:
+        applied = apply_migrations(conn)
+    finally:
+        conn.close()
+    return applied
+
+# DB_PATH whose schema this process has already checked
+_schema_checked = None
+_schema_lock = threading.Lock()
+
+def ensure_schema():
+    """Run init_db() once per process (and per DB_PATH); later calls return at once"""
+    global _schema_checked
+    if _schema_checked == DB_PATH:
+        return
+    with _schema_lock:
+        if _schema_checked != DB_PATH:
+            init_db()
+            _schema_checked = DB_PATH
+
+@app.before_request
+def check_schema():
+    ensure_schema()
+
+# Statements prepared on every connection by warm_up(); the SQL text has to
+# match the callers' exactly for sqlite3's statement cache to reuse them
+WARM_STATEMENTS = (
+    PRODUCT_ROW_QUERY,
+    LOCATION_ROW_QUERY,
+    AVAILABLE_STOCK_QUERY,
+    'SELECT * FROM product_movement WHERE movement_id = ?',
+    'SELECT version FROM stock_version WHERE id = 1',
+    CHANGE_VERSION_QUERY,
+)
+WARM_CONNECTIONS = int(os.environ.get('WARM_CONNECTIONS', 1))
+
+def warm_up(connections=WARM_CONNECTIONS):
+    """Open pooled connections and prepare the hot statements on each.
+
+    The first statement on a connection makes SQLite read and parse the
+    whole schema (tables, views and triggers); doing it here keeps that out
+    of the first request.
+    """
+    conns = [db_pool.acquire() for _ in range(min(connections, db_pool.max_idle))]
+    try:
+        for conn in conns:
+            for query in WARM_STATEMENTS:
+                conn.execute(query, (None,) * query.count('?')).fetchall()
+    finally:
+        for conn in conns:
+            db_pool.release(conn)
+
+def create_app(connections=WARM_CONNECTIONS):
+    """The app with its database ready to serve, e.g. gunicorn 'app:create_app()'.
+
+    Importing this module opens no database and starts no threads; this
+    checks the schema version (migrating only if it is behind, failing if
+    it is ahead) and warms the connection pool. Without it the schema is
+    checked on the first request instead.
+    """
+    ensure_schema()
+    warm_up(connections)
+    return app
+
+# Hot queries and the index each one is expected to use
+# Movements of a product touching one location after a movement and before
+# a time, newest first (see lowest_balance_since())
+MOVEMENTS_AFTER_QUERY = '''
+SELECT m.timestamp, m.qty, m.to_key = l.location_key AS inbound, m.from_key = l.location_key AS outbound
+FROM ledger_product p
+JOIN ledger_location l ON l.location_id = ?
+JOIN movement_ledger m ON m.product_key = p.product_key
+WHERE p.product_id = ?
+  AND (m.timestamp, m.movement_id) > (?, ?) AND m.timestamp < ?
+  AND (m.from_key = l.location_key OR m.to_key = l.location_key)
+ORDER BY m.timestamp DESC, m.movement_id DESC
+'''
+
+# Monthly summaries of a product at one location after a month, newest first
+STOCK_PERIODS_AFTER_QUERY = '''
+SELECT s.period, s.net, s.low, s.low_at
+FROM ledger_product p
+JOIN ledger_location l ON l.location_id = ?
+JOIN stock_period s ON s.product_key = p.product_key AND s.location_key = l.location_key
+WHERE p.product_id = ? AND s.period > ?
+ORDER BY s.period DESC
+'''
+
+QUERY_PLAN_CHECKS = (
+    ('stock availability',
+     AVAILABLE_STOCK_QUERY,
+     'PRIMARY KEY'),
+    ('inbound sum',
+     'SELECT COALESCE(SUM(qty), 0) FROM product_movement WHERE product_id = ? AND to_location = ?',
+     'COVERING INDEX idx_ledger_product_to_qty'),
+    ('outbound sum',
+     'SELECT COALESCE(SUM(qty), 0) FROM product_movement WHERE product_id = ? AND from_location = ?',
+     'COVERING INDEX idx_ledger_product_from_qty'),
+    ('inbound aggregate',
+     'SELECT product_key, to_key, SUM(qty) FROM movement_ledger '
+     'WHERE to_key IS NOT NULL GROUP BY product_key, to_key',
+     'idx_ledger_product_to_qty'),
+    ('outbound aggregate',
+     'SELECT product_key, from_key, SUM(qty) FROM movement_ledger '
+     'WHERE from_key IS NOT NULL GROUP BY product_key, from_key',
+     'idx_ledger_product_from_qty'),
+    ('movements by time',
+     'SELECT movement_id, qty FROM product_movement WHERE timestamp >= ? ORDER BY timestamp, movement_id',
+     'idx_ledger_timestamp'),
+    ('movements page',
+     'SELECT movement_id, qty FROM product_movement WHERE (timestamp, movement_id) > (?, ?) '
+     'ORDER BY timestamp, movement_id LIMIT ?',
+     'idx_ledger_timestamp'),
+    ('movements to a location',
+     'SELECT movement_id, qty FROM product_movement WHERE to_location = ? ORDER BY timestamp, movement_id',
+     'idx_ledger_to_ts'),
+    ('movements by product',
+     'SELECT movement_id, qty FROM product_movement WHERE product_id = ? ORDER BY timestamp, movement_id',
+     'idx_ledger_product_ts'),
+    ('movements after a movement',
+     MOVEMENTS_AFTER_QUERY,
+     'idx_ledger_product_ts'),
+    ('stock periods after a month',
+     STOCK_PERIODS_AFTER_QUERY,
+     'PRIMARY KEY'),
+    ('reorder threshold',
+     'SELECT reorder_point FROM reorder_threshold WHERE product_id = ? AND location_id = ?',
+     'PRIMARY KEY'),
+)
+
+def check_query_plans(conn):
+    """Run EXPLAIN QUERY PLAN on the hot queries; return (name, ok, plan) tuples.
+
+    A plan is ok when it uses the expected index and needs no temporary
+    B-tree to sort.
+    """
+    results = []
+    for name, query, expected in QUERY_PLAN_CHECKS:
+        rows = conn.execute(f'EXPLAIN QUERY PLAN {query}', (None,) * query.count('?')).fetchall()
+        plan = '; '.join(row[3] for row in rows)
+        results.append((name, expected in plan and 'TEMP B-TREE' not in plan, plan))
+    return results
+
+def check_index_columns(conn):
+    """Compare the ledger indexes with their definitions; return (name, ok, columns) tuples.
+
+    An index created by an older version keeps its name, so the columns are
+    read back with PRAGMA index_info rather than trusting the name.
+    """
+    results = []
+    for name, expected in MOVEMENT_LEDGER_INDEX_COLUMNS:
+        columns = tuple(row[2] for row in conn.execute(f'PRAGMA index_info({name})'))
+        results.append((name, columns == expected, ', '.join(columns) or 'missing'))
+    return results
+
+def has_movement_ledger(conn):
+    """True once migration 6 has moved product_movement onto movement_ledger"""
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'movement_ledger'"
+    ).fetchone() is not None
+
+def rebuild_stock_balance(conn):
+    """Recompute stock_balance from the product_movement ledger"""
+    cursor = conn.cursor()
+    cursor.execute('UPDATE stock_version SET version = version + 1')
+    cursor.execute('UPDATE stock_balance SET qty = 0, version = (SELECT version FROM stock_version)')
+    # Migration 1 rebuilds balances before product_movement became a view
+    cursor.execute(LEDGER_BALANCE_REBUILD_QUERY if has_movement_ledger(conn) else STOCK_BALANCE_REBUILD_QUERY)
+    cursor.close()
+
+def rebuild_stock_periods(conn, start='', end='9999'):
+    """Recompute stock_period for the months from timestamp start up to end"""
+    conn.execute('DELETE FROM stock_period WHERE period >= ? AND period < ?', (start[:7], end[:7]))
+    conn.execute(STOCK_PERIOD_REBUILD_QUERY, (start, end) * 2)
+
+def verify_stock_balance(conn):
+    """Compare stock_balance with the ledger and return the rows that drifted"""
+    if has_movement_ledger(conn):
+        ledger = f'''
+        SELECT p.product_id, l.location_id, b.qty
+        FROM ({LEDGER_KEY_BALANCES}) b
+        JOIN ledger_product p ON p.product_key = b.product_key
+        JOIN ledger_location l ON l.location_key = b.location_key
+        '''
+    else:
+        ledger = '''
+        SELECT product_id, to_location as location_id, qty
+        FROM product_movement WHERE to_location IS NOT NULL
+        UNION ALL
+        SELECT product_id, from_location, -qty
+        FROM product_movement WHERE from_location IS NOT NULL
+        '''
+    cursor = conn.cursor()
+    cursor.execute(f'''
+    SELECT product_id, location_id, SUM(ledger_qty) as ledger_qty, SUM(balance_qty) as balance_qty
+    FROM (
+        SELECT product_id, location_id, qty as ledger_qty, 0 as balance_qty
+        FROM ({ledger})
+        UNION ALL
+        SELECT product_id, location_id, 0, qty FROM stock_balance
+    )
+    GROUP BY product_id, location_id
+    HAVING SUM(ledger_qty) <> SUM(balance_qty)
+    ''')
+    mismatches = [
+        {'product_id': r[0], 'location_id': r[1], 'ledger_qty': r[2], 'balance_qty': r[3]}
+        for r in cursor.fetchall()
+    ]
+    cursor.close()
+    return mismatches
+
+def get_available_stock(product_id, location_id):
+    """Current stock of a product at a location (primary-key lookup on stock_balance)"""
+    result = execute_query(AVAILABLE_STOCK_QUERY, (product_id, location_id), one=True)
+    return result['qty'] if result else 0
+
+def relocate_stock(from_location, to_location, product_ids=None):
+    """Move every positive balance at from_location to to_location.
+
+    One INSERT ... SELECT over stock_balance in the open transaction writes a
+    RELOC- movement per balance. The rows share one reading of
+    next_movement_id: each ID is RELOC-<minted ID>-<n>. Returns the inserted
+    (movement_id, timestamp, from_location, to_location, product_id, qty) rows.
+    """
+    conditions = ['location_id = ?', 'qty > 0']
+    params = [from_location]
+    if product_ids is not None:
+        conditions.append('product_id IN (SELECT value FROM json_each(?))')
+        params.append(json.dumps(list(product_ids)))
+    movement_id, timestamp = next_movement_id()
+    prefix = f'RELOC-{movement_id}-'
+    # Materialized first: the balance triggers update the rows being read
+    execute_query(f'''
+    INSERT INTO product_movement (movement_id, timestamp, from_location, to_location, product_id, qty)
+    WITH moved AS MATERIALIZED (
+        SELECT product_id, qty, row_number() OVER (ORDER BY product_id) AS n
+        FROM stock_balance {where_clause(conditions)}
+    )
+    SELECT ? || printf('%06d', n), ?, ?, ?, product_id, qty FROM moved
+    ''', (*params, prefix, timestamp, from_location, to_location), commit=True)
+    # Every ID starts with the prefix; '.' is the character after '-'
+    _, movements = execute_query('''
+    SELECT movement_id, timestamp, from_location, to_location, product_id, qty
+    FROM product_movement
+    WHERE movement_id > ? AND movement_id < ?
+    ORDER BY movement_id
+    ''', (prefix, prefix[:-1] + '.'), raw=True)
+    return movements
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Apply pending schema migrations."""
+    try:
+        applied = init_db()
+    except RuntimeError as e:
+        raise SystemExit(str(e))
+    for version, description in applied:
+        print(f'Applied migration {version}: {description}')
+    print(f'Schema is at version {SCHEMA_VERSION}')
+
+@app.cli.command('check-indexes')
+def check_indexes_command():
+    """Confirm the ledger index columns, and that hot queries use their indexes."""
+    init_db()
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        indexes = check_index_columns(conn)
+        plans = check_query_plans(conn)
+    finally:
+        conn.close()
+    for name, ok, columns in indexes:
+        print(f"{'ok  ' if ok else 'BAD '} index {name} ({columns})")
+    for name, ok, plan in plans:
+        print(f"{'ok  ' if ok else 'MISS'} {name}: {plan}")
+    bad = [name for name, ok, _ in indexes if not ok]
+    failed = [name for name, ok, _ in plans if not ok]
+    if bad or failed:
+        raise SystemExit(f'{len(bad)} index(es) with the wrong columns, '
+                         f'{len(failed)} query plan(s) not using the expected index')
+
+@app.cli.command('create-checkpoint')
+@click.option('--as-of', help='ISO timestamp to snapshot (default: now)')
+def create_checkpoint_command(as_of):
+    """Snapshot all balances for fast as-of reports (run periodically, e.g. from cron)."""
+    init_db()
+    try:
+        as_of = parse_as_of(as_of) if as_of else datetime.utcnow().isoformat()
+    except ValueError:
+        raise click.BadParameter('must be an ISO 8601 timestamp', param_hint='--as-of')
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        checkpoint_id = create_checkpoint(conn, as_of)
+        conn.commit()
+    finally:
+        conn.close()
+    print(f'Checkpoint {checkpoint_id} as of {as_of}')
+
+@app.cli.command('compact-checkpoints')
+@click.option('--keep-recent', default=30, show_default=True, help='Newest checkpoints kept as-is')
+def compact_checkpoints_command(keep_recent):
+    """Thin older checkpoints down to one per month."""
+    init_db()
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        removed = compact_checkpoints(conn, keep_recent)
+        conn.commit()
+    finally:
+        conn.close()
+    print(f'Removed {removed} checkpoint(s)')
+
+@app.cli.command('rebuild-checkpoints')
+def rebuild_checkpoints_command():
+    """Recreate monthly checkpoints from the movement ledger."""
+    init_db()
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        created = rebuild_checkpoints(conn)
+        conn.commit()
+    finally:
+        conn.close()
+    print(f'Created {created} checkpoint(s)')
+
+@app.cli.command('archive-movements')
+@click.option('--before', help='First month to keep in the hot table (YYYY-MM); defaults to --keep-months ago.')
+@click.option('--keep-months', default=3, show_default=True, help='Closed months to keep besides the current one.')
+def archive_movements_command(before, keep_months):
+    """Move movements of closed months into movement_archive."""
+    init_db()
+    current = datetime.utcnow().strftime('%Y-%m')
+    if before is None:
+        before = current
+        for _ in range(keep_months):
+            year, month = int(before[:4]), int(before[5:7])
+            before = f'{year - 1:04d}-12' if month == 1 else f'{year:04d}-{month - 1:02d}'
+    try:
+        before = datetime.strptime(before, '%Y-%m').strftime('%Y-%m')
+    except ValueError:
+        raise click.BadParameter('must be YYYY-MM', param_hint='--before')
+    if before > current:
+        raise click.BadParameter('only closed months can be archived', param_hint='--before')
+
+    conn = sqlite3.connect(DB_PATH, isolation_level=None)
+    try:
+        first = conn.execute(
+            f"SELECT MIN(timestamp) FROM product_movement WHERE movement_id NOT LIKE '{OPENING_PREFIX}%'"
+        ).fetchone()[0]
+        period = first[:7] if first else before
+        while period < before:
+            # One transaction per month keeps the write lock short
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                archived = archive_month(conn, period)
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            print(f'Archived {period}: {archived} movement(s)')
+            period = next_month(period)
+        cutoff = archive_cutoff(conn)
+    finally:
+        conn.close()
+    print(f'Movements before {cutoff} are archived' if cutoff else 'Nothing archived')
+
+@app.cli.command('rebuild-balances')
+def rebuild_balances_command():
+    """Recompute the stock_balance and stock_period tables from the movement ledger."""
+    init_db()
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        rebuild_stock_balance(conn)
+        rebuild_stock_periods(conn)
+        conn.commit()
+        count = conn.execute('SELECT COUNT(*) FROM stock_balance').fetchone()[0]
+    finally:
+        conn.close()
+    print(f'Rebuilt stock_balance: {count} rows')
+
+@app.cli.command('verify-balances')
+def verify_balances_command():
+    """Check stock_balance against the movement ledger."""
+    init_db()
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        mismatches = verify_stock_balance(conn)
+    finally:
+        conn.close()
+    for m in mismatches:
+        print(f"{m['product_id']} @ {m['location_id']}: ledger={m['ledger_qty']} balance={m['balance_qty']}")
+    if mismatches:
+        raise SystemExit(f'{len(mismatches)} balance(s) out of sync; run "flask rebuild-balances"')
+    print('stock_balance is in sync with the ledger')
+
+# Ledger verifier: running balances, total_quantity and stock_balance per product range
+VERIFY_CHUNK_PRODUCTS = 1000
+
+# Ordered per product by time; movement_key (the rowid, already part of
+# idx_ledger_product_ts) breaks ties in insertion order
+LEDGER_SCAN_QUERY = '''
+SELECT product_key, from_key, to_key, qty, timestamp, movement_key
+FROM movement_ledger
+WHERE product_key >= ? AND product_key < ?
+ORDER BY product_key, timestamp, movement_key
+'''
+
+def verify_ledger_range(db_path, first_key, end_key):
+    """Verify the products with first_key <= product_key < end_key.
+
+    Runs in a worker process on its own read-only connection and one read
+    transaction, so the ledger, product and stock_balance rows it compares
+    come from the same snapshot. Returns the scanned row count and the
+    negative running balances, total_quantity mismatches and stock_balance
+    mismatches found, with keys resolved to IDs.
+    """
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True, isolation_level=None)
+    try:
+        conn.execute('BEGIN')
+        stored = {
+            (product_key, location_key): qty
+            for product_key, location_key, qty in conn.execute('''
+            SELECT p.product_key, l.location_key, sb.qty
+            FROM ledger_product p
+            JOIN stock_balance sb ON sb.product_id = p.product_id
+            JOIN ledger_location l ON l.location_id = sb.location_id
+            WHERE p.product_key >= ? AND p.product_key < ?
+            ''', (first_key, end_key))
+        }
+
+        rows = 0
+        negatives = []
+        computed = {}
+        product = None
+        balances = negative = None
+        for product_key, from_key, to_key, qty, timestamp, movement_key in conn.execute(
+                LEDGER_SCAN_QUERY, (first_key, end_key)):
+            rows += 1
+            if product_key != product:
+                product = product_key
+                balances = {}
+                negative = set()
+            if to_key is not None:
+                balance = balances.get(to_key, 0) + qty
+                balances[to_key] = balance
+                computed[(product_key, to_key)] = balance
+                if balance >= 0:
+                    negative.discard(to_key)
+            if from_key is not None:
+                balance = balances.get(from_key, 0) - qty
+                balances[from_key] = balance
+                computed[(product_key, from_key)] = balance
+                # Reported once per episode, where the balance first went below zero
+                if balance < 0 and from_key not in negative:
+                    negative.add(from_key)
+                    negatives.append((product_key, from_key, timestamp, movement_key, balance))
+
+        drifted = [
+            (key, computed.get(key, 0), stored.get(key, 0))
+            for key in computed.keys() | stored.keys()
+            if computed.get(key, 0) != stored.get(key, 0)
+        ]
+
+        totals = []
+        for product_id, total_quantity, location_id, init_qty, archived_qty in conn.execute('''
+        SELECT pr.product_id, pr.total_quantity, pr.location_id, m.qty,
+               (SELECT qty FROM movement_archive WHERE movement_id = 'INIT-' || pr.product_id)
+        FROM ledger_product p
+        JOIN product pr ON pr.product_id = p.product_id
+        LEFT JOIN movement_ledger m ON m.movement_id = 'INIT-' || pr.product_id
+        WHERE p.product_key >= ? AND p.product_key < ?
+        ''', (first_key, end_key)):
+            ledger_qty = init_qty if init_qty is not None else archived_qty
+            if ledger_qty is None:
+                # add_product only records stock received at a location
+                if location_id and (total_quantity or 0) > 0:
+                    totals.append((product_id, total_quantity, None))
+            elif ledger_qty != (total_quantity or 0):
+                totals.append((product_id, total_quantity, ledger_qty))
+
+        def product_id(key):
+            return conn.execute('SELECT product_id FROM ledger_product WHERE product_key = ?', (key,)).fetchone()[0]
+
+        def location_id(key):
+            return conn.execute('SELECT location_id FROM ledger_location WHERE location_key = ?', (key,)).fetchone()[0]
+
+        def movement_id(key):
+            return conn.execute('SELECT movement_id FROM movement_ledger WHERE movement_key = ?', (key,)).fetchone()[0]
+
+        return {
+            'rows': rows,
+            'negative_balances': [
+                {'product_id': product_id(p), 'location_id': location_id(l), 'timestamp': timestamp,
+                 'movement_id': movement_id(m), 'balance': balance}
+                for p, l, timestamp, m, balance in negatives
+            ],
+            'total_mismatches': [
+                {'product_id': p, 'total_quantity': total, 'ledger_qty': ledger_qty}
+                for p, total, ledger_qty in totals
+            ],
+            'balance_mismatches': [
+                {'product_id': product_id(p), 'location_id': location_id(l), 'ledger_qty': ledger_qty,
+                 'balance_qty': balance_qty}
+                for (p, l), ledger_qty, balance_qty in drifted
+            ],
+        }
+    finally:
+        conn.close()
+
+def verify_ledger(db_path, workers=None, chunk_products=VERIFY_CHUNK_PRODUCTS):
+    """Verify the whole ledger, chunks of product keys spread over worker processes"""
+    # Imported here: multiprocessing adds to every worker's startup otherwise
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    conn = sqlite3.connect(db_path)
+    try:
+        max_key = conn.execute('SELECT COALESCE(MAX(product_key), 0) FROM ledger_product').fetchone()[0]
+        # Products never moved have no key; a total_quantity means an INIT is missing
+        unkeyed = conn.execute('''
+        SELECT product_id, total_quantity FROM product
+        WHERE location_id IS NOT NULL AND total_quantity > 0
+          AND product_id NOT IN (SELECT product_id FROM ledger_product)
+        ''').fetchall()
+    finally:
+        conn.close()
+
+    result = {
+        'rows': 0,
+        'negative_balances': [],
+        'total_mismatches': [
+            {'product_id': product_id, 'total_quantity': total, 'ledger_qty': None}
+            for product_id, total in unkeyed
+        ],
+        'balance_mismatches': [],
+    }
+    ranges = [(first, min(first + chunk_products, max_key + 1)) for first in range(1, max_key + 1, chunk_products)]
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = [executor.submit(verify_ledger_range, db_path, first, end) for first, end in ranges]
+        for future in as_completed(futures):
+            part = future.result()
+            result['rows'] += part.pop('rows')
+            for kind, issues in part.items():
+                result[kind].extend(issues)
+    for kind in ('negative_balances', 'total_mismatches', 'balance_mismatches'):
+        result[kind].sort(key=lambda issue: (issue['product_id'], issue.get('location_id') or ''))
+    return result
+
+def repair_ledger(conn, result):
+    """Fix what verify_ledger found that has a safe repair; return a list of actions.
+
+    - INIT movements are set to the product's total_quantity (created at the
+      product's location if missing).
+    - Older versions of update_product re-stamped the INIT movement to the
+      time of the edit. Where that left its location negative before the new
+      timestamp, the INIT movement is moved back to just before the
+      product's first movement. INIT movements are left alone otherwise.
+    - stock_balance is rebuilt when it drifted from the ledger.
+
+    Negative balances with other causes are left for review.
+    """
+    actions = []
+    for issue in result['total_mismatches']:
+        product_id = issue['product_id']
+        init_id = f'INIT-{product_id}'
+        if conn.execute('SELECT 1 FROM movement_archive WHERE movement_id = ?', (init_id,)).fetchone():
+            actions.append(f'{product_id}: INIT movement is archived, left as is')
+        elif issue['ledger_qty'] is not None:
+            conn.execute('UPDATE product_movement SET qty = ? WHERE movement_id = ?',
+                         (issue['total_quantity'] or 0, init_id))
+            actions.append(f'{product_id}: INIT qty {issue["ledger_qty"]} -> {issue["total_quantity"] or 0}')
+        else:
+            location_id, total = conn.execute(
+                'SELECT location_id, total_quantity FROM product WHERE product_id = ?', (product_id,)).fetchone()
+            first = conn.execute(
+                'SELECT MIN(timestamp) FROM product_movement WHERE product_id = ?', (product_id,)).fetchone()[0]
+            timestamp = first_moment_before(first) if first else next_movement_id()[1]
+            conn.execute('''
+            INSERT INTO product_movement (movement_id, timestamp, from_location, to_location, product_id, qty)
+            VALUES (?, ?, NULL, ?, ?, ?)
+            ''', (init_id, timestamp, location_id, product_id, total))
+            actions.append(f'{product_id}: created INIT movement of {total} at {location_id}')
+
+    # Earliest negative episode per (product, location)
+    went_negative = {}
+    for issue in result['negative_balances']:
+        key = (issue['product_id'], issue['location_id'])
+        went_negative[key] = min(went_negative.get(key, issue['timestamp']), issue['timestamp'])
+    for product_id in sorted({product_id for product_id, _ in went_negative}):
+        init_id = f'INIT-{product_id}'
+        row = conn.execute('''
+        SELECT i.timestamp, i.to_location, (SELECT MIN(timestamp) FROM product_movement
+                                            WHERE product_id = i.product_id AND movement_id <> i.movement_id)
+        FROM product_movement i WHERE i.movement_id = ?
+        ''', (init_id,)).fetchone()
+        if not row or row[2] is None or row[0] < row[2]:
+            continue
+        negative_at = went_negative.get((product_id, row[1]))
+        if negative_at is not None and negative_at < row[0]:
+            timestamp = first_moment_before(row[2])
+            conn.execute('UPDATE product_movement SET timestamp = ? WHERE movement_id = ?', (timestamp, init_id))
+            actions.append(f'{product_id}: INIT movement moved from {row[0]} to {timestamp}')
+
+    if result['balance_mismatches']:
+        rebuild_stock_balance(conn)
+        actions.append('stock_balance rebuilt from the ledger')
+    return actions
+
+def first_moment_before(timestamp):
+    """ISO timestamp one microsecond before the given one"""
+    return (datetime.fromisoformat(timestamp) - timedelta(microseconds=1)).isoformat()
+
+VERIFY_ISSUE_LINES = {
+    'negative_balances': lambda i: (
+        f"negative  {i['product_id']} @ {i['location_id']}: {i['balance']} at {i['timestamp']} ({i['movement_id']})"),
+    'total_mismatches': lambda i: (
+        f"total     {i['product_id']}: total_quantity={i['total_quantity']} INIT qty={i['ledger_qty']}"),
+    'balance_mismatches': lambda i: (
+        f"balance   {i['product_id']} @ {i['location_id']}: ledger={i['ledger_qty']} balance={i['balance_qty']}"),
+}
+
+@app.cli.command('verify-ledger')
+@click.option('--workers', type=int, help='Worker processes (default: CPU count).')
+@click.option('--chunk-products', default=VERIFY_CHUNK_PRODUCTS, show_default=True,
+              help='Products per unit of work handed to a worker.')
+@click.option('--repair', is_flag=True, help='Apply the safe repairs, then verify again.')
+@click.option('--limit', default=50, show_default=True, help='Issues printed per kind (0 for all).')
+def verify_ledger_command(workers, chunk_products, repair, limit):
+    """Find negative running balances, total_quantity and stock_balance drift."""
+    init_db()
+    started = time.perf_counter()
+    result = verify_ledger(DB_PATH, workers, chunk_products)
+    elapsed = time.perf_counter() - started
+    print(f"Scanned {result['rows']} movement(s) in {elapsed:.1f}s")
+
+    if repair and any(result[kind] for kind in VERIFY_ISSUE_LINES):
+        conn = sqlite3.connect(DB_PATH, isolation_level=None)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                actions = repair_ledger(conn, result)
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        finally:
+            conn.close()
+        for action in actions:
+            print(f'repaired  {action}')
+        result = verify_ledger(DB_PATH, workers, chunk_products)
+
+    for kind, line in VERIFY_ISSUE_LINES.items():
+        issues = result[kind]
+        for issue in issues[:limit or None]:
+            print(line(issue))
+        if limit and len(issues) > limit:
+            print(f'... {len(issues) - limit} more {kind.replace("_", " ")}')
+    counts = {kind: len(result[kind]) for kind in VERIFY_ISSUE_LINES}
+    if any(counts.values()):
+        raise SystemExit(', '.join(f'{n} {kind.replace("_", " ")}' for kind, n in counts.items()))
+    print('Ledger is consistent')
+
+# Keyset pagination helpers for the list endpoints
+PAGE_MAX_LIMIT = 1000
+
+PRODUCT_COLUMNS = ('product_id', 'name', 'description', 'total_quantity', 'location_id')
+LOCATION_COLUMNS = ('location_id', 'name', 'address')
+MOVEMENT_COLUMNS = ('movement_id', 'timestamp', 'from_location', 'to_location', 'product_id', 'qty')
+
+def encode_cursor(row, key):
+    """Opaque cursor pointing just past the given row"""
+    return base64.urlsafe_b64encode(json.dumps([row[k] for k in key]).encode()).decode()
+
+def decode_cursor(cursor, key):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    # Every key column is a string; anything else was not minted by encode_cursor
+    if not isinstance(values, list) or len(values) != len(key) or not all(isinstance(v, str) for v in values):
+        raise ValueError('Invalid cursor')
+    return values
+
+def parse_page_args(columns, key):
+    """Read ?limit=, ?after= and ?fields= into (limit, after, selected columns)"""
+    parse_response_format()
+
+    limit = request.args.get('limit')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError('limit must be an integer')
+        if not 1 <= limit <= PAGE_MAX_LIMIT:
+            raise ValueError(f'limit must be between 1 and {PAGE_MAX_LIMIT}')
+
+    after = request.args.get('after')
+    if after is not None:
+        after = decode_cursor(after, key)
+
+    fields = list(columns)
+    if request.args.get('fields'):
+        requested = [f.strip() for f in request.args['fields'].split(',') if f.strip()]
+        unknown = [f for f in requested if f not in columns]
+        if unknown:
+            raise ValueError(f'Unknown fields: {", ".join(unknown)}')
+        # The key columns are always returned so the cursor can be built
+        fields = [c for c in columns if c in requested or c in key]
+
+    return limit, after, fields
+
+def where_clause(conditions):
+    return f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+RESPONSE_FORMATS = ('rows', 'columnar')
+
+def parse_response_format():
+    """?format=rows (a list of objects, the default) or ?format=columnar"""
+    fmt = request.args.get('format', 'rows')
+    if fmt not in RESPONSE_FORMATS:
+        raise ValueError('format must be rows or columnar')
+    return fmt
+
+def rows_response(columns, rows):
+    """jsonify a raw result in the format the client asked for"""
+    if request.args.get('format') == 'columnar':
+        return jsonify(rows_to_columns(columns, rows))
+    return jsonify(rows_to_dicts(columns, rows))
+
+def page_response(columns, rows, limit, key):
+    """jsonify one page; rows holds up to limit + 1 tuples to detect a next page"""
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(dict(zip(columns, rows[-1])), key)
+    response = rows_response(columns, rows)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+# Streaming exports
+EXPORT_BATCH_SIZE = 1000
+EXPORT_MIMETYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+def parse_export_args(columns):
+    """Read ?format= and ?fields= for an export"""
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_MIMETYPES:
+        raise ValueError('format must be ndjson or csv')
+    fields = list(columns)
+    if request.args.get('fields'):
+        fields = [f.strip() for f in request.args['fields'].split(',') if f.strip()]
+        unknown = [f for f in fields if f not in columns]
+        if unknown:
+            raise ValueError(f'Unknown fields: {", ".join(unknown)}')
+    return fmt, fields
+
+def stream_rows(query, params, fmt):
+    """Yield encoded chunks of a query result, fetchmany() batch by batch"""
+    conn = db_pool.acquire()
+    cursor = conn.cursor()
+    started = time.perf_counter() if metrics.enabled else None
+    count = 0
+    try:
+        cursor.execute(query, params)
+        columns = [col[0] for col in cursor.description]
+        if fmt == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+        while True:
+            rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+            if not rows:
+                break
+            count += len(rows)
+            if fmt == 'csv':
+                writer.writerows(rows)
+                chunk = buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            else:
+                chunk = ''.join(json.dumps(dict(zip(columns, row))) + '\n' for row in rows)
+            yield chunk.encode()
+        if started is not None:
+            # Includes the time the client took to read the stream
+            metrics.observe_query(conn, query, params, time.perf_counter() - started, count)
+    finally:
+        cursor.close()
+        db_pool.release(conn)
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def export_response(query, params, fmt, name):
+    """Streamed download of a query; gzip-encoded when the client accepts it"""
+    chunks = stream_rows(query, params, fmt)
+    headers = {
+        'Content-Disposition': f'attachment; filename={name}.{fmt}',
+        'Vary': 'Accept-Encoding',
+    }
+    if 'gzip' in request.accept_encodings:
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(chunks, mimetype=EXPORT_MIMETYPES[fmt], headers=headers)
+
+@app.route('/db/stats', methods=['GET'])
+def db_stats():
+    stats = db_pool.stats()
+    stats['writer'] = movement_writer.stats() if movement_writer is not None else {'enabled': False}
+    return jsonify(stats)
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify({
+        'product': product_cache.stats(),
+        'location': location_cache.stats(),
+        'response': response_cache.stats(),
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    lines = metrics.render()
+    pool = db_pool.stats()
+    lines += [
+        '# HELP inventory_db_connections_opened_total SQLite connections opened by the pool',
+        '# TYPE inventory_db_connections_opened_total counter',
+        f'inventory_db_connections_opened_total {pool["opened"]}',
+        '# HELP inventory_db_connections Pooled connections by state',
+        '# TYPE inventory_db_connections gauge',
+        f'inventory_db_connections{metric_labels(state="in_use")} {pool["in_use"]}',
+        f'inventory_db_connections{metric_labels(state="idle")} {pool["idle"]}',
+        '# HELP inventory_cache_lookups_total Lookup cache hits and misses',
+        '# TYPE inventory_cache_lookups_total counter',
+    ]
+    for name, cache in (('product', product_cache), ('location', location_cache), ('response', response_cache)):
+        stats = cache.stats()
+        lines.append(f'inventory_cache_lookups_total{metric_labels(cache=name, result="hit")} {stats["hits"]}')
+        lines.append(f'inventory_cache_lookups_total{metric_labels(cache=name, result="miss")} {stats["misses"]}')
+    if movement_writer is not None:
+        writer = movement_writer.stats()
+        lines += [
+            '# HELP inventory_movement_writer_batches_total Group commits made by the movement writer',
+            '# TYPE inventory_movement_writer_batches_total counter',
+            f'inventory_movement_writer_batches_total {writer["batches"]}',
+            '# HELP inventory_movement_writer_movements_total Movements handled by the movement writer',
+            '# TYPE inventory_movement_writer_movements_total counter',
+            f'inventory_movement_writer_movements_total {writer["movements"]}',
+        ]
+    stream = stock_stream.stats()
+    lines += [
+        '# HELP inventory_stream_clients Connected /stream/stock clients',
+        '# TYPE inventory_stream_clients gauge',
+        f'inventory_stream_clients {stream["clients"]}',
+        '# HELP inventory_stream_events_total Stock versions published to stream clients',
+        '# TYPE inventory_stream_events_total counter',
+        f'inventory_stream_events_total {stream["published"]}',
+        '# HELP inventory_stream_resyncs_total Stream clients that overflowed their buffer and caught up from the database',
+        '# TYPE inventory_stream_resyncs_total counter',
+        f'inventory_stream_resyncs_total {stream["resyncs"]}',
+    ]
+    lines += [
+        '# HELP inventory_data_version Committed writes since startup',
+        '# TYPE inventory_data_version gauge',
+        f'inventory_data_version {data_version.value}',
+        '# HELP inventory_metrics_enabled Whether request and query instrumentation is on',
+        '# TYPE inventory_metrics_enabled gauge',
+        f'inventory_metrics_enabled {int(metrics.enabled)}',
+    ]
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+@app.route('/metrics/config', methods=['GET', 'PUT'])
+def metrics_config():
+    if request.method == 'PUT':
+        data = request.get_json(silent=True) or {}
+        if 'enabled' in data:
+            if not isinstance(data['enabled'], bool):
+                return jsonify({'error': 'enabled must be true or false'}), 400
+            metrics.enabled = data['enabled']
+        if 'slow_query_ms' in data:
+            try:
+                metrics.slow_query_ms = float(data['slow_query_ms'])
+            except (TypeError, ValueError):
+                return jsonify({'error': 'slow_query_ms must be a number'}), 400
+        if data.get('reset'):
+            metrics.reset()
+    return jsonify({'enabled': metrics.enabled, 'slow_query_ms': metrics.slow_query_ms})
 
 # Product endpoints
 @app.route('/products', methods=['GET'])
+@conditional
 def get_products():
-    query = '''
-    SELECT product_id, name, description, total_quantity, location_id
+    key = ('product_id',)
+    try:
+        limit, after, fields = parse_page_args(PRODUCT_COLUMNS, key)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    conditions = []
+    params = []
+    if request.args.get('location_id'):
+        conditions.append('location_id = ?')
+        params.append(request.args['location_id'])
+    if after:
+        conditions.append('product_id > ?')
+        params.extend(after)
+
+    query = f'''
+    SELECT {', '.join(fields)}
     FROM product
+    {where_clause(conditions)}
+    ORDER BY product_id
+    {'LIMIT ?' if limit else ''}
     '''
-    products = execute_query(query)
-    return jsonify(products)
+    if limit:
+        params.append(limit + 1)
+    columns, products = execute_query(query, tuple(params), raw=True)
+    return page_response(columns, products, limit, key)
 
 @app.route('/products', methods=['POST'])
+@transactional
 def add_product():
     data = request.get_json()
     if not data or not data.get('product_id') or not data.get('name'):
         return jsonify({'error': 'product_id and name required'}), 400
     
     # Check if product exists
-    check_query = 'SELECT product_id FROM product WHERE product_id = ?'
-    existing = execute_query(check_query, (data['product_id'],), one=True)
+    existing = get_product_row(data['product_id'])
     if existing:
         return jsonify({'error': 'Product ID already exists'}), 400
     
     # Check if location exists if provided
     location_id = data.get('location_id')
     if location_id:
-        location_query = 'SELECT location_id FROM location WHERE location_id = ?'
-        location = execute_query(location_query, (location_id,), one=True)
+        location = get_location_row(location_id)
         if not location:
             return jsonify({'error': 'Location does not exist'}), 400
     
@@ -138,11 +2513,13 @@ def add_product():
             (data['product_id'], data['name'], data.get('description'), total_qty, location_id), 
             commit=True
         )
+        invalidate_cached(product_cache, data['product_id'])
         
         # Automatically create inbound movement if location and quantity are set
-        if location_id and total_qty > 0:
+        if location_id and (total_qty or 0) > 0:
             movement_id = f'INIT-{data["product_id"]}'
-            timestamp = datetime.utcnow().isoformat()
+            # Same clock as generated movement IDs, so ledger order is write order
+            _, timestamp = next_movement_id()
             movement_query = '''
             INSERT INTO product_movement (movement_id, timestamp, from_location, to_location, product_id, qty)
             VALUES (?, ?, ?, ?, ?, ?)
@@ -159,17 +2536,13 @@ def add_product():
 
 @app.route('/products/<product_id>', methods=['GET'])
 def get_product(product_id):
-    query = '''
-    SELECT product_id, name, description, total_quantity, location_id
-    FROM product
-    WHERE product_id = ?
-    '''
-    product = execute_query(query, (product_id,), one=True)
+    product = get_product_row(product_id)
     if not product:
         return jsonify({'error': 'Product not found'}), 404
     return jsonify(product)
 
 @app.route('/products/<product_id>', methods=['PUT'])
+@transactional
 def update_product(product_id):
     # Check if product exists
     check_query = 'SELECT * FROM product WHERE product_id = ?'
@@ -182,8 +2555,7 @@ def update_product(product_id):
     # Check if location exists if provided
     if 'location_id' in data:
         if data['location_id']:
-            location_query = 'SELECT location_id FROM location WHERE location_id = ?'
-            location = execute_query(location_query, (data['location_id'],), one=True)
+            location = get_location_row(data['location_id'])
             if not location:
                 return jsonify({'error': 'Location does not exist'}), 400
 
@@ -218,6 +2590,23 @@ def update_product(product_id):
     if not update_fields:
         return jsonify({'message': 'No fields to update'}), 200
 
+    # The INIT movement takes the new quantity at its original place in the
+    # history, so stock shipped since must still be covered
+    init_movement = None
+    if 'total_quantity' in data:
+        check_query = 'SELECT * FROM product_movement WHERE movement_id = ?'
+        init_movement = execute_query(check_query, (f'INIT-{product_id}',), one=True)
+    if init_movement:
+        try:
+            total_quantity = int(data['total_quantity'])
+        except (TypeError, ValueError):
+            total_quantity = -1
+        if total_quantity < 0:
+            return jsonify({'error': 'total_quantity must be a non-negative integer'}), 400
+        error = check_movement_change(init_movement, dict(init_movement, qty=total_quantity))
+        if error:
+            return jsonify({'error': error}), 409
+
     update_query = f'''
     UPDATE product
     SET {', '.join(update_fields)}
@@ -227,92 +2616,74 @@ def update_product(product_id):
 
     try:
         execute_query(update_query, tuple(params), commit=True)
+        invalidate_cached(product_cache, product_id)
+
+        # If total_quantity is changed, update the INIT movement as well (it keeps its timestamp)
+        if init_movement:
+            update_init_query = 'UPDATE product_movement SET qty = ? WHERE movement_id = ?'
+            execute_query(update_init_query, (total_quantity, init_movement['movement_id']), commit=True)
 
-        # If location changed, add a new inbound movement for the remaining stock to the new location
+        # If location changed, move the stock still held at the old location
         if location_changed:
-            # Calculate total inbound to old location
-            in_query = '''
-            SELECT COALESCE(SUM(qty), 0) as total_in
-            FROM product_movement
-            WHERE product_id = ? AND to_location = ?
-            '''
-            in_result = execute_query(in_query, (product_id, old_location), one=True)
-            in_qty = in_result['total_in'] if in_result else 0
-
-            # Calculate total outbound from old location
-            out_query = '''
-            SELECT COALESCE(SUM(qty), 0) as total_out
-            FROM product_movement
-            WHERE product_id = ? AND from_location = ?
-            '''
-            out_result = execute_query(out_query, (product_id, old_location), one=True)
-            out_qty = out_result['total_out'] if out_result else 0
-
-            remaining = in_qty - out_qty
-            if remaining > 0:
-                # Add inbound movement to new location for remaining stock
-                movement_id = f'RELOC-{product_id}-{int(time.time())}'
-                timestamp = datetime.utcnow().isoformat()
-                movement_query = '''
-                INSERT INTO product_movement (movement_id, timestamp, from_location, to_location, product_id, qty)
-                VALUES (?, ?, ?, ?, ?, ?)
-                '''
-                execute_query(
-                    movement_query,
-                    (movement_id, timestamp, old_location, new_location, product_id, remaining),
-                    commit=True
-                )
-
-
-        # If total_quantity is changed, update the INIT movement as well (qty and timestamp)
-        if 'total_quantity' in data:
-            from datetime import datetime
-            init_movement_id = f'INIT-{product_id}'
-            update_init_query = '''
-            UPDATE product_movement
-            SET qty = ?, timestamp = ?
-            WHERE movement_id = ?
-            '''
-            execute_query(update_init_query, (data['total_quantity'], datetime.utcnow().isoformat(), init_movement_id), commit=True)
+            relocate_stock(old_location, new_location, [product_id])
 
         return jsonify({'message': 'Product updated'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/products/<product_id>', methods=['DELETE'])
+@transactional
 def delete_product(product_id):
     # Check if product exists
-    check_query = 'SELECT product_id FROM product WHERE product_id = ?'
-    product = execute_query(check_query, (product_id,), one=True)
+    product = get_product_row(product_id)
     if not product:
         return jsonify({'error': 'Product not found'}), 404
     
     delete_query = 'DELETE FROM product WHERE product_id = ?'
     try:
         execute_query(delete_query, (product_id,), commit=True)
+        invalidate_cached(product_cache, product_id)
         return jsonify({'message': 'Product deleted'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
         
 # Location endpoints
 @app.route('/locations', methods=['GET'])
+@conditional
 def get_locations():
-    query = '''
-    SELECT location_id, name, address
+    key = ('location_id',)
+    try:
+        limit, after, fields = parse_page_args(LOCATION_COLUMNS, key)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    conditions = []
+    params = []
+    if after:
+        conditions.append('location_id > ?')
+        params.extend(after)
+
+    query = f'''
+    SELECT {', '.join(fields)}
     FROM location
+    {where_clause(conditions)}
+    ORDER BY location_id
+    {'LIMIT ?' if limit else ''}
     '''
-    locations = execute_query(query)
-    return jsonify(locations)
+    if limit:
+        params.append(limit + 1)
+    columns, locations = execute_query(query, tuple(params), raw=True)
+    return page_response(columns, locations, limit, key)
 
 @app.route('/locations', methods=['POST'])
+@transactional
 def add_location():
     data = request.get_json()
     if not data or not data.get('location_id') or not data.get('name'):
         return jsonify({'error': 'location_id and name required'}), 400
     
     # Check if location exists
-    check_query = 'SELECT location_id FROM location WHERE location_id = ?'
-    existing = execute_query(check_query, (data['location_id'],), one=True)
+    existing = get_location_row(data['location_id'])
     if existing:
         return jsonify({'error': 'Location ID already exists'}), 400
     
@@ -327,23 +2698,20 @@ def add_location():
             (data['location_id'], data['name'], data.get('address')), 
             commit=True
         )
+        invalidate_cached(location_cache, data['location_id'])
         return jsonify({'message': 'Location created', 'location_id': data['location_id']}), 201
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/locations/<location_id>', methods=['GET'])
 def get_location(location_id):
-    query = '''
-    SELECT location_id, name, address
-    FROM location
-    WHERE location_id = ?
-    '''
-    location = execute_query(query, (location_id,), one=True)
+    location = get_location_row(location_id)
     if not location:
         return jsonify({'error': 'Location not found'}), 404
     return jsonify(location)
 
 @app.route('/locations/<location_id>', methods=['PUT'])
+@transactional
 def update_location(location_id):
     # Check if location exists
     check_query = 'SELECT * FROM location WHERE location_id = ?'
@@ -377,120 +2745,622 @@ def update_location(location_id):
     
     try:
         execute_query(update_query, tuple(params), commit=True)
+        invalidate_cached(location_cache, location_id)
         return jsonify({'message': 'Location updated'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/locations/<location_id>', methods=['DELETE'])
+@transactional
 def delete_location(location_id):
     # Check if location exists
-    check_query = 'SELECT location_id FROM location WHERE location_id = ?'
-    location = execute_query(check_query, (location_id,), one=True)
+    location = get_location_row(location_id)
     if not location:
         return jsonify({'error': 'Location not found'}), 404
     
     delete_query = 'DELETE FROM location WHERE location_id = ?'
     try:
         execute_query(delete_query, (location_id,), commit=True)
+        invalidate_cached(location_cache, location_id)
         return jsonify({'message': 'Location deleted'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+@app.route('/locations/<location_id>/relocate', methods=['POST'])
+@transactional
+def relocate_location(location_id):
+    if not get_location_row(location_id):
+        return jsonify({'error': 'Location not found'}), 404
+
+    data = request.get_json(silent=True) or {}
+    to_location = data.get('to_location')
+    if not to_location:
+        return jsonify({'error': 'to_location required'}), 400
+    if to_location == location_id:
+        return jsonify({'error': 'to_location must differ from the source location'}), 400
+    if not get_location_row(to_location):
+        return jsonify({'error': 'to_location does not exist'}), 400
+    product_ids = data.get('product_ids')
+    if product_ids is not None and (
+            not isinstance(product_ids, list) or not all(isinstance(p, str) for p in product_ids)):
+        return jsonify({'error': 'product_ids must be a list of product IDs'}), 400
+
+    movements = relocate_stock(location_id, to_location, product_ids)
+
+    # Products whose home is the source location move with their stock
+    conditions = ['location_id = ?']
+    params = [location_id]
+    if product_ids is not None:
+        conditions.append('product_id IN (SELECT value FROM json_each(?))')
+        params.append(json.dumps(product_ids))
+    _, homed = execute_query(f'SELECT product_id FROM product {where_clause(conditions)}', tuple(params), raw=True)
+    if homed:
+        execute_query(f'UPDATE product SET location_id = ? {where_clause(conditions)}',
+                      (to_location, *params), commit=True)
+        for (product_id,) in homed:
+            invalidate_cached(product_cache, product_id)
+
+    return jsonify({
+        'message': 'Stock relocated',
+        'movements': len(movements),
+        'qty': sum(m[5] for m in movements),
+        'movement_ids': [m[0] for m in movements],
+        'products_rehomed': len(homed),
+    }), 201 if movements else 200
         
 # Movement endpoints
+def movement_time_range():
+    """?since= and ?until= in the stored timestamp form (see parse_as_of), None when absent"""
+    bounds = []
+    for name in ('since', 'until'):
+        value = request.args.get(name)
+        try:
+            bounds.append(parse_as_of(value) if value else None)
+        except ValueError:
+            raise ValueError(f'{name} must be an ISO 8601 timestamp')
+    return tuple(bounds)
+
+def movement_sources():
+    """(table, extra conditions) pairs a movements listing has to read.
+
+    Only the hot table unless the request reaches archived months, in which
+    case the archive is read too and the opening movements are left out.
+    """
+    hot = [('product_movement', [])]
+    history = [('movement_archive', []), ('product_movement', [f"movement_id NOT LIKE '{OPENING_PREFIX}%'"])]
+    if request.args.get('archive') == 'include':
+        return history
+    since, until = movement_time_range()
+    if since or until:
+        cutoff = archive_cutoff()
+        if cutoff and ((since and since < cutoff) or (until and until <= cutoff)):
+            return history
+    return hot
+
+def build_movements_query(fields, limit=None, after=None):
+    """SELECT for movements honouring the list filters in request.args"""
+    conditions = []
+    params = []
+    if request.args.get('product_id'):
+        conditions.append('product_id = ?')
+        params.append(request.args['product_id'])
+    since, until = movement_time_range()
+    if since:
+        conditions.append('timestamp >= ?')
+        params.append(since)
+    if until:
+        conditions.append('timestamp < ?')
+        params.append(until)
+    if after:
+        conditions.append('(timestamp, movement_id) > (?, ?)')
+        params.extend(after)
+
+    columns = ', '.join(fields)
+    limit_clause = 'LIMIT ?' if limit else ''
+    sources = movement_sources()
+    # The sort key is carried through compound queries even when not projected
+    branch_columns = ', '.join(list(fields) + [k for k in ('timestamp', 'movement_id') if k not in fields])
+    location_id = request.args.get('location_id')
+    if location_id:
+        # One ordered branch per location column (and table) so each can walk
+        # its own (location, timestamp) index; UNION drops rows matched by both.
+        branches = []
+        branch_params = []
+        for table, extra in sources:
+            for column in ('from_location', 'to_location'):
+                branches.append(f'''
+                SELECT * FROM (
+                    SELECT {branch_columns} FROM {table}
+                    {where_clause(conditions + extra + [f'{column} = ?'])}
+                    ORDER BY timestamp, movement_id {limit_clause}
+                )''')
+                branch_params.extend(params + [location_id] + ([limit] if limit else []))
+        query = f"SELECT {columns} FROM ({' UNION '.join(branches)}) ORDER BY timestamp, movement_id {limit_clause}"
+        params = branch_params
+    elif len(sources) > 1:
+        # ORDER BY on the compound lets SQLite merge the index-ordered branches
+        branches = [f'SELECT {branch_columns} FROM {table} {where_clause(conditions + extra)}' for table, extra in sources]
+        query = f'''
+        SELECT {columns} FROM (
+            {' UNION ALL '.join(branches)}
+            ORDER BY timestamp, movement_id {limit_clause}
+        )
+        '''
+        params = params * len(sources)
+    else:
+        query = f'''
+        SELECT {columns}
+        FROM product_movement
+        {where_clause(conditions)}
+        ORDER BY timestamp, movement_id
+        {limit_clause}
+        '''
+    if limit:
+        params.append(limit)
+    return query, tuple(params)
+
+def movement_position(movement_id):
+    """(timestamp, movement_id) sort key of a movement, for ?after_id="""
+    query = 'SELECT timestamp, movement_id FROM product_movement WHERE movement_id = ?'
+    row = execute_query(query, (movement_id,), one=True)
+    if not row:
+        row = execute_query(query.replace('product_movement', 'movement_archive'), (movement_id,), one=True)
+    if not row:
+        raise ValueError('after_id is not a known movement')
+    return [row['timestamp'], row['movement_id']]
+
 @app.route('/movements', methods=['GET'])
+@conditional
 def get_movements():
-    query = '''
-    SELECT movement_id, timestamp, from_location, to_location, product_id, qty
-    FROM product_movement
-    '''
-    movements = execute_query(query)
-    return jsonify(movements)
+    key = ('timestamp', 'movement_id')
+    try:
+        limit, after, fields = parse_page_args(MOVEMENT_COLUMNS, key)
+        if after is None and request.args.get('after_id'):
+            after = movement_position(request.args['after_id'])
+        # Fetch one extra row to learn whether another page exists
+        query, params = build_movements_query(fields, limit + 1 if limit else None, after)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    columns, movements = execute_query(query, params, raw=True)
+    return page_response(columns, movements, limit, key)
 
-@app.route('/movements', methods=['POST'])
-def add_movement():
+@app.route('/movements/export', methods=['GET'])
+def export_movements():
+    try:
+        fmt, fields = parse_export_args(MOVEMENT_COLUMNS)
+        query, params = build_movements_query(fields)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return export_response(query, params, fmt, 'movements')
+
+CROCKFORD_BASE32 = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+# Two base32 characters per 10-bit chunk
+_BASE32_PAIRS = [a + b for a in CROCKFORD_BASE32 for b in CROCKFORD_BASE32]
+EPOCH = datetime(1970, 1, 1)
+
+class MovementIdGenerator:
+    """Monotonic, time-ordered movement IDs in the 26-character ULID text form.
+
+    The 128 bits are a 48-bit millisecond timestamp, the 32-bit process ID,
+    a 32-bit random per-process nonce and a 16-bit sequence. Within a process
+    IDs strictly increase: the sequence orders IDs minted in the same
+    millisecond, and a clock that steps back is held at the last value.
+    Live processes on a host differ in PID, and the nonce covers PID reuse
+    and other hosts, so workers never mint the same ID. Forked children
+    start their own state.
+
+    Calling the generator returns (movement_id, timestamp), the timestamp
+    being the same clock reading as an ISO string, so movements ordered by
+    (timestamp, movement_id) are in the order their IDs were minted.
+    """
+
+    def __init__(self):
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._node = (os.getpid() & 0xFFFFFFFF) << 32 | int.from_bytes(os.urandom(4), 'big')
+        self._last_ms = 0
+        self._sequence = 0
+
+    def __call__(self):
+        with self._lock:
+            now_ms = time.time_ns() // 1_000_000
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._sequence = 0
+            elif self._sequence < 0xFFFF:
+                self._sequence += 1
+            else:
+                # Sequence used up within one millisecond: borrow the next one
+                self._last_ms += 1
+                self._sequence = 0
+            ms, sequence = self._last_ms, self._sequence
+        value = ms << 80 | self._node << 16 | sequence
+        pairs = []
+        for _ in range(13):
+            pairs.append(_BASE32_PAIRS[value & 1023])
+            value >>= 10
+        timestamp = (EPOCH + timedelta(milliseconds=ms)).isoformat()
+        return ''.join(reversed(pairs)), timestamp
+
+# Mints IDs for new movements and relocations. Any callable returning
+# (movement_id, timestamp) can be assigned here, e.g. a generator that uses
+# a coordinated node ID instead of the PID across many hosts.
+next_movement_id = MovementIdGenerator()
+
+MOVEMENT_ID_FIELDS = ('movement_id', 'product_id', 'from_location', 'to_location')
+
+# Largest value an INTEGER column holds; binding a bigger int raises OverflowError
+SQLITE_MAX_INTEGER = 2 ** 63 - 1
+
+def movement_field_error(data):
+    """Error message if an ID field of a movement payload is set but not a string"""
+    for field in MOVEMENT_ID_FIELDS:
+        if data.get(field) is not None and not isinstance(data[field], str):
+            return f'{field} must be a string'
+    return None
+
+def movement_payload_error(data):
+    """Error message for a POST /movements payload that is malformed.
+
+    These are the inputs that would make the insert raise instead of being
+    rejected, so they are turned away before reaching a group-commit batch
+    where they would fail every movement committed with them.
+    """
+    if not isinstance(data, dict) or not data.get('product_id') or not data.get('qty'):
+        return 'product_id and qty required'
+    error = movement_field_error(data)
+    if error:
+        return error
     try:
-        data = request.get_json()
-        if not data or not data.get('product_id') or not data.get('qty'):
-            return jsonify({'error': 'product_id and qty required'}), 400
-        
-        # Generate or validate movement ID
-        if 'movement_id' in data and data['movement_id']:
-            movement_id = data['movement_id']
-            
-            # Check if movement exists
-            check_query = 'SELECT movement_id FROM product_movement WHERE movement_id = ?'
-            existing = execute_query(check_query, (movement_id,), one=True)
-            if existing:
-                return jsonify({'error': 'Movement ID already exists'}), 400
-        else:
-            # Generate a unique movement ID using timestamp and random number
-            movement_id = f"{int(time.time())}-{random.randint(1000, 9999)}"
-        
-        # Check if product exists
-        product_query = 'SELECT product_id FROM product WHERE product_id = ?'
-        product = execute_query(product_query, (data['product_id'],), one=True)
-        if not product:
-            return jsonify({'error': 'Product does not exist'}), 400
-        
-        # Check from_location if provided
-        if data.get('from_location'):
-            from_loc_query = 'SELECT location_id FROM location WHERE location_id = ?'
-            from_loc = execute_query(from_loc_query, (data['from_location'],), one=True)
-            if not from_loc:
-                return jsonify({'error': 'from_location does not exist'}), 400
-        
-        # Check to_location if provided
-        if data.get('to_location'):
-            to_loc_query = 'SELECT location_id FROM location WHERE location_id = ?'
-            to_loc = execute_query(to_loc_query, (data['to_location'],), one=True)
-            if not to_loc:
-                return jsonify({'error': 'to_location does not exist'}), 400
-        
         qty = int(data['qty'])
-        if qty <= 0:
-            return jsonify({'error': 'qty must be positive'}), 400
-        
-        # Per-location stock validation
-        if data.get('from_location'):
-            # Calculate inbound quantity to the from_location
-            in_query = '''
-            SELECT COALESCE(SUM(qty), 0) as total_in
-            FROM product_movement
-            WHERE product_id = ? AND to_location = ?
-            '''
-            in_result = execute_query(in_query, (data['product_id'], data['from_location']), one=True)
-            in_qty = in_result['total_in'] if in_result else 0
-            
-            # Calculate outbound quantity from the from_location
-            out_query = '''
-            SELECT COALESCE(SUM(qty), 0) as total_out
-            FROM product_movement
-            WHERE product_id = ? AND from_location = ?
-            '''
-            out_result = execute_query(out_query, (data['product_id'], data['from_location']), one=True)
-            out_qty = out_result['total_out'] if out_result else 0
-            
-            available = in_qty - out_qty
-            if available <= 0:
-                return jsonify({'error': f'No stock for product {data["product_id"]} at location {data["from_location"]}'}), 400
-            if qty > available:
-                return jsonify({'error': f'Not enough stock at {data["from_location"]}. Available: {available}'}), 400
-        
-        # Insert new movement
-        timestamp = datetime.utcnow().isoformat()
-        insert_query = '''
-        INSERT INTO product_movement (movement_id, timestamp, from_location, to_location, product_id, qty)
-        VALUES (?, ?, ?, ?, ?, ?)
+    except (TypeError, ValueError):
+        qty = 0
+    if qty <= 0:
+        return 'qty must be positive'
+    if qty > SQLITE_MAX_INTEGER:
+        return 'qty is too large'
+    return None
+
+RESERVED_ID_ERROR = f'Movement IDs starting with {", ".join(RESERVED_MOVEMENT_PREFIXES)} are reserved'
+
+def insert_movement(data, balances):
+    """Validate one movement and insert it in the open transaction.
+
+    balances caches (product_id, location_id) -> qty and is updated after
+    each insert, so movements in one batch are checked against the ones
+    before them. Returns a (body, status) pair.
+    """
+    error = movement_payload_error(data)
+    if error:
+        return {'error': error}, 400
+
+    # Generate or validate movement ID
+    movement_id, timestamp = next_movement_id()
+    if data.get('movement_id'):
+        movement_id = data['movement_id']
+        if movement_id.startswith(RESERVED_MOVEMENT_PREFIXES):
+            return {'error': RESERVED_ID_ERROR}, 400
+        # Archived movements keep their IDs too
+        check_query = '''
+        SELECT movement_id FROM product_movement WHERE movement_id = ?
+        UNION ALL
+        SELECT movement_id FROM movement_archive WHERE movement_id = ?
         '''
+        if execute_query(check_query, (movement_id, movement_id), one=True):
+            return {'error': 'Movement ID already exists'}, 400
+
+    if not get_product_row(data['product_id']):
+        return {'error': 'Product does not exist'}, 400
+    if data.get('from_location') and not get_location_row(data['from_location']):
+        return {'error': 'from_location does not exist'}, 400
+    if data.get('to_location') and not get_location_row(data['to_location']):
+        return {'error': 'to_location does not exist'}, 400
+
+    qty = int(data['qty'])
+
+    # Per-location stock validation
+    if data.get('from_location'):
+        key = (data['product_id'], data['from_location'])
+        if key not in balances:
+            balances[key] = get_available_stock(*key)
+        available = balances[key]
+        if available <= 0:
+            return {'error': f'No stock for product {data["product_id"]} at location {data["from_location"]}'}, 400
+        if qty > available:
+            return {'error': f'Not enough stock at {data["from_location"]}. Available: {available}'}, 400
+
+    insert_query = '''
+    INSERT INTO product_movement (movement_id, timestamp, from_location, to_location, product_id, qty)
+    VALUES (?, ?, ?, ?, ?, ?)
+    '''
+    try:
         execute_query(
-            insert_query, 
-            (movement_id, timestamp, data.get('from_location'), data.get('to_location'), data['product_id'], qty),
+            insert_query,
+            (movement_id, timestamp, data.get('from_location') or None,
+             data.get('to_location') or None, data['product_id'], qty),
             commit=True
         )
-        return jsonify({'message': 'Movement created', 'movement_id': movement_id}), 201
+    except sqlite3.IntegrityError as e:
+        # A failed statement is undone on its own; the rest of the batch stands
+        return {'error': str(e)}, 400
+
+    if data.get('from_location'):
+        balances[(data['product_id'], data['from_location'])] -= qty
+    if data.get('to_location'):
+        key = (data['product_id'], data['to_location'])
+        if key in balances:
+            balances[key] += qty
+    return {'message': 'Movement created', 'movement_id': movement_id}, 201
+
+def commit_movements(batch):
+    """Insert a list of movement payloads in one transaction, in order.
+
+    Returns one (body, status) pair per payload. Rejected movements write
+    nothing; if the transaction itself fails every payload gets a 500.
+    """
+    results = []
+    try:
+        with transaction():
+            balances = {}
+            for data in batch:
+                results.append(insert_movement(data, balances))
+            if any(status < 400 for _, status in results):
+                after_commit(data_version.bump)
+    except Exception as e:
+        app.logger.exception('Movement batch failed')
+        results = [({'error': str(e)}, 500)] * len(batch)
+    return results
+
+GROUP_COMMIT_ENABLED = os.environ.get('GROUP_COMMIT', '1') != '0'
+GROUP_COMMIT_MAX_BATCH = int(os.environ.get('GROUP_COMMIT_MAX_BATCH', 256))
+GROUP_COMMIT_WINDOW_MS = float(os.environ.get('GROUP_COMMIT_WINDOW_MS', 2))
+GROUP_COMMIT_TIMEOUT_SECONDS = float(os.environ.get('GROUP_COMMIT_TIMEOUT_SECONDS', 10))
+
+class _PendingMovement:
+    __slots__ = ('data', 'done', 'result', 'claimed', 'cancelled')
+
+    def __init__(self, data):
+        self.data = data
+        self.done = threading.Event()
+        self.result = None
+        self.claimed = False
+        self.cancelled = False
+
+class MovementWriter:
+    """Dedicated writer thread that group-commits POST /movements.
+
+    Movements arriving within window_ms of the first one (up to max_batch)
+    are committed together by commit_movements(), so a burst of requests
+    costs one write lock and one fsync instead of one each. A caller waits
+    at most timeout seconds for its movement to be picked up; once a batch
+    has claimed it, the caller waits for the commit.
+
+    Batches are committed on this thread unless executor is set; asgi.py
+    points it at its writer pool so one thread makes every write.
+    """
+
+    def __init__(self, max_batch, window_ms, timeout, executor=None):
+        self.max_batch = max(1, max_batch)
+        self.window = window_ms / 1000
+        self.timeout = timeout
+        self.executor = executor
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.batches = 0
+        self.movements = 0
+        self.largest_batch = 0
+
+    def submit(self, data):
+        """Queue one movement payload and wait for its (body, status)"""
+        self._ensure_started()
+        pending = _PendingMovement(data)
+        self._queue.put(pending)
+        if not pending.done.wait(self.timeout):
+            with self._lock:
+                if not pending.claimed:
+                    pending.cancelled = True
+            if pending.cancelled:
+                return {'error': 'Movement writer is busy, try again'}, 503
+            pending.done.wait()
+        return pending.result
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='movement-writer', daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        with self._lock:
+            batch = [pending for pending in batch if not pending.cancelled]
+            for pending in batch:
+                pending.claimed = True
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if not batch:
+                continue
+            payloads = [pending.data for pending in batch]
+            if self.executor is None:
+                results = commit_movements(payloads)
+            else:
+                try:
+                    results = self.executor.submit(commit_movements, payloads).result()
+                except Exception as e:
+                    # e.g. the executor was shut down; callers must not wait forever
+                    app.logger.exception('Movement batch could not be committed')
+                    results = [({'error': str(e)}, 500)] * len(batch)
+            self.batches += 1
+            self.movements += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            for pending, result in zip(batch, results):
+                pending.result = result
+                pending.done.set()
+
+    def stats(self):
+        return {
+            'enabled': True,
+            'queued': self._queue.qsize(),
+            'batches': self.batches,
+            'movements': self.movements,
+            'largest_batch': self.largest_batch,
+        }
+
+movement_writer = MovementWriter(
+    GROUP_COMMIT_MAX_BATCH, GROUP_COMMIT_WINDOW_MS, GROUP_COMMIT_TIMEOUT_SECONDS
+) if GROUP_COMMIT_ENABLED else None
+
+@app.route('/movements', methods=['POST'])
+def add_movement():
+    data = request.get_json(silent=True)
+    # Malformed input is rejected here, never inside a shared batch
+    error = movement_payload_error(data)
+    if error:
+        return jsonify({'error': error}), 400
+    if movement_writer is not None:
+        body, status = movement_writer.submit(data)
+    else:
+        body, status = commit_movements([data])[0]
+    return jsonify(body), status
+
+BULK_MAX_ROWS = 10000
+
+def read_bulk_rows():
+    """Parse a JSON array or NDJSON body into a list of movement dicts"""
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        rows = []
+        for line in request.stream:
+            line = line.strip()
+            if line:
+                rows.append(json.loads(line))
+                if len(rows) > BULK_MAX_ROWS:
+                    break
+        return rows
+    rows = request.get_json(silent=True)
+    if not isinstance(rows, list):
+        raise ValueError('Body must be a JSON array or NDJSON stream of movements')
+    return rows
+
+@app.route('/movements/bulk', methods=['POST'])
+@transactional
+def add_movements_bulk():
+    mode = request.args.get('mode', 'atomic')
+    if mode not in ('atomic', 'best_effort'):
+        return jsonify({'error': 'mode must be atomic or best_effort'}), 400
+
+    try:
+        rows = read_bulk_rows()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if len(rows) > BULK_MAX_ROWS:
+        return jsonify({'error': f'At most {BULK_MAX_ROWS} movements per request'}), 413
+
+    # Validate every referenced ID with one IN query per table; rows with
+    # malformed IDs are rejected one by one below
+    valid_rows = [r for r in rows if isinstance(r, dict) and not movement_field_error(r)]
+    product_ids = {r['product_id'] for r in valid_rows if r.get('product_id')}
+    location_ids = {r[key] for r in valid_rows for key in ('from_location', 'to_location') if r.get(key)}
+    given_ids = {r['movement_id'] for r in valid_rows if r.get('movement_id')}
+
+    known_products = existing_ids(product_cache, product_ids, '''
+        SELECT product_id, name, description, total_quantity, location_id
+        FROM product WHERE product_id IN ({})''')
+    known_locations = existing_ids(location_cache, location_ids, '''
+        SELECT location_id, name, address
+        FROM location WHERE location_id IN ({})''')
+    taken_ids = {r['movement_id'] for table in ('product_movement', 'movement_archive') for r in query_in(
+        f'SELECT movement_id FROM {table} WHERE movement_id IN ({{}})', given_ids)}
+    balances = {
+        (r['product_id'], r['location_id']): r['qty'] for r in query_in(
+            'SELECT product_id, location_id, qty FROM stock_balance WHERE product_id IN ({})', product_ids)
+    }
+
+    # Apply the batch in order against running balances
+    accepted = []
+    rejected = []
+    for index, row in enumerate(rows):
+        error = None
+        if not isinstance(row, dict) or not row.get('product_id') or not row.get('qty'):
+            error = 'product_id and qty required'
+        elif movement_field_error(row):
+            error = movement_field_error(row)
+        elif row['product_id'] not in known_products:
+            error = 'Product does not exist'
+        elif row.get('from_location') and row['from_location'] not in known_locations:
+            error = 'from_location does not exist'
+        elif row.get('to_location') and row['to_location'] not in known_locations:
+            error = 'to_location does not exist'
+        elif row.get('movement_id') and row['movement_id'].startswith(RESERVED_MOVEMENT_PREFIXES):
+            error = RESERVED_ID_ERROR
+        elif row.get('movement_id') and row['movement_id'] in taken_ids:
+            error = 'Movement ID already exists'
+        else:
+            try:
+                qty = int(row['qty'])
+            except (TypeError, ValueError):
+                qty = 0
+            if qty <= 0:
+                error = 'qty must be positive'
+            elif qty > SQLITE_MAX_INTEGER:
+                error = 'qty is too large'
+            elif row.get('from_location'):
+                available = balances.get((row['product_id'], row['from_location']), 0)
+                if qty > available:
+                    error = f'Not enough stock at {row["from_location"]}. Available: {available}'
+
+        if error:
+            rejected.append({'index': index, 'error': error})
+            continue
+
+        movement_id, timestamp = next_movement_id()
+        movement_id = row.get('movement_id') or movement_id
+        taken_ids.add(movement_id)
+        if row.get('from_location'):
+            key = (row['product_id'], row['from_location'])
+            balances[key] = balances.get(key, 0) - qty
+        if row.get('to_location'):
+            key = (row['product_id'], row['to_location'])
+            balances[key] = balances.get(key, 0) + qty
+        accepted.append((movement_id, timestamp, row.get('from_location') or None,
+                         row.get('to_location') or None, row['product_id'], qty))
+
+    result = {
+        'accepted': len(accepted),
+        'rejected': rejected,
+        'movement_ids': [a[0] for a in accepted],
+    }
+    if rejected and mode == 'atomic':
+        result.update(accepted=0, movement_ids=[])
+        return jsonify(result), 400
+    if not accepted:
+        return jsonify(result), 400
+
+    insert_query = '''
+    INSERT INTO product_movement (movement_id, timestamp, from_location, to_location, product_id, qty)
+    VALUES (?, ?, ?, ?, ?, ?)
+    '''
+    try:
+        execute_many(insert_query, accepted)
     except Exception as e:
-        print(f"Error in add_movement: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+        return jsonify({'error': str(e)}), 500
+    return jsonify(result), 201
 
 @app.route('/movements/<movement_id>', methods=['GET'])
 def get_movement(movement_id):
@@ -500,39 +3370,134 @@ def get_movement(movement_id):
     WHERE movement_id = ?
     '''
     movement = execute_query(query, (movement_id,), one=True)
+    if not movement:
+        movement = execute_query(query.replace('product_movement', 'movement_archive'), (movement_id,), one=True)
     if not movement:
         return jsonify({'error': 'Movement not found'}), 404
     return jsonify(movement)
 
+def movement_effects(movement, sign=1):
+    """(product_id, location_id) -> qty change the movement makes, times sign"""
+    effects = {}
+    if movement['from_location']:
+        key = (movement['product_id'], movement['from_location'])
+        effects[key] = effects.get(key, 0) - sign * movement['qty']
+    if movement['to_location']:
+        key = (movement['product_id'], movement['to_location'])
+        effects[key] = effects.get(key, 0) + sign * movement['qty']
+    return effects
+
+def walk_back(balance, rows, lowest, lowest_at):
+    """Walk MOVEMENTS_AFTER_QUERY rows back from the stock after the newest one.
+
+    Returns the stock before the oldest row and the lowest stock just after
+    any of them (or the given lowest, if lower) with its earliest time.
+    """
+    for moved_at, qty, inbound, outbound in rows:
+        if lowest is None or balance <= lowest:
+            lowest, lowest_at = balance, moved_at
+        balance += (qty if outbound else 0) - (qty if inbound else 0)
+    return balance, lowest, lowest_at
+
+def month_start(period):
+    return f'{period}-01T00:00:00'
+
+def period_low(product_id, location_id, period, net):
+    """Recompute and store a cleared stock_period low from that month's movements"""
+    params = (location_id, product_id, month_start(period), '', month_start(next_month(period)))
+    _, rows = execute_query(MOVEMENTS_AFTER_QUERY, params, raw=True)
+    _, low, low_at = walk_back(net, rows, None, None)
+    execute_query('''
+    UPDATE stock_period SET low = ?, low_at = ?
+    WHERE product_key = (SELECT product_key FROM ledger_product WHERE product_id = ?)
+      AND location_key = (SELECT location_key FROM ledger_location WHERE location_id = ?)
+      AND period = ?
+    ''', (low, low_at, product_id, location_id, period), commit=True)
+    return low, low_at
+
+def lowest_balance_since(product_id, location_id, timestamp, movement_id):
+    """Lowest stock of a product at a location from just after a movement until now.
+
+    Walks back from the current stock_balance over the later months of the
+    product at that location through their stock_period summary, then over
+    the movements of the movement's own month that follow it. The cost is
+    one summary row per later month plus one month of movements, however
+    long the history; a later month whose low was cleared by a write is
+    read once and its low stored again. Returns (qty, timestamp), the
+    timestamp being the earliest moment the lowest stock was reached.
+    """
+    balance = get_available_stock(product_id, location_id)
+    lowest, lowest_at = balance, timestamp
+    period = timestamp[:7]
+    _, periods = execute_query(STOCK_PERIODS_AFTER_QUERY, (location_id, product_id, period), raw=True)
+    for later, net, low, low_at in periods:
+        if low is None:
+            low, low_at = period_low(product_id, location_id, later, net)
+        # balance becomes the stock at the start of the month
+        balance -= net
+        if low is not None and balance + low <= lowest:
+            lowest, lowest_at = balance + low, low_at
+    params = (location_id, product_id, timestamp, movement_id, month_start(next_month(period)))
+    _, rows = execute_query(MOVEMENTS_AFTER_QUERY, params, raw=True)
+    balance, lowest, lowest_at = walk_back(balance, rows, lowest, lowest_at)
+    if balance <= lowest:
+        lowest, lowest_at = balance, timestamp
+    return lowest, lowest_at
+
+def check_movement_change(old, new=None):
+    """Error message if replacing old with new (None to delete it) leaves negative stock.
+
+    The change takes effect at old's point in the history, so each
+    (product, location) it takes stock from must hold that much from there
+    until now. Only the locations touched by the two movements are checked,
+    each against the stock it held since that point.
+    """
+    deltas = movement_effects(old, -1)
+    for key, qty in (movement_effects(new) if new else {}).items():
+        deltas[key] = deltas.get(key, 0) + qty
+
+    for (product_id, location_id), delta in sorted(deltas.items()):
+        if delta < 0:
+            lowest, lowest_at = lowest_balance_since(product_id, location_id, old['timestamp'], old['movement_id'])
+            if lowest + delta < 0:
+                return (f'Not enough stock for product {product_id} at {location_id}: '
+                        f'it would fall to {lowest + delta} at {lowest_at}')
+    return None
+
 @app.route('/movements/<movement_id>', methods=['PUT'])
+@transactional
 def update_movement(movement_id):
     # Check if movement exists
     check_query = 'SELECT * FROM product_movement WHERE movement_id = ?'
     movement = execute_query(check_query, (movement_id,), one=True)
     if not movement:
         return jsonify({'error': 'Movement not found'}), 404
+    if movement_id.startswith(OPENING_PREFIX):
+        return jsonify({'error': 'Opening balance movements are maintained by archiving'}), 400
     
     data = request.get_json()
     
     # Validate data
-    if 'qty' in data and int(data['qty']) <= 0:
-        return jsonify({'error': 'qty must be positive'}), 400
+    if 'qty' in data:
+        try:
+            data['qty'] = int(data['qty'])
+        except (TypeError, ValueError):
+            data['qty'] = 0
+        if data['qty'] <= 0:
+            return jsonify({'error': 'qty must be positive'}), 400
     
     if 'product_id' in data:
-        prod_query = 'SELECT product_id FROM product WHERE product_id = ?'
-        product = execute_query(prod_query, (data['product_id'],), one=True)
+        product = get_product_row(data['product_id'])
         if not product:
             return jsonify({'error': 'Product does not exist'}), 400
     
     if 'from_location' in data and data['from_location']:
-        from_loc_query = 'SELECT location_id FROM location WHERE location_id = ?'
-        from_loc = execute_query(from_loc_query, (data['from_location'],), one=True)
+        from_loc = get_location_row(data['from_location'])
         if not from_loc:
             return jsonify({'error': 'from_location does not exist'}), 400
     
     if 'to_location' in data and data['to_location']:
-        to_loc_query = 'SELECT location_id FROM location WHERE location_id = ?'
-        to_loc = execute_query(to_loc_query, (data['to_location'],), one=True)
+        to_loc = get_location_row(data['to_location'])
         if not to_loc:
             return jsonify({'error': 'to_location does not exist'}), 400
     
@@ -550,20 +3515,25 @@ def update_movement(movement_id):
 
     if 'from_location' in data:
         update_fields.append('from_location = ?')
-        params.append(data['from_location'])
+        params.append(data['from_location'] or None)
 
     if 'to_location' in data:
         update_fields.append('to_location = ?')
-        params.append(data['to_location'])
+        params.append(data['to_location'] or None)
 
-    # Always update timestamp to now if any field is updated
-    if update_fields:
-        update_fields.append('timestamp = ?')
-        from datetime import datetime
-        params.append(datetime.utcnow().isoformat())
-    else:
+    # The movement keeps its place in the history; stock is checked from there on
+    if not update_fields:
         return jsonify({'message': 'No fields to update'}), 200
 
+    changed = dict(movement)
+    changed.update({
+        field: data[field] or None if field.endswith('_location') else data[field]
+        for field in ('product_id', 'qty', 'from_location', 'to_location') if field in data
+    })
+    error = check_movement_change(movement, changed)
+    if error:
+        return jsonify({'error': error}), 409
+
     update_query = f'''
     UPDATE product_movement
     SET {', '.join(update_fields)}
@@ -578,12 +3548,19 @@ def update_movement(movement_id):
         return jsonify({'error': str(e)}), 500
 
 @app.route('/movements/<movement_id>', methods=['DELETE'])
+@transactional
 def delete_movement(movement_id):
     # Check if movement exists
-    check_query = 'SELECT movement_id FROM product_movement WHERE movement_id = ?'
+    check_query = 'SELECT * FROM product_movement WHERE movement_id = ?'
     movement = execute_query(check_query, (movement_id,), one=True)
     if not movement:
         return jsonify({'error': 'Movement not found'}), 404
+    if movement_id.startswith(OPENING_PREFIX):
+        return jsonify({'error': 'Opening balance movements are maintained by archiving'}), 400
+
+    error = check_movement_change(movement)
+    if error:
+        return jsonify({'error': error}), 409
     
     delete_query = 'DELETE FROM product_movement WHERE movement_id = ?'
     try:
@@ -593,60 +3570,386 @@ def delete_movement(movement_id):
         return jsonify({'error': str(e)}), 500
 
 # Report endpoint
+REPORT_COLUMNS = ('product_id', 'product_name', 'location_id', 'location_name', 'qty')
+
+def build_report_query():
+    """SELECT over stock_balance honouring the report filters in request.args"""
+    if request.args.get('as_of'):
+        return build_report_as_of_query()
+
+    conditions = []
+    params = []
+
+    since_version = request.args.get('since_version')
+    if since_version is not None:
+        try:
+            since_version = int(since_version)
+        except ValueError:
+            raise ValueError('since_version must be an integer')
+        # Deltas include balances that dropped to zero so clients can remove them
+        conditions.append('sb.version > ?')
+        params.append(since_version)
+    else:
+        conditions.append('sb.qty <> 0')
+
+    if request.args.get('product_id'):
+        conditions.append('sb.product_id = ?')
+        params.append(request.args['product_id'])
+
+    if request.args.get('location_id'):
+        conditions.append('sb.location_id = ?')
+        params.append(request.args['location_id'])
+
+    query = f'''
+    SELECT sb.product_id, p.name as product_name, sb.location_id, l.name as location_name, sb.qty
+    FROM stock_balance sb
+    LEFT JOIN product p ON p.product_id = sb.product_id
+    LEFT JOIN location l ON l.location_id = sb.location_id
+    {where_clause(conditions)}
+    ORDER BY sb.product_id, sb.location_id
+    '''
+    return query, tuple(params)
+
+def build_report_as_of_query():
+    """Historical report: nearest checkpoint plus the movements after it"""
+    if request.args.get('since_version') is not None:
+        raise ValueError('as_of cannot be combined with since_version')
+    try:
+        as_of = parse_as_of(request.args['as_of'])
+    except ValueError:
+        raise ValueError('as_of must be an ISO 8601 timestamp')
+
+    balances_query, params = balances_as_of_query(
+        request.args.get('product_id'), request.args.get('location_id'),
+        **as_of_options(as_of, archive_cutoff()))
+    query = f'''
+    SELECT b.product_id, p.name as product_name, b.location_id, l.name as location_name, b.qty
+    FROM ({balances_query}) b
+    LEFT JOIN product p ON p.product_id = b.product_id
+    LEFT JOIN location l ON l.location_id = b.location_id
+    ORDER BY b.product_id, b.location_id
+    '''
+    return query, bind_as_of(params, as_of)
+
 @app.route('/report', methods=['GET'])
+@conditional
 def report():
-    # Get all products
-    products_query = 'SELECT product_id, name FROM product'
-    products_result = execute_query(products_query)
-    products = {p['product_id']: p['name'] for p in products_result}
-    
-    # Get all locations
-    locations_query = 'SELECT location_id, name FROM location'
-    locations_result = execute_query(locations_query)
-    locations = {l['location_id']: l['name'] for l in locations_result}
-    
-    # Get inbound quantities per product/location
-    in_query = '''
-    SELECT product_id, to_location as location_id, SUM(qty) as in_qty
-    FROM product_movement
-    WHERE to_location IS NOT NULL
-    GROUP BY product_id, to_location
+    try:
+        parse_response_format()
+        report_query, params = build_report_query()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    version_query = 'SELECT version FROM stock_version WHERE id = 1'
+    # One read transaction so the version matches the rows returned
+    with transaction(immediate=False):
+        version = execute_query(version_query, one=True)['version']
+        columns, results = execute_query(report_query, params, raw=True)
+
+    response = rows_response(columns, results)
+    response.headers['X-Stock-Version'] = str(version)
+    return response
+
+@app.route('/report/export', methods=['GET'])
+def export_report():
+    try:
+        fmt, fields = parse_export_args(REPORT_COLUMNS)
+        report_query, params = build_report_query()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if list(fields) != list(REPORT_COLUMNS):
+        report_query = f"SELECT {', '.join(fields)} FROM ({report_query})"
+    return export_response(report_query, params, fmt, 'report')
+
+# Reorder thresholds and stock alerts
+def product_location_filters(prefix=''):
+    """?product_id= / ?location_id= conditions and params"""
+    conditions = []
+    params = []
+    for column in ('product_id', 'location_id'):
+        if request.args.get(column):
+            conditions.append(f'{prefix}{column} = ?')
+            params.append(request.args[column])
+    return conditions, params
+
+@app.route('/thresholds', methods=['GET'])
+@conditional
+def get_thresholds():
+    conditions, params = product_location_filters()
+    query = f'''
+    SELECT product_id, location_id, reorder_point
+    FROM reorder_threshold
+    {where_clause(conditions)}
+    ORDER BY product_id, location_id
     '''
-    in_result = execute_query(in_query)
-    in_map = {(r['product_id'], r['location_id']): r['in_qty'] for r in in_result}
-    
-    # Get outbound quantities per product/location
-    out_query = '''
-    SELECT product_id, from_location as location_id, SUM(qty) as out_qty
-    FROM product_movement
-    WHERE from_location IS NOT NULL
-    GROUP BY product_id, from_location
+    columns, thresholds = execute_query(query, tuple(params), raw=True)
+    return rows_response(columns, thresholds)
+
+@app.route('/thresholds/<product_id>/<location_id>', methods=['PUT'])
+@transactional
+def set_threshold(product_id, location_id):
+    data = request.get_json(silent=True) or {}
+    reorder_point = data.get('reorder_point')
+    if not isinstance(reorder_point, int) or isinstance(reorder_point, bool) or reorder_point < 0:
+        return jsonify({'error': 'reorder_point must be a non-negative integer'}), 400
+    if not get_product_row(product_id):
+        return jsonify({'error': 'Product does not exist'}), 400
+    if not get_location_row(location_id):
+        return jsonify({'error': 'Location does not exist'}), 400
+
+    existing = execute_query(
+        'SELECT reorder_point FROM reorder_threshold WHERE product_id = ? AND location_id = ?',
+        (product_id, location_id), one=True)
+    # The alert triggers re-check this one balance against the new threshold
+    execute_query('''
+    INSERT INTO reorder_threshold (product_id, location_id, reorder_point) VALUES (?, ?, ?)
+    ON CONFLICT (product_id, location_id) DO UPDATE SET reorder_point = excluded.reorder_point
+    ''', (product_id, location_id, reorder_point), commit=True)
+    body = {'product_id': product_id, 'location_id': location_id, 'reorder_point': reorder_point}
+    return jsonify(body), 200 if existing else 201
+
+@app.route('/thresholds/<product_id>/<location_id>', methods=['DELETE'])
+@transactional
+def delete_threshold(product_id, location_id):
+    key = (product_id, location_id)
+    check_query = 'SELECT reorder_point FROM reorder_threshold WHERE product_id = ? AND location_id = ?'
+    if not execute_query(check_query, key, one=True):
+        return jsonify({'error': 'Threshold not found'}), 404
+    execute_query('DELETE FROM reorder_threshold WHERE product_id = ? AND location_id = ?', key, commit=True)
+    return jsonify({'message': 'Threshold deleted'})
+
+@app.route('/alerts', methods=['GET'])
+@conditional
+def get_alerts():
+    """Balances at or below their reorder point, maintained as movements commit"""
+    try:
+        parse_response_format()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    conditions, params = product_location_filters('a.')
+    query = f'''
+    SELECT a.product_id, p.name as product_name, a.location_id, l.name as location_name,
+           a.qty, a.reorder_point, a.since
+    FROM stock_alert a
+    LEFT JOIN product p ON p.product_id = a.product_id
+    LEFT JOIN location l ON l.location_id = a.location_id
+    {where_clause(conditions)}
+    ORDER BY a.product_id, a.location_id
     '''
-    out_result = execute_query(out_query)
-    out_map = {(r['product_id'], r['location_id']): r['out_qty'] for r in out_result}
-    
-    # Calculate balance for each product/location
-    results = []
-    for key in set(list(in_map.keys()) + list(out_map.keys())):
-        p_id, l_id = key
-        in_qty = in_map.get(key, 0)
-        out_qty = out_map.get(key, 0)
-        qty = in_qty - out_qty
-        
-        if qty != 0:
-            results.append({
-                'product_id': p_id,
-                'product_name': products.get(p_id),
-                'location_id': l_id,
-                'location_name': locations.get(l_id),
-                'qty': qty
-            })
-    
-    return jsonify(results)
+    columns, alerts = execute_query(query, tuple(params), raw=True)
+    return rows_response(columns, alerts)
+
+# Server-sent stock changes
+STREAM_BUFFER_SIZE = int(os.environ.get('STREAM_BUFFER_SIZE', 256))
+STREAM_MAX_CLIENTS = int(os.environ.get('STREAM_MAX_CLIENTS', 100))
+STREAM_HEARTBEAT_SECONDS = float(os.environ.get('STREAM_HEARTBEAT_SECONDS', 15))
+# Also picks up writes committed by other worker processes
+STREAM_POLL_SECONDS = float(os.environ.get('STREAM_POLL_SECONDS', 1))
+STREAM_READ_BATCH = 1000
+
+def read_stock_changes(conn, since, limit=STREAM_READ_BATCH):
+    """stock_balance rows changed after version since, grouped by version.
+
+    Returns [(version, [(product_id, location_id, qty), ...]), ...] in
+    version order. Reads about limit rows per call through
+    idx_stock_balance_version but never splits a version across calls.
+    """
+    query = '''
+    SELECT version, product_id, location_id, qty FROM stock_balance
+    WHERE version > ? ORDER BY version LIMIT ?
+    '''
+    rows = conn.execute(query, (since, limit)).fetchall()
+    if len(rows) == limit:
+        last = rows[-1][0]
+        rows = [row for row in rows if row[0] != last]
+        rows += conn.execute(
+            'SELECT version, product_id, location_id, qty FROM stock_balance WHERE version = ?', (last,)
+        ).fetchall()
+    groups = []
+    for version, product_id, location_id, qty in rows:
+        if not groups or groups[-1][0] != version:
+            groups.append((version, []))
+        groups[-1][1].append((product_id, location_id, qty))
+    return groups
+
+def stock_event(version, balances):
+    """One SSE frame; the stock version is the event ID clients resume from"""
+    data = json.dumps({
+        'version': version,
+        'balances': [
+            {'product_id': product_id, 'location_id': location_id, 'qty': qty}
+            for product_id, location_id, qty in balances
+        ],
+    })
+    return f'id: {version}\nevent: stock\ndata: {data}\n\n'.encode()
+
+class _StockSubscriber:
+    __slots__ = ('buffer', 'lagging', 'last_id')
+
+    def __init__(self, last_id):
+        self.buffer = deque()
+        self.lagging = True  # catch up from the database first
+        self.last_id = last_id
+
+class StockStream:
+    """In-process fan-out of stock_balance changes to SSE clients.
+
+    Committed writes only wake the publisher thread. It reads the changed
+    balances once with read_stock_changes, encodes each version as one SSE
+    frame and appends that frame to every client's buffer, so N clients
+    cost one read per commit rather than N. A client whose buffer fills up
+    (STREAM_BUFFER_SIZE frames) is dropped to lagging: its buffer is
+    cleared and it catches up from the database from its last event ID,
+    so a slow client never holds memory or the publisher back.
+    """
+
+    def __init__(self, buffer_size, max_clients):
+        self.buffer_size = buffer_size
+        self.max_clients = max_clients
+        self._cond = threading.Condition()
+        self._subscribers = set()
+        self._wake = threading.Event()
+        self._thread = None
+        self._version = None
+        self._stats = {'published': 0, 'resyncs': 0}
+
+    def notify(self, _=None):
+        self._wake.set()
+
+    def subscribe(self, last_id):
+        with self._cond:
+            if len(self._subscribers) >= self.max_clients:
+                return None
+            subscriber = _StockSubscriber(last_id)
+            self._subscribers.add(subscriber)
+        self._ensure_started()
+        self._wake.set()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._cond:
+            self._subscribers.discard(subscriber)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='stock-stream', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(STREAM_POLL_SECONDS)
+            self._wake.clear()
+            try:
+                self._publish()
+            except Exception as e:
+                app.logger.error('Stock stream publisher failed: %s', e)
+
+    def _publish(self):
+        with self._cond:
+            if not self._subscribers:
+                # Nobody to catch up; new clients read their own backlog
+                self._version = None
+                return
+        conn = db_pool.acquire()
+        try:
+            if self._version is None:
+                self._version = conn.execute('SELECT version FROM stock_version WHERE id = 1').fetchone()[0]
+            while True:
+                groups = read_stock_changes(conn, self._version)
+                if not groups:
+                    return
+                frames = [(version, stock_event(version, balances)) for version, balances in groups]
+                self._version = groups[-1][0]
+                self._fan_out(frames)
+        finally:
+            db_pool.release(conn)
+
+    def _fan_out(self, frames):
+        with self._cond:
+            self._stats['published'] += len(frames)
+            for subscriber in self._subscribers:
+                if subscriber.lagging:
+                    continue
+                if len(subscriber.buffer) + len(frames) > self.buffer_size:
+                    subscriber.buffer.clear()
+                    subscriber.lagging = True
+                    self._stats['resyncs'] += 1
+                    continue
+                subscriber.buffer.extend(frames)
+            self._cond.notify_all()
+
+    def events(self, subscriber):
+        """Yield SSE frames for one client until it disconnects"""
+        try:
+            yield b'retry: 3000\n\n'
+            while True:
+                with self._cond:
+                    if not subscriber.buffer and not subscriber.lagging:
+                        self._cond.wait(STREAM_HEARTBEAT_SECONDS)
+                    catch_up = subscriber.lagging
+                    subscriber.lagging = False
+                    frames = list(subscriber.buffer)
+                    subscriber.buffer.clear()
+                if catch_up:
+                    yield from self._catch_up(subscriber)
+                elif not frames:
+                    yield b': keep-alive\n\n'
+                for version, frame in frames:
+                    # The catch-up read may already have sent this version
+                    if version > subscriber.last_id:
+                        subscriber.last_id = version
+                        yield frame
+        finally:
+            self.unsubscribe(subscriber)
+
+    def _catch_up(self, subscriber):
+        while True:
+            conn = db_pool.acquire()
+            try:
+                groups = read_stock_changes(conn, subscriber.last_id)
+            finally:
+                db_pool.release(conn)
+            if not groups:
+                return
+            for version, balances in groups:
+                subscriber.last_id = version
+                yield stock_event(version, balances)
+
+    def stats(self):
+        with self._cond:
+            return dict(self._stats, clients=len(self._subscribers))
+
+stock_stream = StockStream(STREAM_BUFFER_SIZE, STREAM_MAX_CLIENTS)
+data_version.subscribe(stock_stream.notify)
+
+@app.route('/stream/stock', methods=['GET'])
+def stream_stock():
+    """Server-Sent Events of stock_balance changes.
+
+    Each event carries the balances changed by one stock version. Clients
+    resume with Last-Event-ID (sent by EventSource on reconnect) or start
+    from the X-Stock-Version of a /report response with ?since_version=.
+    Without either, only changes from now on are sent.
+    """
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('since_version')
+    try:
+        last_id = int(last_id) if last_id is not None else None
+    except ValueError:
+        return jsonify({'error': 'Last-Event-ID and since_version must be integers'}), 400
+    if last_id is None:
+        last_id = execute_query('SELECT version FROM stock_version WHERE id = 1', one=True)['version']
+
+    subscriber = stock_stream.subscribe(last_id)
+    if subscriber is None:
+        return jsonify({'error': 'Too many stream clients'}), 503
+    return Response(stock_stream.events(subscriber), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
 
 if __name__ == '__main__':
-    # Initialize the database if it doesn't exist
-    if not os.path.exists(DB_PATH):
-        init_db()
-    
-    app.run(debug=True)
\ No newline at end of file
+    # Initialize the database (idempotent; also adds tables missing from older files)
+    create_app().run(debug=True)
\ No newline at end of file
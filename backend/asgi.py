@@ -0,0 +1,244 @@
+"""ASGI entry point for the inventory API.
+
+Serves the same Flask routes as app.py from an async server such as uvicorn:
+
+    cd backend
+    uvicorn asgi:application --host 127.0.0.1 --port 5000
+
+Flask and sqlite3 are blocking, so every request runs on a thread pool
+shaped after SQLite's locking model: reads (GET/HEAD/OPTIONS) share a pool
+of ASGI_READ_WORKERS threads, each using its own pooled WAL connection,
+while all writes go through a single writer thread. With one writer in the
+process, writes queue in memory instead of contending for the database
+lock, so they never fail with "database is locked". When group commit is
+on, POST /movements only queues the movement for app.py's movement writer,
+which collects a batch and commits it on that same writer thread. Those
+requests spend their time waiting for the batch, so they run on their own
+pool of ASGI_MOVEMENT_WORKERS threads (default GROUP_COMMIT_MAX_BATCH) and
+are admitted separately: a full batch can be waiting at once without
+holding up reads.
+
+Other processes writing the same file (CLI maintenance commands, a second
+server) still take the lock; against those, busy_timeout (DB_PRAGMAS) makes
+a write wait up to 5 seconds before it fails.
+
+GET /stream/stock (Server-Sent Events) holds its thread for as long as the
+client stays connected, so streams get their own pool of up to
+STREAM_MAX_CLIENTS threads and do not count against ASGI_MAX_IN_FLIGHT.
+
+Startup (the lifespan event) checks the schema version and opens and warms
+the pooled connections before the first request is accepted.
+"""
+import asyncio
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from app import GROUP_COMMIT_MAX_BATCH, STREAM_MAX_CLIENTS, app, create_app, db_pool, movement_writer
+
+READ_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS'))
+ASGI_READ_WORKERS = int(os.environ.get('ASGI_READ_WORKERS', os.cpu_count() or 4))
+# Requests admitted at once; further ones wait in the event loop, not in a thread queue
+ASGI_MAX_IN_FLIGHT = int(os.environ.get('ASGI_MAX_IN_FLIGHT', ASGI_READ_WORKERS * 4))
+# Group-committed POST /movements waiting at once (threads mostly blocked on the batch)
+ASGI_MOVEMENT_WORKERS = int(os.environ.get('ASGI_MOVEMENT_WORKERS', GROUP_COMMIT_MAX_BATCH))
+
+reader_pool = ThreadPoolExecutor(max_workers=ASGI_READ_WORKERS, thread_name_prefix='db-reader')
+writer_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+movement_pool = ThreadPoolExecutor(max_workers=ASGI_MOVEMENT_WORKERS, thread_name_prefix='movement-submit')
+stream_pool = ThreadPoolExecutor(max_workers=STREAM_MAX_CLIENTS, thread_name_prefix='event-stream')
+STREAM_PATHS = frozenset(('/stream/stock',))
+
+# Enough idle connections for every reader plus the writer
+db_pool.max_idle = max(db_pool.max_idle, ASGI_READ_WORKERS + 1)
+if movement_writer is not None:
+    movement_writer.executor = writer_pool
+
+_limiter = None
+_movement_limiter = None
+
+def build_environ(scope, body):
+    """WSGI environ for an ASGI HTTP scope (PEP 3333 string rules)"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': _BodyReader(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name == 'CONTENT_LENGTH':
+            continue
+        else:
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+class _BodyReader:
+    """Minimal wsgi.input over an already received request body"""
+
+    def __init__(self, body):
+        self._body = body
+        self._pos = 0
+
+    def read(self, size=-1):
+        end = len(self._body) if size is None or size < 0 else self._pos + size
+        chunk = self._body[self._pos:end]
+        self._pos += len(chunk)
+        return chunk
+
+    def readline(self, size=-1):
+        newline = self._body.find(b'\n', self._pos)
+        end = len(self._body) if newline == -1 else newline + 1
+        if size is not None and size >= 0:
+            end = min(end, self._pos + size)
+        chunk = self._body[self._pos:end]
+        self._pos = end
+        return chunk
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # Schema check and one warmed connection per reader plus the writer
+            await asyncio.get_running_loop().run_in_executor(writer_pool, create_app, ASGI_READ_WORKERS + 1)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            reader_pool.shutdown(wait=True)
+            # Before the writer pool: queued movements still need it to commit
+            movement_pool.shutdown(wait=True)
+            writer_pool.shutdown(wait=True)
+            stream_pool.shutdown(wait=False, cancel_futures=True)
+            db_pool.close_all()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def stream(scope, receive, send, environ):
+    """Relay a long-lived streaming response until it ends or the client leaves"""
+    loop = asyncio.get_running_loop()
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+    response_start = {}
+
+    def start_response(status, headers, exc_info=None):
+        response_start['status'] = int(status.split(' ', 1)[0])
+        response_start['headers'] = [
+            (name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers
+        ]
+
+    iterable = await loop.run_in_executor(stream_pool, app, environ, start_response)
+    iterator = iter(iterable)
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': response_start['status'],
+            'headers': response_start['headers'],
+        })
+        while not disconnected.done():
+            # Each chunk arrives within the stream's heartbeat interval
+            chunk = await loop.run_in_executor(stream_pool, next, iterator, None)
+            if chunk is None:
+                break
+            if chunk and not disconnected.done():
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        if not disconnected.done():
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        disconnected.cancel()
+        close = getattr(iterable, 'close', None)
+        if close is not None:
+            await loop.run_in_executor(stream_pool, close)
+
+async def _wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+async def application(scope, receive, send):
+    global _limiter, _movement_limiter
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    body = await read_body(receive)
+    if body is None:
+        return
+    if _limiter is None:
+        _limiter = asyncio.Semaphore(ASGI_MAX_IN_FLIGHT)
+        _movement_limiter = asyncio.Semaphore(ASGI_MOVEMENT_WORKERS)
+    if scope['method'] == 'GET' and scope['path'] in STREAM_PATHS:
+        await stream(scope, receive, send, build_environ(scope, body))
+        return
+
+    loop = asyncio.get_running_loop()
+    limiter = _limiter
+    if scope['method'] in READ_METHODS:
+        executor = reader_pool
+    elif movement_writer is not None and scope['method'] == 'POST' and scope['path'] == '/movements':
+        executor, limiter = movement_pool, _movement_limiter
+    else:
+        executor = writer_pool
+    environ = build_environ(scope, body)
+    response_start = {}
+
+    def start_response(status, headers, exc_info=None):
+        response_start['status'] = int(status.split(' ', 1)[0])
+        response_start['headers'] = [
+            (name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers
+        ]
+
+    async with limiter:
+        iterable = await loop.run_in_executor(executor, app, environ, start_response)
+        iterator = iter(iterable)
+        try:
+            # Produce the first chunk before sending headers so the status is final
+            chunk = await loop.run_in_executor(executor, next, iterator, None)
+            await send({
+                'type': 'http.response.start',
+                'status': response_start['status'],
+                'headers': response_start['headers'],
+            })
+            while chunk is not None:
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = await loop.run_in_executor(executor, next, iterator, None)
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                await loop.run_in_executor(executor, close)
@@ -0,0 +1,348 @@
+"""Load-test the inventory API and report latency percentiles as JSON.
+
+Run from the backend directory. By default a throwaway database is seeded
+and the routes are driven in-process through Flask's test client:
+
+    python -m bench.bench_api --products 1000 --locations 50 --movements 1000000
+
+Large datasets take a while to seed, so keep one around with --db and reuse it
+across commits (an existing file is only seeded again with --reseed):
+
+    python -m bench.bench_api --db /tmp/bench.db --movements 20000000 --seed-only
+    python -m bench.bench_api --db /tmp/bench.db --concurrency 1,8,32 --output before.json
+
+To measure a real server, start it on the same database and pass --url:
+
+    INVENTORY_DB_PATH=/tmp/bench.db uvicorn asgi:application --port 5000
+    python -m bench.bench_api --db /tmp/bench.db --url http://127.0.0.1:5000
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+SEED_BATCH_SIZE = 50000
+SEED_START = datetime(2024, 1, 1)
+BALANCE_TRIGGERS = ('trg_movement_insert_balance', 'trg_movement_delete_balance', 'trg_movement_update_balance')
+
+def generate_movements(products, locations, count, rng):
+    """Yield a valid ledger: one INIT movement per product, then random traffic.
+
+    Every movement out of a location is covered by stock already there, so the
+    seeded data passes the same checks as data entered through the API.
+    """
+    balances = {}
+    step = timedelta(seconds=max(1, 3 * 365 * 86400 // max(count, 1)))
+    timestamp = SEED_START
+    for p in range(products):
+        location = f'BL{p % locations:05d}'
+        balances[(p, location)] = 1000
+        yield (f'INIT-BP{p:07d}', timestamp.isoformat(), None, location, f'BP{p:07d}', 1000)
+
+    for i in range(max(count - products, 0)):
+        timestamp += step
+        p = rng.randrange(products)
+        source = f'BL{rng.randrange(locations):05d}'
+        target = f'BL{rng.randrange(locations):05d}'
+        qty = rng.randint(1, 20)
+        if balances.get((p, source), 0) < qty:
+            # Nothing to move out of source: receive stock there instead
+            balances[(p, source)] = balances.get((p, source), 0) + qty
+            yield (f'BM{i:010d}', timestamp.isoformat(), None, source, f'BP{p:07d}', qty)
+            continue
+        balances[(p, source)] -= qty
+        if source == target or rng.random() < 0.1:
+            target = None
+        else:
+            balances[(p, target)] = balances.get((p, target), 0) + qty
+        yield (f'BM{i:010d}', timestamp.isoformat(), source, target, f'BP{p:07d}', qty)
+
+def seed(app_module, products, locations, movements, rng):
+    """Fill an empty database with products, locations and a movement ledger.
+
+    Movements go straight into movement_ledger with keys assigned here
+    rather than through the product_movement view. The balance triggers are
+    dropped during the load and stock_balance is rebuilt once at the end,
+    which is much faster than a per-row upsert.
+    """
+    started = time.perf_counter()
+    app_module.init_db()
+    conn = sqlite3.connect(app_module.DB_PATH, isolation_level=None)
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('BEGIN')
+    try:
+        conn.executemany(
+            'INSERT INTO location (location_id, name, address) VALUES (?, ?, ?)',
+            ((f'BL{i:05d}', f'Bench location {i}', f'{i} Bench Street') for i in range(locations)),
+        )
+        conn.executemany(
+            'INSERT INTO product (product_id, name, description, total_quantity, location_id) VALUES (?, ?, ?, ?, ?)',
+            ((f'BP{i:07d}', f'Bench product {i}', None, 1000, f'BL{i % locations:05d}') for i in range(products)),
+        )
+        conn.executemany(
+            'INSERT INTO ledger_location (location_key, location_id) VALUES (?, ?)',
+            ((i + 1, f'BL{i:05d}') for i in range(locations)),
+        )
+        conn.executemany(
+            'INSERT INTO ledger_product (product_key, product_id) VALUES (?, ?)',
+            ((i + 1, f'BP{i:07d}') for i in range(products)),
+        )
+        for trigger in BALANCE_TRIGGERS:
+            conn.execute(f'DROP TRIGGER {trigger}')
+
+        def ledger_key(location_id):
+            return None if location_id is None else int(location_id[2:]) + 1
+
+        rows = (
+            (movement_id, timestamp, int(product_id[2:]) + 1, ledger_key(source), ledger_key(target), qty)
+            for movement_id, timestamp, source, target, product_id, qty
+            in generate_movements(products, locations, movements, rng)
+        )
+        while True:
+            batch = [row for _, row in zip(range(SEED_BATCH_SIZE), rows)]
+            if not batch:
+                break
+            conn.executemany('''
+            INSERT INTO movement_ledger (movement_id, timestamp, product_key, from_key, to_key, qty)
+            VALUES (?, ?, ?, ?, ?, ?)''', batch)
+
+        app_module.rebuild_stock_balance(conn)
+        app_module.run_script(conn, app_module.MOVEMENT_LEDGER_TRIGGERS)
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+    return round(time.perf_counter() - started, 2)
+
+def dataset_counts(path):
+    conn = sqlite3.connect(path)
+    try:
+        return {
+            table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+            for table in ('product', 'location', 'product_movement', 'stock_balance')
+        }
+    finally:
+        conn.close()
+
+def sample_ids(path, limit=1000):
+    conn = sqlite3.connect(path)
+    try:
+        products = [r[0] for r in conn.execute('SELECT product_id FROM product LIMIT ?', (limit,))]
+        locations = [r[0] for r in conn.execute('SELECT location_id FROM location LIMIT ?', (limit,))]
+    finally:
+        conn.close()
+    if not products or not locations:
+        raise SystemExit('Database has no products or locations to drive requests with')
+    return products, locations
+
+def build_scenarios(products, locations):
+    """Name -> function(rng) returning (method, path, json_body)"""
+    return {
+        'post_movement': lambda rng: ('POST', '/movements', {
+            'product_id': rng.choice(products), 'to_location': rng.choice(locations), 'qty': 1,
+        }),
+        'report_product': lambda rng: ('GET', f'/report?product_id={rng.choice(products)}', None),
+        'report_location': lambda rng: ('GET', f'/report?location_id={rng.choice(locations)}', None),
+        'list_products': lambda rng: ('GET', '/products?limit=100', None),
+        'list_locations': lambda rng: ('GET', '/locations?limit=100', None),
+        'list_movements': lambda rng: ('GET', f'/movements?limit=100&product_id={rng.choice(products)}', None),
+    }
+
+class TestClientDriver:
+    """Sends requests in-process through Flask's test client"""
+
+    def __init__(self, app_module):
+        self.app = app_module.app
+
+    def session(self):
+        client = self.app.test_client()
+
+        def send(method, path, body):
+            response = client.open(path, method=method, json=body)
+            response.get_data()
+            return response.status_code
+        return send
+
+class HttpDriver:
+    """Sends requests to a running server over one keep-alive connection per worker"""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+
+    def session(self):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+
+        def send(method, path, body):
+            payload = json.dumps(body) if body is not None else None
+            headers = {'Content-Type': 'application/json'} if body is not None else {}
+            conn.request(method, self.prefix + path, body=payload, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            return response.status
+        return send
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def run_scenario(driver, make_request, concurrency, total, warmup, seed_value):
+    """Send total requests from concurrency workers and summarise their latencies"""
+    latencies = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+    share = [total // concurrency + (1 if i < total % concurrency else 0) for i in range(concurrency)]
+    barrier = threading.Barrier(concurrency + 1)
+
+    def worker(index):
+        rng = random.Random(seed_value * 1000 + index)
+        send = driver.session()
+        for _ in range(warmup):
+            send(*make_request(rng))
+        barrier.wait()
+        for _ in range(share[index]):
+            request = make_request(rng)
+            start = time.perf_counter()
+            try:
+                status = send(*request)
+            except (OSError, http.client.HTTPException):
+                status = 599
+            latencies[index].append(time.perf_counter() - start)
+            if status >= 400:
+                errors[index] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    samples = sorted(value for worker_latencies in latencies for value in worker_latencies)
+    ms = lambda value: round(value * 1000, 3) if value is not None else None  # noqa: E731
+    return {
+        'concurrency': concurrency,
+        'requests': len(samples),
+        'errors': sum(errors),
+        'seconds': round(elapsed, 3),
+        'throughput_rps': round(len(samples) / elapsed, 1) if elapsed else None,
+        'latency_ms': {
+            'mean': ms(sum(samples) / len(samples)) if samples else None,
+            'p50': ms(percentile(samples, 0.50)),
+            'p95': ms(percentile(samples, 0.95)),
+            'p99': ms(percentile(samples, 0.99)),
+            'max': ms(samples[-1] if samples else None),
+        },
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', help='database file to seed or reuse (default: a temporary file)')
+    parser.add_argument('--reseed', action='store_true', help='delete and seed --db again even if it exists')
+    parser.add_argument('--seed-only', action='store_true', help='seed the database and exit')
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--locations', type=int, default=50)
+    parser.add_argument('--movements', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=42, help='random seed for data and request mix')
+    parser.add_argument('--url', help='base URL of a running server (default: in-process test client)')
+    parser.add_argument('--scenarios', default='all', help='comma-separated scenario names or "all"')
+    parser.add_argument('--concurrency', default='1,8,32', help='comma-separated worker counts')
+    parser.add_argument('--requests', type=int, default=2000, help='requests per scenario and concurrency level')
+    parser.add_argument('--warmup', type=int, default=5, help='unmeasured requests per worker')
+    parser.add_argument('--output', help='write the JSON report to this file as well')
+    args = parser.parse_args()
+
+    tmp = None
+    if args.db:
+        path = os.path.abspath(args.db)
+    else:
+        tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(tmp.name, 'bench.db')
+    if args.reseed:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    # app reads the database path at import time
+    os.environ['INVENTORY_DB_PATH'] = path
+    import app as app_module
+
+    rng = random.Random(args.seed)
+    seed_seconds = None
+    if not os.path.exists(path):
+        seed_seconds = seed(app_module, args.products, args.locations, args.movements, rng)
+    else:
+        app_module.init_db()
+    dataset = dataset_counts(path)
+    dataset['seed_seconds'] = seed_seconds
+
+    if args.seed_only:
+        print(json.dumps({'db': path, 'dataset': dataset}, indent=2))
+        return
+
+    products, locations = sample_ids(path)
+    scenarios = build_scenarios(products, locations)
+    names = list(scenarios) if args.scenarios == 'all' else args.scenarios.split(',')
+    unknown = [name for name in names if name not in scenarios]
+    if unknown:
+        raise SystemExit(f'Unknown scenarios: {", ".join(unknown)} (choose from {", ".join(scenarios)})')
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    driver = HttpDriver(args.url) if args.url else TestClientDriver(app_module)
+    started_at = datetime.utcnow().isoformat()
+    results = []
+    try:
+        for name in names:
+            for concurrency in levels:
+                result = run_scenario(driver, scenarios[name], concurrency, args.requests, args.warmup, args.seed)
+                results.append({'scenario': name, **result})
+                print(f'{name} x{concurrency}: {result["throughput_rps"]} req/s, '
+                      f'p99 {result["latency_ms"]["p99"]} ms', file=sys.stderr)
+    finally:
+        app_module.db_pool.close_all()
+        if tmp is not None:
+            tmp.cleanup()
+
+    report = json.dumps({
+        'commit': git_commit(),
+        'started_at': started_at,
+        'target': args.url or 'test_client',
+        'dataset': dataset,
+        'requests_per_run': args.requests,
+        'results': results,
+    }, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Compare row serialization paths on a large movements result.
+
+Run from the backend directory:
+
+    python -m bench.bench_serialization --rows 100000
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import orjson, rows_to_columns, rows_to_dicts  # noqa: E402
+
+QUERY = 'SELECT movement_id, timestamp, from_location, to_location, product_id, qty FROM product_movement'
+
+def legacy_dict_factory(cursor, row):
+    """The per-row factory execute_query used before rows_to_dicts"""
+    d = {}
+    for idx, col in enumerate(cursor.description):
+        d[col[0]] = row[idx]
+    return d
+
+def seed(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute('''
+    CREATE TABLE product_movement (
+        movement_id TEXT PRIMARY KEY, timestamp TEXT, from_location TEXT,
+        to_location TEXT, product_id TEXT NOT NULL, qty INTEGER NOT NULL
+    )''')
+    conn.executemany(
+        'INSERT INTO product_movement VALUES (?, ?, ?, ?, ?, ?)',
+        ((f'M{i:09d}', f'2025-01-01T00:00:{i % 60:02d}', f'L{i % 50}', f'L{(i + 1) % 50}', f'P{i % 1000}', i % 97 + 1)
+         for i in range(rows)),
+    )
+    conn.commit()
+    conn.close()
+
+def fetch_legacy(conn):
+    cursor = conn.cursor()
+    cursor.row_factory = legacy_dict_factory
+    return cursor.execute(QUERY).fetchall()
+
+def fetch_raw(conn):
+    cursor = conn.execute(QUERY)
+    return [col[0] for col in cursor.description], cursor.fetchall()
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        seed(path, args.rows)
+        conn = sqlite3.connect(path)
+
+        def raw_dicts():
+            columns, rows = fetch_raw(conn)
+            return rows_to_dicts(columns, rows)
+
+        def raw_columns():
+            columns, rows = fetch_raw(conn)
+            return rows_to_columns(columns, rows)
+
+        cases = {
+            'legacy_dict_factory': lambda: fetch_legacy(conn),
+            'rows_to_dicts': raw_dicts,
+            'columnar': raw_columns,
+            'legacy_dict_factory+json': lambda: json.dumps(fetch_legacy(conn)),
+            'rows_to_dicts+json': lambda: json.dumps(raw_dicts()),
+            'columnar+json': lambda: json.dumps(raw_columns()),
+        }
+        if orjson is not None:
+            cases['rows_to_dicts+orjson'] = lambda: orjson.dumps(raw_dicts())
+            cases['columnar+orjson'] = lambda: orjson.dumps(raw_columns())
+
+        results = {name: timed(fn, args.repeat) for name, fn in cases.items()}
+        conn.close()
+
+    # Row building alone is compared with the legacy factory; full responses
+    # (build + encode) with the legacy factory plus the stdlib encoder.
+    speedup = {}
+    for name, t in results.items():
+        baseline = results['legacy_dict_factory+json' if '+' in name else 'legacy_dict_factory']
+        speedup[name] = round(baseline / t, 2)
+    print(json.dumps({
+        'rows': args.rows,
+        'seconds': {name: round(t, 4) for name, t in results.items()},
+        'speedup': speedup,
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
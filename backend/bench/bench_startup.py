@@ -0,0 +1,136 @@
+"""Measure cold-start time of a fresh worker process and report it as JSON.
+
+Run from the backend directory. Every sample is a new Python process that
+imports app, prepares the database and serves one request through Flask's
+test client:
+
+    python -m bench.bench_startup --runs 10
+    python -m bench.bench_startup --db /tmp/bench.db --output startup.json
+
+Modes:
+- migrate: empty database file, every migration runs (first deploy)
+- lazy: up-to-date database, no create_app(); the first request checks the
+  schema and opens the connection
+- create_app: up-to-date database, create_app() checks the schema and warms
+  the pool before the first request
+
+Without --db a small database is created in a temporary directory.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from bench.bench_api import git_commit  # noqa: E402
+
+MODES = ('migrate', 'lazy', 'create_app')
+
+# Runs in the child; prints its phase timings in milliseconds as JSON
+CHILD = '''
+import json, sys, time
+started = time.perf_counter()
+import app
+timings = {'import_ms': time.perf_counter() - started}
+if sys.argv[1] != 'lazy':
+    phase = time.perf_counter()
+    app.create_app()
+    timings['create_app_ms'] = time.perf_counter() - phase
+client = app.app.test_client()
+phase = time.perf_counter()
+response = client.get('/products/' + sys.argv[2])
+timings['first_request_ms'] = time.perf_counter() - phase
+phase = time.perf_counter()
+client.get('/products/' + sys.argv[2])
+timings['second_request_ms'] = time.perf_counter() - phase
+timings['ready_ms'] = time.perf_counter() - started
+assert response.status_code in (200, 404), response.status_code
+print(json.dumps({name: value * 1000 for name, value in timings.items()}))
+'''
+
+def sample(path, mode, product_id):
+    """One cold start; returns the child's timings plus the whole process wall time"""
+    if mode == 'migrate':
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD, mode, product_id], cwd=BACKEND_DIR,
+        env=dict(os.environ, INVENTORY_DB_PATH=path), capture_output=True, text=True,
+    )
+    elapsed = (time.perf_counter() - started) * 1000
+    if result.returncode:
+        raise SystemExit(result.stderr)
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings['process_ms'] = elapsed
+    return timings
+
+def summarize(samples):
+    return {
+        name: {
+            'median': round(statistics.median(s[name] for s in samples), 2),
+            'min': round(min(s[name] for s in samples), 2),
+            'max': round(max(s[name] for s in samples), 2),
+        }
+        for name in samples[0]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', help='database to start against (copied; default: a new small one)')
+    parser.add_argument('--runs', type=int, default=5, help='cold starts per mode')
+    parser.add_argument('--modes', default=','.join(MODES), help='comma-separated modes')
+    parser.add_argument('--output', help='write the JSON report to this file as well')
+    args = parser.parse_args()
+
+    modes = args.modes.split(',')
+    unknown = [mode for mode in modes if mode not in MODES]
+    if unknown:
+        raise SystemExit(f'Unknown modes: {", ".join(unknown)} (choose from {", ".join(MODES)})')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        scratch = os.path.join(tmp, 'migrate.db')
+        current = os.path.join(tmp, 'current.db')
+        product_id = 'BP0000000'
+        if args.db:
+            # Checkpointed copy so the WAL of a live database is not needed
+            import sqlite3
+            source = sqlite3.connect(args.db)
+            target = sqlite3.connect(current)
+            source.backup(target)
+            source.close()
+            target.close()
+            sample(current, 'create_app', product_id)
+        else:
+            sample(scratch, 'migrate', product_id)
+            shutil.copy(scratch, current)
+
+        results = []
+        for mode in modes:
+            path = scratch if mode == 'migrate' else current
+            samples = [sample(path, mode, product_id) for _ in range(args.runs)]
+            results.append({'mode': mode, **summarize(samples)})
+            print(f'{mode}: ready in {results[-1]["ready_ms"]["median"]} ms, '
+                  f'first request {results[-1]["first_request_ms"]["median"]} ms', file=sys.stderr)
+
+    report = json.dumps({
+        'commit': git_commit(),
+        'db': args.db,
+        'runs': args.runs,
+        'results': results,
+    }, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+
+if __name__ == '__main__':
+    main()
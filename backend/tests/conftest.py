@@ -0,0 +1,49 @@
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import app as inventory  # noqa: E402
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """A fresh database file for the test; the pool drops connections to the old one"""
+    path = str(tmp_path / 'inventory.db')
+    monkeypatch.setattr(inventory, 'DB_PATH', path)
+    for cache in (inventory.product_cache, inventory.location_cache, inventory.response_cache):
+        cache.clear()
+    inventory.init_db()
+    yield path
+    inventory.db_pool.close_all()
+
+@pytest.fixture
+def client(db_path):
+    return inventory.app.test_client()
+
+@pytest.fixture
+def stock(client):
+    """Locations A, B and C and product P with 10 received at A"""
+    for location_id in ('A', 'B', 'C'):
+        assert client.post('/locations', json={'location_id': location_id, 'name': location_id}).status_code == 201
+    assert client.post('/products', json={
+        'product_id': 'P', 'name': 'P', 'total_quantity': 10, 'location_id': 'A',
+    }).status_code == 201
+    return client
+
+def move(client, **movement):
+    """POST /movements and return the new movement ID (asserts it was created)"""
+    response = client.post('/movements', json=movement)
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['movement_id']
+
+def balances(db_path, product_id='P'):
+    """{location_id: qty} from stock_balance, zero rows left out"""
+    conn = inventory.sqlite3.connect(db_path)
+    try:
+        return dict(conn.execute(
+            'SELECT location_id, qty FROM stock_balance WHERE product_id = ? AND qty <> 0', (product_id,)))
+    finally:
+        conn.close()
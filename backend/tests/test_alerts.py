@@ -0,0 +1,87 @@
+import pytest
+
+from conftest import move
+
+def set_threshold(client, reorder_point, product_id='P', location_id='A'):
+    return client.put(f'/thresholds/{product_id}/{location_id}', json={'reorder_point': reorder_point})
+
+def alerts(client, **filters):
+    """{(product_id, location_id): (qty, reorder_point)} from /alerts"""
+    response = client.get('/alerts', query_string=filters)
+    assert response.status_code == 200
+    return {(a['product_id'], a['location_id']): (a['qty'], a['reorder_point']) for a in response.get_json()}
+
+def test_alert_is_raised_when_the_balance_crosses_below(stock):
+    assert set_threshold(stock, 5).status_code == 201
+    assert alerts(stock) == {}
+    move(stock, product_id='P', from_location='A', to_location='B', qty=5)
+    assert alerts(stock) == {('P', 'A'): (5, 5)}
+    since = stock.get('/alerts').get_json()[0]['since']
+
+    # Still below: the quantity follows, the alert keeps its start time
+    move(stock, product_id='P', from_location='A', to_location='B', qty=2)
+    assert alerts(stock) == {('P', 'A'): (3, 5)}
+    assert stock.get('/alerts').get_json()[0]['since'] == since
+
+def test_alert_is_cleared_when_the_balance_goes_back_above(stock):
+    set_threshold(stock, 5)
+    move(stock, product_id='P', from_location='A', to_location='B', qty=6)
+    assert ('P', 'A') in alerts(stock)
+    move(stock, product_id='P', from_location='B', to_location='A', qty=2)
+    assert alerts(stock) == {}
+
+def test_editing_a_movement_re_checks_the_alert(stock):
+    set_threshold(stock, 5)
+    movement_id = move(stock, product_id='P', from_location='A', to_location='B', qty=2)
+    assert alerts(stock) == {}
+    response = stock.put(f'/movements/{movement_id}', json={'qty': 7})
+    assert response.status_code == 200, response.get_json()
+    assert alerts(stock) == {('P', 'A'): (3, 5)}
+    assert stock.delete(f'/movements/{movement_id}').status_code == 200
+    assert alerts(stock) == {}
+
+def test_alert_follows_threshold_changes(stock):
+    assert set_threshold(stock, 10).status_code == 201
+    assert alerts(stock) == {('P', 'A'): (10, 10)}
+    # Raising the threshold updates the open alert
+    assert set_threshold(stock, 12).status_code == 200
+    assert alerts(stock) == {('P', 'A'): (10, 12)}
+    # Lowering it below the balance clears it
+    set_threshold(stock, 9)
+    assert alerts(stock) == {}
+    set_threshold(stock, 10)
+    assert alerts(stock) == {('P', 'A'): (10, 10)}
+    assert stock.delete('/thresholds/P/A').status_code == 200
+    assert alerts(stock) == {}
+    assert stock.delete('/thresholds/P/A').status_code == 404
+
+def test_threshold_without_a_balance_alerts_at_zero(stock):
+    set_threshold(stock, 3, location_id='B')
+    assert alerts(stock) == {('P', 'B'): (0, 3)}
+    move(stock, product_id='P', from_location='A', to_location='B', qty=4)
+    assert alerts(stock) == {}
+
+def test_alerts_filters(stock):
+    assert stock.post('/products', json={
+        'product_id': 'Q', 'name': 'Q', 'total_quantity': 1, 'location_id': 'B'}).status_code == 201
+    for product_id, location_id in (('P', 'A'), ('P', 'B'), ('Q', 'B')):
+        set_threshold(stock, 20, product_id, location_id)
+    assert set(alerts(stock)) == {('P', 'A'), ('P', 'B'), ('Q', 'B')}
+    assert set(alerts(stock, product_id='P')) == {('P', 'A'), ('P', 'B')}
+    assert set(alerts(stock, location_id='B')) == {('P', 'B'), ('Q', 'B')}
+    assert set(alerts(stock, product_id='Q', location_id='B')) == {('Q', 'B')}
+    assert alerts(stock, product_id='Q', location_id='A') == {}
+
+    first = stock.get('/alerts?location_id=B').get_json()[0]
+    assert (first['product_name'], first['location_name']) == ('P', 'B')
+    columnar = stock.get('/alerts?location_id=B&format=columnar').get_json()
+    assert columnar['product_id'] == ['P', 'Q'] and columnar['qty'] == [0, 1]
+
+@pytest.mark.parametrize('reorder_point', [-1, 1.5, '3', True, None])
+def test_invalid_reorder_point_is_rejected(stock, reorder_point):
+    assert set_threshold(stock, reorder_point).status_code == 400
+    assert stock.get('/thresholds').get_json() == []
+
+def test_threshold_needs_an_existing_product_and_location(stock):
+    assert set_threshold(stock, 1, product_id='X').status_code == 400
+    assert set_threshold(stock, 1, location_id='X').status_code == 400
@@ -0,0 +1,61 @@
+import sqlite3
+
+import app as inventory
+from conftest import balances, move
+
+def archive_everything(db_path):
+    """Archive the current month, i.e. every movement so far"""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        archived = inventory.archive_month(conn, inventory.datetime.utcnow().strftime('%Y-%m'))
+        conn.execute('COMMIT')
+        return archived
+    finally:
+        conn.close()
+
+def test_archived_movement_ids_cannot_be_reused(stock, db_path):
+    move(stock, movement_id='M1', product_id='P', from_location='A', to_location='B', qty=4)
+    assert archive_everything(db_path) == 2
+    assert balances(db_path) == {'A': 6, 'B': 4}
+    assert stock.get('/movements/M1').get_json()['qty'] == 4
+
+    response = stock.post('/movements', json={'movement_id': 'M1', 'product_id': 'P', 'to_location': 'C', 'qty': 1})
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Movement ID already exists'
+
+    response = stock.post('/movements/bulk?mode=best_effort', json=[
+        {'movement_id': 'M1', 'product_id': 'P', 'to_location': 'C', 'qty': 1},
+        {'movement_id': 'M2', 'product_id': 'P', 'to_location': 'C', 'qty': 1},
+    ])
+    assert response.get_json()['rejected'] == [{'index': 0, 'error': 'Movement ID already exists'}]
+    assert balances(db_path) == {'A': 6, 'B': 4, 'C': 1}
+
+def test_opening_ids_do_not_collide_when_ids_contain_dashes(client, db_path):
+    for location_id in ('B', 'C', 'B-C'):
+        assert client.post('/locations', json={'location_id': location_id, 'name': location_id}).status_code == 201
+    # Joined with '-', both pairs would read A-B-C
+    for product_id, location_id in (('A-B', 'C'), ('A', 'B-C')):
+        assert client.post('/products', json={
+            'product_id': product_id, 'name': product_id, 'total_quantity': 5, 'location_id': location_id,
+        }).status_code == 201
+    assert archive_everything(db_path) == 2
+
+    conn = sqlite3.connect(db_path)
+    opening = conn.execute(
+        "SELECT movement_id, product_id, to_location, qty FROM product_movement WHERE movement_id LIKE 'OPEN-%'"
+    ).fetchall()
+    conn.close()
+    assert len({movement_id for movement_id, *_ in opening}) == 2
+    assert sorted(row[1:] for row in opening) == [('A', 'B-C', 5), ('A-B', 'C', 5)]
+
+def test_reserved_movement_id_prefixes_are_rejected(stock, db_path):
+    for movement_id in ('INIT-Q', 'OPEN-2024-01-01-1-1', 'RELOC-X'):
+        response = stock.post('/movements', json={
+            'movement_id': movement_id, 'product_id': 'P', 'to_location': 'B', 'qty': 1})
+        assert response.status_code == 400
+        assert 'reserved' in response.get_json()['error']
+    response = stock.post('/movements/bulk', json=[{'movement_id': 'RELOC-1', 'product_id': 'P', 'to_location': 'B', 'qty': 1}])
+    assert response.status_code == 400
+    assert response.get_json()['rejected'][0]['error'] == inventory.RESERVED_ID_ERROR
+    assert balances(db_path) == {'A': 10}
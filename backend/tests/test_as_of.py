@@ -0,0 +1,66 @@
+import shutil
+import sqlite3
+
+import app as inventory
+from conftest import balances
+from test_migrations import BASELINE_DB
+
+def add_movement(db_path, movement_id, timestamp, qty, from_location=None, to_location='A'):
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        'INSERT INTO product_movement (movement_id, timestamp, from_location, to_location, product_id, qty) '
+        "VALUES (?, ?, ?, ?, 'P', ?)", (movement_id, timestamp, from_location, to_location, qty))
+    conn.commit()
+    conn.close()
+
+def report_as_of(client, as_of):
+    response = client.get('/report', query_string={'as_of': as_of})
+    assert response.status_code == 200, response.get_json()
+    return {r['location_id']: r['qty'] for r in response.get_json() if r['product_id'] == 'P'}
+
+def test_as_of_with_offset_is_converted_to_utc(stock, db_path):
+    add_movement(db_path, 'M1', '2025-01-01T06:00:00', 5, to_location='B')
+    # 10:00+05:30 is 04:30 UTC, before the movement
+    assert report_as_of(stock, '2025-01-01T10:00:00+05:30') == {}
+    assert report_as_of(stock, '2025-01-01T07:00:00+00:00') == {'B': 5}
+    assert report_as_of(stock, '2025-01-01T07:00:00Z') == {'B': 5}
+
+def test_invalid_as_of_is_rejected(stock):
+    assert stock.get('/report?as_of=yesterday').status_code == 400
+
+def test_checkpoint_as_of_is_stored_in_utc(stock, db_path):
+    result = inventory.app.test_cli_runner().invoke(args=['create-checkpoint', '--as-of', '2025-01-01T10:00:00+05:30'])
+    assert result.exit_code == 0, result.output
+    conn = sqlite3.connect(db_path)
+    assert conn.execute('SELECT as_of FROM stock_checkpoint').fetchall() == [('2025-01-01T04:30:00',)]
+    conn.close()
+
+def test_default_timestamp_uses_the_iso_form(stock, db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO product_movement (movement_id, product_id, to_location, qty) VALUES ('M2', 'P', 'B', 1)")
+    conn.commit()
+    (timestamp,), = conn.execute("SELECT timestamp FROM product_movement WHERE movement_id = 'M2'")
+    conn.close()
+    assert timestamp[10] == 'T'
+    assert balances(db_path) == {'A': 10, 'B': 1}
+
+def test_migration_rewrites_space_separated_timestamps(tmp_path, monkeypatch):
+    path = str(tmp_path / 'baseline.db')
+    shutil.copy(BASELINE_DB, path)
+    conn = sqlite3.connect(path)
+    # Written by the baseline schema's CURRENT_TIMESTAMP default, 02:00 UTC
+    conn.execute("INSERT INTO product_movement (movement_id, timestamp, to_location, product_id, qty) "
+                 "VALUES ('LEGACY', '2025-09-16 02:00:00', 'L2', 'P2', 7)")
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(inventory, 'DB_PATH', path)
+    inventory.response_cache.clear()
+    inventory.init_db()
+
+    client = inventory.app.test_client()
+    assert client.get('/movements/LEGACY').get_json()['timestamp'] == '2025-09-16T02:00:00'
+    response = client.get('/report', query_string={'as_of': '2025-09-16T01:00:00'})
+    assert response.get_json() == []
+    response = client.get('/report', query_string={'as_of': '2025-09-16T03:00:00'})
+    assert [(r['product_id'], r['qty']) for r in response.get_json()] == [('P2', 7)]
+    inventory.db_pool.close_all()
@@ -0,0 +1,81 @@
+import asyncio
+import json
+import threading
+from contextlib import contextmanager
+
+import pytest
+
+import app as inventory
+from conftest import balances
+
+asgi = pytest.importorskip('asgi')
+
+async def call(method, path, body=None):
+    """One HTTP request through asgi.application; returns (status, decoded JSON body)"""
+    payload = json.dumps(body).encode() if body is not None else b''
+    scope = {
+        'type': 'http', 'method': method, 'path': path, 'query_string': b'',
+        'headers': [(b'content-type', b'application/json')],
+    }
+    received = []
+    messages = []
+
+    async def receive():
+        if not received:
+            received.append(True)
+            return {'type': 'http.request', 'body': payload, 'more_body': False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        messages.append(message)
+
+    await asgi.application(scope, receive, send)
+    status = messages[0]['status']
+    data = b''.join(m.get('body', b'') for m in messages[1:])
+    return status, json.loads(data) if data else None
+
+@pytest.fixture
+def fresh_limiter(monkeypatch):
+    # The admission semaphore belongs to the event loop of the first request
+    monkeypatch.setattr(asgi, '_limiter', None)
+
+def test_every_write_runs_on_the_writer_thread(stock, db_path, monkeypatch, fresh_limiter):
+    threads = set()
+    original = inventory.transaction
+
+    @contextmanager
+    def recording(*args, **kwargs):
+        threads.add(threading.current_thread().name)
+        with original(*args, **kwargs) as conn:
+            yield conn
+
+    monkeypatch.setattr(inventory, 'transaction', recording)
+
+    async def writes():
+        results = await asyncio.gather(
+            call('POST', '/movements', {'product_id': 'P', 'from_location': 'A', 'to_location': 'B', 'qty': 1}),
+            call('POST', '/movements', {'product_id': 'P', 'from_location': 'A', 'to_location': 'C', 'qty': 2}),
+            call('PUT', '/products/P', {'name': 'Renamed'}),
+        )
+        return [status for status, _ in results]
+
+    assert asyncio.run(writes()) == [201, 201, 200]
+    assert {name.rsplit('_', 1)[0] for name in threads} == {'db-writer'}
+    assert balances(db_path) == {'A': 7, 'B': 1, 'C': 2}
+
+def test_concurrent_movements_share_one_batch(stock, db_path, monkeypatch, fresh_limiter):
+    writer = inventory.movement_writer
+    if writer is None:
+        pytest.skip('group commit is disabled')
+    monkeypatch.setattr(writer, 'window', 0.2)
+    monkeypatch.setattr(writer, 'largest_batch', 0)
+
+    async def burst():
+        return await asyncio.gather(*(
+            call('POST', '/movements', {'product_id': 'P', 'to_location': 'B', 'qty': 1}) for _ in range(60)
+        ))
+
+    assert [status for status, _ in asyncio.run(burst())] == [201] * 60
+    # Not capped by the reader pool or ASGI_MAX_IN_FLIGHT
+    assert writer.largest_batch > asgi.ASGI_MAX_IN_FLIGHT
+    assert balances(db_path) == {'A': 10, 'B': 60}
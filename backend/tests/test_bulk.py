@@ -0,0 +1,95 @@
+import json
+
+import app as inventory
+from conftest import balances, move
+
+def test_atomic_batch_is_all_or_nothing(stock, db_path):
+    response = stock.post('/movements/bulk', json=[
+        {'product_id': 'P', 'from_location': 'A', 'to_location': 'B', 'qty': 4},
+        {'product_id': 'P', 'from_location': 'A', 'to_location': 'Z', 'qty': 1},
+    ])
+    assert response.status_code == 400
+    body = response.get_json()
+    assert body['accepted'] == 0
+    assert body['rejected'] == [{'index': 1, 'error': 'to_location does not exist'}]
+    assert balances(db_path) == {'A': 10}
+
+def test_best_effort_keeps_the_valid_rows(stock, db_path):
+    response = stock.post('/movements/bulk?mode=best_effort', json=[
+        {'product_id': 'P', 'from_location': 'A', 'to_location': 'B', 'qty': 4},
+        {'product_id': 'Q', 'to_location': 'A', 'qty': 1},
+        {'product_id': 'P', 'from_location': 'A', 'qty': 0},
+    ])
+    assert response.status_code == 201
+    body = response.get_json()
+    assert body['accepted'] == 1 and len(body['movement_ids']) == 1
+    assert [r['index'] for r in body['rejected']] == [1, 2]
+    assert balances(db_path) == {'A': 6, 'B': 4}
+
+def test_rows_are_checked_against_running_balances(stock, db_path):
+    # The second row is funded only by the first one
+    response = stock.post('/movements/bulk', json=[
+        {'product_id': 'P', 'from_location': 'A', 'to_location': 'B', 'qty': 10},
+        {'product_id': 'P', 'from_location': 'B', 'to_location': 'C', 'qty': 10},
+        {'product_id': 'P', 'from_location': 'B', 'qty': 1},
+    ])
+    assert response.status_code == 400
+    assert response.get_json()['rejected'] == [{'index': 2, 'error': 'Not enough stock at B. Available: 0'}]
+
+    response = stock.post('/movements/bulk', json=[
+        {'product_id': 'P', 'from_location': 'A', 'to_location': 'B', 'qty': 10},
+        {'product_id': 'P', 'from_location': 'B', 'to_location': 'C', 'qty': 10},
+    ])
+    assert response.status_code == 201
+    assert balances(db_path) == {'C': 10}
+
+def test_ndjson_body_and_duplicate_ids(stock, db_path):
+    existing = move(stock, product_id='P', from_location='A', to_location='B', qty=1)
+    rows = [
+        {'movement_id': 'M1', 'product_id': 'P', 'from_location': 'A', 'to_location': 'C', 'qty': 2},
+        {'movement_id': 'M1', 'product_id': 'P', 'from_location': 'A', 'to_location': 'C', 'qty': 2},
+        {'movement_id': existing, 'product_id': 'P', 'to_location': 'C', 'qty': 2},
+    ]
+    response = stock.post(
+        '/movements/bulk?mode=best_effort', data='\n'.join(json.dumps(r) for r in rows) + '\n',
+        content_type='application/x-ndjson')
+    assert response.status_code == 201
+    body = response.get_json()
+    assert body['movement_ids'] == ['M1']
+    assert body['rejected'] == [
+        {'index': 1, 'error': 'Movement ID already exists'},
+        {'index': 2, 'error': 'Movement ID already exists'},
+    ]
+    assert balances(db_path) == {'A': 7, 'B': 1, 'C': 2}
+
+def test_failed_batch_commit_logs_and_reports_500(stock, monkeypatch, caplog):
+    def broken(data, balances):
+        raise RuntimeError('disk full')
+
+    monkeypatch.setattr(inventory, 'insert_movement', broken)
+    results = inventory.commit_movements([{'product_id': 'P'}, {'product_id': 'P'}])
+    assert results == [({'error': 'disk full'}, 500)] * 2
+    assert 'Movement batch failed' in caplog.text
+
+def test_malformed_rows_are_rejected_alone(stock, db_path):
+    rows = [
+        {'product_id': 'P', 'from_location': 'A', 'to_location': 'B', 'qty': 2},
+        {'product_id': ['P'], 'to_location': 'B', 'qty': 1},
+        {'product_id': 'P', 'from_location': {'id': 'A'}, 'qty': 1},
+        {'movement_id': ['M1'], 'product_id': 'P', 'to_location': 'B', 'qty': 1},
+        {'product_id': 'P', 'to_location': 'B', 'qty': 2 ** 63},
+    ]
+    response = stock.post('/movements/bulk', json=rows)
+    assert response.status_code == 400
+    assert response.get_json()['rejected'] == [
+        {'index': 1, 'error': 'product_id must be a string'},
+        {'index': 2, 'error': 'from_location must be a string'},
+        {'index': 3, 'error': 'movement_id must be a string'},
+        {'index': 4, 'error': 'qty is too large'},
+    ]
+    assert balances(db_path) == {'A': 10}
+
+    response = stock.post('/movements/bulk?mode=best_effort', json=rows)
+    assert response.status_code == 201
+    assert response.get_json()['accepted'] == 1
+    assert balances(db_path) == {'A': 8, 'B': 2}
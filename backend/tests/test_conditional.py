@@ -0,0 +1,82 @@
+import sqlite3
+import subprocess
+import sys
+
+import app as inventory
+from conftest import BACKEND_DIR, move
+
+def get(client, url, etag=None):
+    return client.get(url, headers={'If-None-Match': etag} if etag else {})
+
+def test_unchanged_data_revalidates_with_304(stock):
+    first = get(stock, '/products')
+    assert first.status_code == 200 and first.headers['ETag']
+    again = get(stock, '/products', first.headers['ETag'])
+    assert again.status_code == 304
+    assert again.headers['ETag'] == first.headers['ETag']
+
+def test_api_write_changes_the_etag(stock):
+    etag = get(stock, '/report').headers['ETag']
+    move(stock, product_id='P', from_location='A', to_location='B', qty=4)
+    response = get(stock, '/report', etag)
+    assert response.status_code == 200
+    assert {r['location_id']: r['qty'] for r in response.get_json()} == {'A': 6, 'B': 4}
+
+def test_write_from_another_process_changes_the_etag(stock, db_path):
+    first = get(stock, '/products')
+    etag = first.headers['ETag']
+    # Another worker process writing to the same database file
+    subprocess.run([sys.executable, '-c', (
+        'import sqlite3, sys\n'
+        'conn = sqlite3.connect(sys.argv[1])\n'
+        "conn.execute(\"UPDATE product SET name = 'Renamed' WHERE product_id = 'P'\")\n"
+        'conn.commit()\n'
+    ), db_path], cwd=BACKEND_DIR, check=True)
+
+    response = get(stock, '/products', etag)
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert [p['name'] for p in response.get_json()] == ['Renamed']
+
+def test_cli_writers_change_the_etag(stock, db_path):
+    etag = get(stock, '/report').headers['ETag']
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE stock_balance SET qty = 99 WHERE location_id = 'A'")
+    conn.commit()
+    conn.close()
+    drifted = get(stock, '/report', etag)
+    assert drifted.status_code == 200
+
+    result = inventory.app.test_cli_runner().invoke(args=['rebuild-balances'])
+    assert result.exit_code == 0, result.output
+    response = get(stock, '/report', drifted.headers['ETag'])
+    assert response.status_code == 200
+    assert {r['location_id']: r['qty'] for r in response.get_json()} == {'A': 10}
+
+def test_rejected_write_keeps_the_etag(stock):
+    etag = get(stock, '/report').headers['ETag']
+    stock.post('/movements', json={'product_id': 'P', 'from_location': 'A', 'qty': 50})
+    assert get(stock, '/report', etag).status_code == 304
+
+def test_response_cache_serves_bodies_until_a_write(stock, monkeypatch):
+    report = get(stock, '/report')
+    assert inventory.response_cache.stats()['size'] == 1
+
+    def fail():
+        raise AssertionError('view ran on a cache hit')
+
+    with monkeypatch.context() as patched:
+        patched.setattr(inventory, 'build_report_query', fail)
+        cached = get(stock, '/report')
+    assert cached.get_data() == report.get_data()
+    assert cached.headers['ETag'] == report.headers['ETag']
+
+    move(stock, product_id='P', from_location='A', to_location='B', qty=4)
+    assert inventory.response_cache.stats()['size'] == 0
+    changed = get(stock, '/report')
+    assert changed.headers['ETag'] != report.headers['ETag']
+    assert {r['location_id']: r['qty'] for r in changed.get_json()} == {'A': 6, 'B': 4}
+
+def test_error_responses_are_not_cached(stock):
+    assert get(stock, '/products?limit=0').status_code == 400
+    assert inventory.response_cache.stats()['size'] == 0
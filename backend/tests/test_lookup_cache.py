@@ -0,0 +1,49 @@
+import app as inventory
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(inventory.time, 'monotonic', lambda: now[0])
+    cache = inventory.LookupCache(maxsize=10, ttl=5)
+    cache.set('P', {'product_id': 'P'})
+    now[0] += 4
+    assert cache.get('P') == {'product_id': 'P'}
+    now[0] += 2
+    assert cache.get('P') is None
+    assert cache.stats()['expirations'] == 1
+
+def test_least_recently_used_entry_is_evicted():
+    cache = inventory.LookupCache(maxsize=2, ttl=60)
+    cache.set('A', 1)
+    cache.set('B', 2)
+    cache.get('A')
+    cache.set('C', 3)
+    assert (cache.get('A'), cache.get('B'), cache.get('C')) == (1, None, 3)
+    assert cache.stats()['evictions'] == 1
+
+def test_updated_rows_are_not_served_stale(stock):
+    assert stock.get('/locations/A').get_json()['name'] == 'A'
+    assert inventory.location_cache.get('A') is not None
+    assert stock.put('/locations/A', json={'name': 'Aisle'}).status_code == 200
+    assert inventory.location_cache.get('A') is None
+    assert stock.get('/locations/A').get_json()['name'] == 'Aisle'
+
+    assert stock.get('/products/P').get_json()['name'] == 'P'
+    assert stock.put('/products/P', json={'name': 'Pump'}).status_code == 200
+    assert stock.get('/products/P').get_json()['name'] == 'Pump'
+
+def test_deleted_rows_are_not_found_through_the_cache(stock):
+    assert stock.get('/products/P').status_code == 200
+    assert stock.delete('/products/P').status_code == 200
+    assert stock.get('/products/P').status_code == 404
+    response = stock.post('/movements', json={'product_id': 'P', 'to_location': 'A', 'qty': 1})
+    assert response.get_json() == {'error': 'Product does not exist'}
+
+def test_row_recached_during_the_write_is_dropped_on_commit(stock):
+    old = stock.get('/locations/A').get_json()
+    with inventory.transaction():
+        inventory.execute_query("UPDATE location SET name = 'Aisle' WHERE location_id = 'A'", commit=True)
+        inventory.invalidate_cached(inventory.location_cache, 'A')
+        # A reader outside the transaction still sees and caches the old row
+        inventory.location_cache.set('A', old)
+    assert inventory.location_cache.get('A') is None
+    assert stock.get('/locations/A').get_json()['name'] == 'Aisle'
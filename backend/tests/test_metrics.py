@@ -0,0 +1,62 @@
+import pytest
+
+import app as inventory
+
+@pytest.fixture
+def metrics(monkeypatch):
+    """Instrumentation on, counters reset; settings restored after the test"""
+    monkeypatch.setattr(inventory.metrics, 'enabled', True)
+    monkeypatch.setattr(inventory.metrics, 'slow_query_ms', inventory.metrics.slow_query_ms)
+    inventory.metrics.reset()
+    yield inventory.metrics
+    inventory.metrics.reset()
+
+def scrape(client):
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    samples = {}
+    for line in response.get_data(as_text=True).splitlines():
+        if line and not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value)
+    return samples
+
+def test_requests_are_counted_per_route_and_status(stock, metrics):
+    stock.get('/products/P')
+    stock.get('/products/P')
+    stock.get('/products/missing')
+    samples = scrape(stock)
+    assert samples['inventory_http_requests_total{method="GET",route="/products/<product_id>",status="200"}'] == 2
+    assert samples['inventory_http_requests_total{method="GET",route="/products/<product_id>",status="404"}'] == 1
+    duration = 'inventory_http_request_duration_seconds_{}{{method="GET",route="/products/<product_id>"{}}}'
+    assert samples[duration.format('count', '')] == 3
+    assert samples[duration.format('bucket', ',le="+Inf"')] == 3
+
+def test_queries_are_counted_per_template(stock, metrics):
+    inventory.product_cache.clear()
+    stock.get('/products/P')
+    samples = scrape(stock)
+    template = inventory.query_template(inventory.PRODUCT_ROW_QUERY)
+    assert samples[f'inventory_db_queries_total{{query="{template}"}}'] == 1
+    assert samples[f'inventory_db_query_rows_total{{query="{template}"}}'] == 1
+    assert samples['inventory_cache_lookups_total{cache="product",result="miss"}'] >= 1
+
+def test_in_lists_collapse_into_one_template():
+    assert inventory.query_template('SELECT 1 FROM t WHERE id IN (?, ?,\n ?)') == 'SELECT 1 FROM t WHERE id IN (?, ...)'
+
+def test_slow_queries_are_logged_with_their_plan(stock, metrics, caplog):
+    metrics.slow_query_ms = 0
+    inventory.product_cache.clear()
+    stock.get('/products/P')
+    assert metrics.slow_queries > 0
+    assert 'Slow query' in caplog.text and 'SEARCH product' in caplog.text
+
+def test_config_switches_instrumentation_off(stock, metrics):
+    response = stock.put('/metrics/config', json={'enabled': False, 'reset': True})
+    assert response.get_json()['enabled'] is False
+    stock.get('/products/P')
+    samples = scrape(stock)
+    assert samples['inventory_metrics_enabled'] == 0
+    assert not any('route="/products/<product_id>"' in name for name in samples)
+    assert stock.put('/metrics/config', json={'enabled': 'yes'}).status_code == 400
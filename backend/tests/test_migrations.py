@@ -0,0 +1,72 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+import app as inventory
+from conftest import BACKEND_DIR
+
+# The database file shipped before migrations existed (user_version 0)
+BASELINE_DB = os.path.join(BACKEND_DIR, 'instance', 'database.db')
+
+@pytest.fixture
+def baseline(tmp_path, monkeypatch):
+    path = str(tmp_path / 'baseline.db')
+    shutil.copy(BASELINE_DB, path)
+    monkeypatch.setattr(inventory, 'DB_PATH', path)
+    for cache in (inventory.product_cache, inventory.location_cache, inventory.response_cache):
+        cache.clear()
+    yield path
+    inventory.db_pool.close_all()
+
+def read_rows(path, query):
+    conn = sqlite3.connect(path)
+    try:
+        return sorted(conn.execute(query).fetchall(), key=repr)
+    finally:
+        conn.close()
+
+MOVEMENTS = 'SELECT movement_id, timestamp, from_location, to_location, product_id, qty FROM product_movement'
+
+def test_baseline_database_upgrades_to_the_latest_version(baseline):
+    assert read_rows(baseline, 'PRAGMA user_version') == [(0,)]
+    movements = read_rows(baseline, MOVEMENTS)
+
+    applied = inventory.init_db()
+    assert [version for version, _ in applied] == [version for version, _, _ in inventory.MIGRATIONS]
+    assert read_rows(baseline, 'PRAGMA user_version') == [(inventory.SCHEMA_VERSION,)]
+    # product_movement is now a view over movement_ledger with the same rows
+    assert read_rows(baseline, MOVEMENTS) == movements
+    assert read_rows(baseline, "SELECT type FROM sqlite_master WHERE name = 'product_movement'") == [('view',)]
+
+    conn = sqlite3.connect(baseline)
+    assert inventory.verify_stock_balance(conn) == []
+    conn.close()
+    assert inventory.init_db() == []
+
+def test_every_intermediate_version_upgrades(baseline, tmp_path, monkeypatch):
+    migrations = inventory.MIGRATIONS
+    for stop in range(1, len(migrations)):
+        path = str(tmp_path / f'v{stop}.db')
+        shutil.copy(BASELINE_DB, path)
+        monkeypatch.setattr(inventory, 'DB_PATH', path)
+        monkeypatch.setattr(inventory, 'MIGRATIONS', migrations[:stop])
+        monkeypatch.setattr(inventory, 'SCHEMA_VERSION', migrations[stop - 1][0])
+        inventory.init_db()
+        assert read_rows(path, 'PRAGMA user_version') == [(migrations[stop - 1][0],)]
+
+        monkeypatch.setattr(inventory, 'MIGRATIONS', migrations)
+        monkeypatch.setattr(inventory, 'SCHEMA_VERSION', migrations[-1][0])
+        applied = inventory.init_db()
+        assert [version for version, _ in applied] == [version for version, _, _ in migrations[stop:]]
+        conn = sqlite3.connect(path)
+        assert inventory.verify_stock_balance(conn) == []
+        conn.close()
+
+def test_migrated_database_serves_the_api(baseline):
+    client = inventory.app.test_client()
+    report = {(r['product_id'], r['location_id']): r['qty'] for r in client.get('/report').get_json()}
+    assert report[('P2', 'L2')] == 30
+    assert report[('P2', 'L4')] == 20
+    assert client.get('/movements/INIT-P3').get_json()['qty'] == 20
@@ -0,0 +1,194 @@
+import random
+
+import app as inventory
+from test_archive import archive_everything
+from conftest import balances, move
+
+def test_lowering_total_quantity_below_shipped_stock_is_refused(stock, db_path):
+    move(stock, product_id='P', from_location='A', qty=8)
+    timestamp = stock.get('/movements/INIT-P').get_json()['timestamp']
+
+    response = stock.put('/products/P', json={'total_quantity': 2})
+    assert response.status_code == 409
+    assert response.get_json()['error'].startswith('Not enough stock for product P at A: it would fall to -6')
+    assert balances(db_path) == {'A': 2}
+    assert stock.get('/products/P').get_json()['total_quantity'] == 10
+
+    assert stock.put('/products/P', json={'total_quantity': 8}).status_code == 200
+    assert balances(db_path) == {}
+    init = stock.get('/movements/INIT-P').get_json()
+    assert (init['qty'], init['timestamp']) == (8, timestamp)
+
+def test_total_quantity_and_location_change_together(stock, db_path):
+    move(stock, product_id='P', from_location='A', to_location='B', qty=3)
+    assert stock.put('/products/P', json={'total_quantity': 12, 'location_id': 'C'}).status_code == 200
+    # The INIT movement stays at A; what A holds afterwards moves to C
+    assert balances(db_path) == {'B': 3, 'C': 9}
+
+def test_total_quantity_must_be_a_count(stock, db_path):
+    response = stock.put('/products/P', json={'total_quantity': 'many'})
+    assert response.status_code == 400
+    assert balances(db_path) == {'A': 10}
+
+def test_editing_a_movement_checks_later_stock(stock, db_path):
+    first = move(stock, product_id='P', from_location='A', to_location='B', qty=6)
+    move(stock, product_id='P', from_location='B', to_location='C', qty=5)
+
+    response = stock.put(f'/movements/{first}', json={'qty': 4})
+    assert response.status_code == 409
+    assert 'at B: it would fall to -1' in response.get_json()['error']
+    assert stock.put(f'/movements/{first}', json={'qty': 5}).status_code == 200
+    assert balances(db_path) == {'A': 5, 'C': 5}
+
+    response = stock.delete(f'/movements/{first}')
+    assert response.status_code == 409
+    assert balances(db_path) == {'A': 5, 'C': 5}
+
+def test_edited_movement_keeps_its_timestamp(stock):
+    movement_id = move(stock, product_id='P', from_location='A', to_location='B', qty=6)
+    before = stock.get(f'/movements/{movement_id}').get_json()['timestamp']
+    assert stock.put(f'/movements/{movement_id}', json={'to_location': 'C'}).status_code == 200
+    assert stock.get(f'/movements/{movement_id}').get_json()['timestamp'] == before
+
+def load_history(client, db_path, months, per_month):
+    """Product L received at A in 2022, then per_month movements between A and B in each month from 2023-01"""
+    assert client.post('/products', json={
+        'product_id': 'L', 'name': 'L', 'total_quantity': 50, 'location_id': 'A'}).status_code == 201
+    rng = random.Random(7)
+    held = {'A': 50, 'B': 0}
+    rows = []
+    for month in range(months):
+        year, month = 2023 + month // 12, month % 12 + 1
+        for i in range(per_month):
+            source = rng.choice([loc for loc, qty in held.items() if qty > 0])
+            target = 'B' if source == 'A' else 'A'
+            qty = rng.randint(1, held[source])
+            held[source] -= qty
+            held[target] += qty
+            timestamp = f'{year}-{month:02d}-{1 + i * 27 // per_month:02d}T{i % 24:02d}:00:00'
+            rows.append((f'L{year}{month:02d}{i:04d}', timestamp, source, target, 'L', qty))
+    conn = inventory.sqlite3.connect(db_path)
+    try:
+        conn.execute("UPDATE product_movement SET timestamp = '2022-12-01T00:00:00' WHERE movement_id = 'INIT-L'")
+        conn.executemany('''
+        INSERT INTO product_movement (movement_id, timestamp, from_location, to_location, product_id, qty)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''', rows)
+        conn.commit()
+    finally:
+        conn.close()
+    return [row[0] for row in rows]
+
+def rebuild_periods(db_path):
+    conn = inventory.sqlite3.connect(db_path)
+    try:
+        inventory.rebuild_stock_periods(conn)
+        conn.commit()
+    finally:
+        conn.close()
+
+def stock_periods(db_path):
+    conn = inventory.sqlite3.connect(db_path)
+    try:
+        return conn.execute('SELECT * FROM stock_period ORDER BY product_key, location_key, period').fetchall()
+    finally:
+        conn.close()
+
+def replayed_lowest(db_path, movement_id, location_id):
+    """lowest_balance_since() the slow way: replay the whole ledger of L"""
+    conn = inventory.sqlite3.connect(db_path)
+    try:
+        ledger = conn.execute('''
+        SELECT movement_id, timestamp, from_location, to_location, qty FROM product_movement
+        WHERE product_id = 'L' AND ? IN (from_location, to_location) ORDER BY timestamp, movement_id
+        ''', (location_id,)).fetchall()
+    finally:
+        conn.close()
+    balance, lowest = 0, None
+    for moved_id, timestamp, from_location, to_location, qty in ledger:
+        balance += qty if to_location == location_id else -qty
+        if moved_id == movement_id or lowest is not None and balance < lowest[0]:
+            lowest = (balance, timestamp)
+    return lowest
+
+def rows_read(monkeypatch):
+    """Movement rows fetched by lowest_balance_since(), one entry per query"""
+    read = []
+    execute_query = inventory.execute_query
+
+    def counting(query, params=(), **kwargs):
+        result = execute_query(query, params, **kwargs)
+        if query is inventory.MOVEMENTS_AFTER_QUERY:
+            read.append(len(result[1]))
+        return result
+
+    monkeypatch.setattr(inventory, 'execute_query', counting)
+    return read
+
+def test_edit_under_a_long_history_reads_only_its_month(stock, db_path, monkeypatch):
+    per_month = 40
+    ids = load_history(stock, db_path, months=36, per_month=per_month)
+    rebuild_periods(db_path)
+    read = rows_read(monkeypatch)
+
+    # The check walks 35 later months through stock_period, not their 1400 movements
+    for movement_id in (ids[5], ids[per_month + 5], ids[5]):
+        assert stock.put(f'/movements/{movement_id}', json={'qty': 10_000}).status_code == 409
+        assert 0 < sum(read) < per_month, read
+        read.clear()
+
+    # A write clears the low of its month alone; the next check reads that month once
+    conn = inventory.sqlite3.connect(db_path)
+    try:
+        conn.execute('UPDATE product_movement SET qty = qty WHERE movement_id = ?', (ids[20 * per_month],))
+        conn.commit()
+    finally:
+        conn.close()
+    assert stock.put(f'/movements/{ids[5]}', json={'qty': 10_000}).status_code == 409
+    assert per_month <= sum(read) < 2 * per_month, read
+
+def test_lowest_balance_matches_a_full_replay(stock, db_path):
+    per_month = 30
+    ids = load_history(stock, db_path, months=6, per_month=per_month)
+    rng = random.Random(3)
+
+    def compare():
+        with inventory.transaction():
+            for movement_id in rng.sample(ids, 25):
+                movement = inventory.execute_query(
+                    'SELECT * FROM product_movement WHERE movement_id = ?', (movement_id,), one=True)
+                for location_id in ('A', 'B'):
+                    expected = replayed_lowest(db_path, movement_id, location_id)
+                    got = inventory.lowest_balance_since('L', location_id, movement['timestamp'], movement_id)
+                    assert got == expected, (movement_id, location_id)
+
+    # Lows cleared by the triggers, then computed on demand, then rebuilt in SQL
+    compare()
+    compare()
+    rebuild_periods(db_path)
+    compare()
+
+def test_stock_period_triggers_match_a_rebuild(stock, db_path):
+    ids = load_history(stock, db_path, months=3, per_month=20)
+    assert stock.put(f'/movements/{ids[3]}', json={'to_location': 'C'}).status_code in (200, 409)
+    move(stock, product_id='L', from_location='B', to_location='C', qty=1)
+    conn = inventory.sqlite3.connect(db_path)
+    try:
+        conn.execute("UPDATE product_movement SET timestamp = '2023-02-10T00:00:00' WHERE movement_id = ?", (ids[1],))
+        conn.execute('DELETE FROM product_movement WHERE movement_id = ?', (ids[50],))
+        conn.commit()
+    finally:
+        conn.close()
+
+    def counts():
+        return [row[:5] for row in stock_periods(db_path)]
+
+    maintained = counts()
+    rebuild_periods(db_path)
+    assert counts() == maintained
+
+    archive_everything(db_path)
+    archived = counts()
+    assert all(row[2] >= inventory.datetime.utcnow().strftime('%Y-%m') for row in archived)
+    rebuild_periods(db_path)
+    assert counts() == archived
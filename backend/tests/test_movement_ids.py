@@ -0,0 +1,66 @@
+import threading
+
+import app as inventory
+from conftest import move
+
+MS = 1_700_000_000_000
+
+def frozen_clock(monkeypatch, readings):
+    """time.time_ns returns the given millisecond readings in turn, then the last one"""
+    readings = list(readings)
+    monkeypatch.setattr(inventory.time, 'time_ns', lambda: (readings.pop(0) if len(readings) > 1 else readings[0]) * 1_000_000)
+
+def test_ids_increase_within_one_millisecond(monkeypatch):
+    frozen_clock(monkeypatch, [MS])
+    generate = inventory.MovementIdGenerator()
+    minted = [generate() for _ in range(1000)]
+    ids = [movement_id for movement_id, _ in minted]
+    assert ids == sorted(ids) and len(set(ids)) == 1000
+    assert all(len(movement_id) == 26 for movement_id in ids)
+    assert {timestamp for _, timestamp in minted} == {'2023-11-14T22:13:20'}
+
+def test_clock_stepping_back_is_held_at_the_last_value(monkeypatch):
+    frozen_clock(monkeypatch, [MS + 5, MS, MS + 2, MS + 6])
+    generate = inventory.MovementIdGenerator()
+    minted = [generate() for _ in range(4)]
+    assert [movement_id for movement_id, _ in minted] == sorted(movement_id for movement_id, _ in minted)
+    timestamps = [timestamp for _, timestamp in minted]
+    assert timestamps[:3] == ['2023-11-14T22:13:20.005000'] * 3
+    assert timestamps[3] == '2023-11-14T22:13:20.006000'
+
+def test_exhausted_sequence_borrows_the_next_millisecond(monkeypatch):
+    frozen_clock(monkeypatch, [MS])
+    generate = inventory.MovementIdGenerator()
+    minted = [generate() for _ in range(0x10001)]
+    assert minted[-2][1] == '2023-11-14T22:13:20'
+    assert minted[-1][1] == '2023-11-14T22:13:20.001000'
+    assert minted[-1][0] > minted[-2][0]
+
+def test_threads_never_mint_the_same_id():
+    generate = inventory.MovementIdGenerator()
+    per_thread = [[] for _ in range(8)]
+
+    def mint(out):
+        for _ in range(2000):
+            out.append(generate())
+
+    threads = [threading.Thread(target=mint, args=(out,)) for out in per_thread]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    ids = [movement_id for out in per_thread for movement_id, _ in out]
+    assert len(set(ids)) == len(ids) == 16000
+    for out in per_thread:
+        assert out == sorted(out)
+
+def test_init_movements_use_the_generator_clock(stock, monkeypatch):
+    # An INIT written after a movement in the same millisecond sorts after it
+    frozen_clock(monkeypatch, [MS])
+    monkeypatch.setattr(inventory, 'next_movement_id', inventory.MovementIdGenerator())
+    first = move(stock, product_id='P', from_location='A', to_location='B', qty=1)
+    assert stock.post('/products', json={
+        'product_id': 'Q', 'name': 'Q', 'total_quantity': 3, 'location_id': 'A'}).status_code == 201
+    listed = [m['movement_id'] for m in stock.get('/movements?since=2023-11-14T22:13:20&until=2023-11-14T22:13:21').get_json()]
+    assert listed == [first, 'INIT-Q']
+    assert stock.get('/movements/INIT-Q').get_json()['timestamp'] == '2023-11-14T22:13:20'
@@ -0,0 +1,89 @@
+import sqlite3
+
+import pytest
+
+import app as inventory
+from conftest import balances, move
+
+@pytest.fixture
+def conn(db_path):
+    conn = sqlite3.connect(db_path)
+    yield conn
+    conn.close()
+
+def ledger_row(conn, movement_id):
+    return conn.execute('''
+    SELECT p.product_id, f.location_id, t.location_id, m.qty
+    FROM movement_ledger m
+    JOIN ledger_product p ON p.product_key = m.product_key
+    LEFT JOIN ledger_location f ON f.location_key = m.from_key
+    LEFT JOIN ledger_location t ON t.location_key = m.to_key
+    WHERE m.movement_id = ?''', (movement_id,)).fetchone()
+
+def test_product_movement_is_a_view_over_integer_keys(stock, conn):
+    movement_id = move(stock, product_id='P', from_location='A', to_location='B', qty=4)
+    assert conn.execute("SELECT type FROM sqlite_master WHERE name = 'product_movement'").fetchone() == ('view',)
+    assert ledger_row(conn, movement_id) == ('P', 'A', 'B', 4)
+    # Each ID is stored once however many movements use it
+    assert conn.execute('SELECT COUNT(*) FROM ledger_location').fetchone() == (2,)
+    assert conn.execute('SELECT COUNT(*) FROM ledger_product').fetchone() == (1,)
+    assert stock.get(f'/movements/{movement_id}').get_json()['from_location'] == 'A'
+
+def test_view_insert_creates_keys_and_updates_balances(stock, conn, db_path):
+    conn.execute('''
+    INSERT INTO product_movement (movement_id, timestamp, from_location, to_location, product_id, qty)
+    VALUES ('M1', NULL, 'A', 'C', 'P', 3)''')
+    conn.commit()
+    assert ledger_row(conn, 'M1') == ('P', 'A', 'C', 3)
+    # A missing timestamp defaults to now in the ISO form the API writes
+    timestamp = conn.execute("SELECT timestamp FROM movement_ledger WHERE movement_id = 'M1'").fetchone()[0]
+    assert timestamp[10] == 'T'
+    assert balances(db_path) == {'A': 7, 'C': 3}
+
+def test_view_update_and_delete_reach_the_ledger(stock, conn, db_path):
+    movement_id = move(stock, product_id='P', from_location='A', to_location='B', qty=4)
+    conn.execute("UPDATE product_movement SET to_location = 'C', qty = 2 WHERE movement_id = ?", (movement_id,))
+    conn.commit()
+    assert ledger_row(conn, movement_id) == ('P', 'A', 'C', 2)
+    assert balances(db_path) == {'A': 8, 'C': 2}
+
+    conn.execute('DELETE FROM product_movement WHERE movement_id = ?', (movement_id,))
+    conn.commit()
+    assert conn.execute('SELECT COUNT(*) FROM movement_ledger WHERE movement_id = ?', (movement_id,)).fetchone() == (0,)
+    assert balances(db_path) == {'A': 10}
+
+def test_movements_keep_their_ids_after_the_location_is_deleted(stock, conn):
+    movement_id = move(stock, product_id='P', to_location='C', qty=1)
+    assert stock.delete('/locations/C').status_code == 200
+    movement = stock.get(f'/movements/{movement_id}').get_json()
+    assert movement['to_location'] == 'C'
+
+def test_ledger_indexes_match_their_definitions(db_path, conn):
+    assert all(ok for _, ok, _ in inventory.check_index_columns(conn)), inventory.check_index_columns(conn)
+    plans = inventory.check_query_plans(conn)
+    assert all(ok for _, ok, _ in plans), [p for p in plans if not p[1]]
+
+def test_index_with_the_right_name_but_old_columns_is_reported_and_migrated(db_path, conn):
+    # The definition migration 6 used to create
+    conn.execute('DROP INDEX idx_ledger_timestamp')
+    conn.execute('CREATE INDEX idx_ledger_timestamp ON movement_ledger (timestamp)')
+    conn.execute('PRAGMA user_version = 9')
+    conn.commit()
+    results = {name: (ok, columns) for name, ok, columns in inventory.check_index_columns(conn)}
+    assert results['idx_ledger_timestamp'] == (False, 'timestamp')
+    plans = {name: ok for name, ok, _ in inventory.check_query_plans(conn)}
+    assert plans['movements page'] is False
+
+    applied = [version for version, _ in inventory.init_db()]
+    assert applied == [version for version, _, _ in inventory.MIGRATIONS if version > 9]
+    assert all(ok for _, ok, _ in inventory.check_index_columns(conn))
+
+def test_check_indexes_command_fails_on_a_wrong_index(db_path, conn):
+    runner = inventory.app.test_cli_runner()
+    assert runner.invoke(args=['check-indexes']).exit_code == 0
+    conn.execute('DROP INDEX idx_ledger_to_ts')
+    conn.execute('CREATE INDEX idx_ledger_to_ts ON movement_ledger (to_key, qty)')
+    conn.commit()
+    result = runner.invoke(args=['check-indexes'])
+    assert result.exit_code != 0
+    assert 'BAD  index idx_ledger_to_ts (to_key, qty)' in result.output
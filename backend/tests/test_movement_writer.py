@@ -0,0 +1,80 @@
+import threading
+import time
+
+import app as inventory
+from conftest import balances
+
+def submit_all(writer, payloads):
+    """Queue payloads in order with the writer thread held back, then let it run; results in order"""
+    results = [None] * len(payloads)
+    threads = []
+    writer._ensure_started = lambda: None
+    for index, payload in enumerate(payloads):
+        def run(index=index, payload=payload):
+            results[index] = writer.submit(payload)
+        thread = threading.Thread(target=run)
+        thread.start()
+        threads.append(thread)
+        while writer._queue.qsize() < index + 1:
+            time.sleep(0.001)
+    del writer._ensure_started
+    writer._ensure_started()
+    for thread in threads:
+        thread.join()
+    return results
+
+def test_burst_is_committed_as_one_batch(stock, db_path):
+    writer = inventory.MovementWriter(max_batch=64, window_ms=50, timeout=10)
+    results = submit_all(writer, [
+        {'product_id': 'P', 'from_location': 'A', 'to_location': 'B', 'qty': 6},
+        {'product_id': 'P', 'from_location': 'A', 'to_location': 'C', 'qty': 6},
+        {'product_id': 'P', 'from_location': 'B', 'to_location': 'C', 'qty': 6},
+    ])
+    assert [status for _, status in results] == [201, 400, 201]
+    assert results[1][0]['error'] == 'Not enough stock at A. Available: 4'
+    assert writer.stats()['batches'] == 1 and writer.largest_batch == 3
+    assert balances(db_path) == {'A': 4, 'C': 6}
+
+def test_batches_are_capped_at_max_batch(stock, db_path):
+    writer = inventory.MovementWriter(max_batch=2, window_ms=50, timeout=10)
+    results = submit_all(writer, [{'product_id': 'P', 'to_location': 'B', 'qty': 1}] * 5)
+    assert [status for _, status in results] == [201] * 5
+    assert writer.largest_batch == 2 and writer.batches == 3
+    assert balances(db_path) == {'A': 10, 'B': 5}
+
+def test_caller_gets_503_when_no_batch_picks_it_up(stock, db_path, monkeypatch):
+    writer = inventory.MovementWriter(max_batch=1, window_ms=0, timeout=0.05)
+    # A writer thread that never collects
+    monkeypatch.setattr(writer, '_ensure_started', lambda: None)
+    body, status = writer.submit({'product_id': 'P', 'to_location': 'B', 'qty': 1})
+    assert status == 503
+    assert writer._collect() == []
+    assert balances(db_path) == {'A': 10}
+
+def test_malformed_payload_fails_only_itself(stock, db_path):
+    writer = inventory.MovementWriter(max_batch=64, window_ms=50, timeout=10)
+    results = submit_all(writer, [
+        {'product_id': 'P', 'to_location': 'B', 'qty': 1},
+        {'product_id': ['P'], 'to_location': 'B', 'qty': 1},
+        {'product_id': 'P', 'to_location': 'B', 'qty': 10 ** 30},
+        {'product_id': 'P', 'to_location': 'B', 'qty': 1},
+    ])
+    assert results[1:3] == [({'error': 'product_id must be a string'}, 400), ({'error': 'qty is too large'}, 400)]
+    assert [status for _, status in results] == [201, 400, 400, 201]
+    assert balances(db_path) == {'A': 10, 'B': 2}
+
+def test_malformed_request_never_reaches_the_writer(stock, db_path, monkeypatch):
+    writer = inventory.movement_writer
+    if writer is None:
+        return
+    submitted = []
+    monkeypatch.setattr(writer, 'submit', submitted.append)
+    for payload in (
+        {'product_id': {'id': 'P'}, 'to_location': 'B', 'qty': 1},
+        {'product_id': 'P', 'to_location': ['B'], 'qty': 1},
+        {'product_id': 'P', 'to_location': 'B', 'qty': 'x'},
+        {'product_id': 'P', 'to_location': 'B', 'qty': 2 ** 63},
+        [{'product_id': 'P'}],
+    ):
+        assert stock.post('/movements', json=payload).status_code == 400
+    assert submitted == []
@@ -0,0 +1,65 @@
+import base64
+import json
+
+import pytest
+
+from conftest import move
+
+@pytest.fixture
+def catalog(client):
+    for n in range(5):
+        assert client.post('/locations', json={'location_id': f'L{n}', 'name': f'Location {n}'}).status_code == 201
+    return client
+
+def pages(client, url):
+    """Follow X-Next-Cursor from url; returns the list of pages"""
+    result = []
+    while True:
+        response = client.get(url if not result else f'{url}&after={cursor}')
+        assert response.status_code == 200
+        result.append(response.get_json())
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            return result
+
+def test_keyset_pages_cover_every_row_once(catalog):
+    result = pages(catalog, '/locations?limit=2')
+    assert [[r['location_id'] for r in page] for page in result] == [['L0', 'L1'], ['L2', 'L3'], ['L4']]
+
+def test_movement_pages_follow_timestamp_order(stock):
+    ids = [move(stock, product_id='P', from_location='A', to_location='B', qty=1) for _ in range(4)]
+    result = pages(stock, '/movements?limit=2')
+    assert [m['movement_id'] for page in result for m in page] == ['INIT-P'] + ids
+
+def test_fields_keep_the_sort_key(catalog):
+    response = catalog.get('/locations?fields=name&limit=1')
+    assert response.get_json() == [{'location_id': 'L0', 'name': 'Location 0'}]
+    assert catalog.get('/locations?fields=nope').status_code == 400
+
+def test_columnar_format(catalog):
+    body = catalog.get('/locations?format=columnar&fields=location_id&limit=3').get_json()
+    assert body == {'location_id': ['L0', 'L1', 'L2']}
+    assert catalog.get('/locations?format=table').status_code == 400
+
+@pytest.mark.parametrize('values', [['L1', 'L2'], [1], [None], {'location_id': 'L1'}, 'L1'])
+def test_tampered_cursor_is_rejected(catalog, values):
+    cursor = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+    response = catalog.get(f'/locations?limit=2&after={cursor}')
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid cursor'}
+
+def test_undecodable_cursor_is_rejected(stock):
+    assert stock.get('/movements?after=%25%25%25').status_code == 400
+    cursor = base64.urlsafe_b64encode(json.dumps(['2024-01-01T00:00:00', 7]).encode()).decode()
+    assert stock.get(f'/movements?after={cursor}').get_json() == {'error': 'Invalid cursor'}
+
+def test_since_and_until_accept_utc_offsets(stock):
+    movement = stock.get('/movements/INIT-P').get_json()
+    timestamp = movement['timestamp']
+    assert [m['movement_id'] for m in stock.get(f'/movements?since={timestamp}Z').get_json()] == ['INIT-P']
+    assert stock.get(f'/movements?until={timestamp}%2B00:00').get_json() == []
+    # One hour east of UTC is an hour earlier in stored (UTC) time
+    assert [m['movement_id'] for m in stock.get(f'/movements?until={timestamp}%2B01:00').get_json()] == []
+    assert stock.get('/movements?since=2000-01-01T01:00:00%2B01:00').get_json()[0]['movement_id'] == 'INIT-P'
+    assert stock.get('/movements?since=yesterday').status_code == 400
+    assert stock.get('/movements/export?until=yesterday').status_code == 400
@@ -0,0 +1,43 @@
+import app as inventory
+
+def test_connections_are_opened_with_the_pragmas(db_path):
+    pool = inventory.ConnectionPool(2)
+    conn = pool.acquire()
+    try:
+        assert conn.execute('PRAGMA journal_mode').fetchone() == ('wal',)
+        assert conn.execute('PRAGMA busy_timeout').fetchone() == (5000,)
+        assert conn.execute('PRAGMA synchronous').fetchone() == (1,)
+    finally:
+        pool.release(conn)
+        pool.close_all()
+
+def test_released_connections_are_reused_up_to_max_idle(db_path):
+    pool = inventory.ConnectionPool(1)
+    first, second = pool.acquire(), pool.acquire()
+    pool.release(first)
+    pool.release(second)
+    assert pool.acquire() is first
+    stats = pool.stats()
+    assert (stats['opened'], stats['reused'], stats['closed'], stats['in_use']) == (2, 1, 1, 1)
+    pool.close_all()
+
+def test_release_rolls_back_an_open_transaction(db_path):
+    pool = inventory.ConnectionPool(1)
+    conn = pool.acquire()
+    conn.execute("INSERT INTO location (location_id, name) VALUES ('X', 'X')")
+    assert conn.in_transaction
+    pool.release(conn)
+    assert not conn.in_transaction
+    assert conn.execute("SELECT COUNT(*) FROM location WHERE location_id = 'X'").fetchone() == (0,)
+    pool.close_all()
+
+def test_connections_to_a_previous_database_are_dropped(db_path, tmp_path, monkeypatch):
+    pool = inventory.ConnectionPool(2)
+    old = pool.acquire()
+    pool.release(old)
+    monkeypatch.setattr(inventory, 'DB_PATH', str(tmp_path / 'other.db'))
+    new = pool.acquire()
+    assert new is not old
+    assert pool.stats()['closed'] == 1
+    pool.release(new)
+    pool.close_all()
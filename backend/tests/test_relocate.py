@@ -0,0 +1,66 @@
+import pytest
+
+from conftest import balances, move
+
+@pytest.fixture
+def shelves(stock):
+    """P: 10 at A; Q: 5 at A and 2 at B"""
+    assert stock.post('/products', json={
+        'product_id': 'Q', 'name': 'Q', 'total_quantity': 5, 'location_id': 'A'}).status_code == 201
+    move(stock, product_id='Q', to_location='B', qty=2)
+    return stock
+
+def relocate(client, location_id, **body):
+    return client.post(f'/locations/{location_id}/relocate', json=body)
+
+def test_all_stock_moves_and_products_are_rehomed(shelves, db_path):
+    response = relocate(shelves, 'A', to_location='C')
+    assert response.status_code == 201
+    body = response.get_json()
+    assert (body['movements'], body['qty'], body['products_rehomed']) == (2, 15, 2)
+    assert balances(db_path, 'P') == {'C': 10}
+    assert balances(db_path, 'Q') == {'B': 2, 'C': 5}
+    assert shelves.get('/products/Q').get_json()['location_id'] == 'C'
+
+    movements = [shelves.get(f'/movements/{m}').get_json() for m in body['movement_ids']]
+    assert [(m['product_id'], m['from_location'], m['to_location'], m['qty']) for m in movements] == [
+        ('P', 'A', 'C', 10), ('Q', 'A', 'C', 5)]
+    assert all(m['movement_id'].startswith('RELOC-') for m in movements)
+    assert len({m['timestamp'] for m in movements}) == 1
+
+def test_product_ids_limit_the_relocation(shelves, db_path):
+    body = relocate(shelves, 'A', to_location='C', product_ids=['Q']).get_json()
+    assert (body['movements'], body['qty'], body['products_rehomed']) == (1, 5, 1)
+    assert balances(db_path, 'P') == {'A': 10}
+    assert balances(db_path, 'Q') == {'B': 2, 'C': 5}
+    assert shelves.get('/products/P').get_json()['location_id'] == 'A'
+
+def test_empty_location_moves_nothing(shelves, db_path):
+    response = relocate(shelves, 'C', to_location='A')
+    assert response.status_code == 200
+    assert response.get_json()['movements'] == 0 and response.get_json()['movement_ids'] == []
+    assert balances(db_path, 'P') == {'A': 10}
+
+def test_relocations_can_repeat(shelves, db_path):
+    first = relocate(shelves, 'A', to_location='C').get_json()['movement_ids']
+    second = relocate(shelves, 'C', to_location='A').get_json()['movement_ids']
+    assert len(set(first) | set(second)) == 4
+    assert balances(db_path, 'P') == {'A': 10}
+
+@pytest.mark.parametrize('location_id, body, status, error', [
+    ('A', {'to_location': 'A'}, 400, 'to_location must differ from the source location'),
+    ('A', {'to_location': 'Z'}, 400, 'to_location does not exist'),
+    ('A', {}, 400, 'to_location required'),
+    ('Z', {'to_location': 'A'}, 404, 'Location not found'),
+    ('A', {'to_location': 'C', 'product_ids': 'P'}, 400, 'product_ids must be a list of product IDs'),
+])
+def test_invalid_requests_move_nothing(shelves, db_path, location_id, body, status, error):
+    response = relocate(shelves, location_id, **body)
+    assert response.status_code == status
+    assert response.get_json()['error'] == error
+    assert balances(db_path, 'P') == {'A': 10}
+
+def test_changing_a_products_location_relocates_its_stock(shelves, db_path):
+    assert shelves.put('/products/Q', json={'location_id': 'C'}).status_code == 200
+    assert balances(db_path, 'Q') == {'B': 2, 'C': 5}
+    assert balances(db_path, 'P') == {'A': 10}
@@ -0,0 +1,62 @@
+import sqlite3
+
+import pytest
+
+import app as inventory
+
+@pytest.fixture
+def fresh(tmp_path, monkeypatch):
+    """DB_PATH pointing at a file nothing has created yet, with the schema unchecked"""
+    path = str(tmp_path / 'fresh.db')
+    monkeypatch.setattr(inventory, 'DB_PATH', path)
+    monkeypatch.setattr(inventory, '_schema_checked', None)
+    yield path
+    inventory.db_pool.close_all()
+
+def user_version(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('PRAGMA user_version').fetchone()[0]
+    finally:
+        conn.close()
+
+def set_user_version(path, version):
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute(f'PRAGMA user_version = {version}')
+    finally:
+        conn.close()
+
+def test_create_app_migrates_and_warms_the_pool(fresh):
+    inventory.db_pool.close_all()
+    assert inventory.create_app(connections=2) is inventory.app
+    assert user_version(fresh) == inventory.SCHEMA_VERSION
+    assert inventory.db_pool.stats()['idle'] == 2
+    # Already checked for this DB_PATH: no migration runs on the first request
+    assert inventory.app.test_client().get('/products').status_code == 200
+
+def test_up_to_date_database_applies_nothing(fresh):
+    assert inventory.init_db()
+    assert inventory.init_db() == []
+
+def test_create_app_refuses_a_newer_schema(fresh):
+    inventory.init_db()
+    set_user_version(fresh, inventory.SCHEMA_VERSION + 1)
+    with pytest.raises(RuntimeError, match=f'schema version {inventory.SCHEMA_VERSION + 1}, newer'):
+        inventory.create_app()
+    assert user_version(fresh) == inventory.SCHEMA_VERSION + 1
+    assert inventory._schema_checked is None
+
+def test_first_request_refuses_a_newer_schema(fresh, monkeypatch):
+    inventory.init_db()
+    set_user_version(fresh, inventory.SCHEMA_VERSION + 1)
+    monkeypatch.setitem(inventory.app.config, 'PROPAGATE_EXCEPTIONS', True)
+    with pytest.raises(RuntimeError, match='newer'):
+        inventory.app.test_client().get('/products')
+
+def test_migrate_command_reports_a_newer_schema(fresh):
+    inventory.init_db()
+    set_user_version(fresh, inventory.SCHEMA_VERSION + 1)
+    result = inventory.app.test_cli_runner().invoke(args=['migrate'])
+    assert result.exit_code == 1
+    assert 'newer than' in result.output
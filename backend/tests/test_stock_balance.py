@@ -0,0 +1,39 @@
+import sqlite3
+
+import app as inventory
+from conftest import balances, move
+
+def test_product_with_stock_opens_a_balance(stock, db_path):
+    assert balances(db_path) == {'A': 10}
+
+def test_movements_update_both_locations(stock, db_path):
+    move(stock, product_id='P', from_location='A', to_location='B', qty=4)
+    move(stock, product_id='P', from_location='B', qty=1)
+    assert balances(db_path) == {'A': 6, 'B': 3}
+
+def test_movement_beyond_stock_is_rejected(stock, db_path):
+    response = stock.post('/movements', json={'product_id': 'P', 'from_location': 'A', 'to_location': 'B', 'qty': 11})
+    assert response.status_code == 400
+    assert 'Available: 10' in response.get_json()['error']
+    assert balances(db_path) == {'A': 10}
+
+def test_update_and_delete_reverse_the_old_effect(stock, db_path):
+    movement_id = move(stock, product_id='P', from_location='A', to_location='B', qty=4)
+    assert stock.put(f'/movements/{movement_id}', json={'to_location': 'C', 'qty': 3}).status_code == 200
+    assert balances(db_path) == {'A': 7, 'C': 3}
+    assert stock.delete(f'/movements/{movement_id}').status_code == 200
+    assert balances(db_path) == {'A': 10}
+
+def test_rebuild_restores_drifted_balances(stock, db_path):
+    move(stock, product_id='P', from_location='A', to_location='B', qty=4)
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE stock_balance SET qty = 99 WHERE location_id = 'A'")
+    conn.commit()
+    assert inventory.verify_stock_balance(conn) == [
+        {'product_id': 'P', 'location_id': 'A', 'ledger_qty': 6, 'balance_qty': 99}]
+
+    inventory.rebuild_stock_balance(conn)
+    conn.commit()
+    assert inventory.verify_stock_balance(conn) == []
+    conn.close()
+    assert balances(db_path) == {'A': 6, 'B': 4}
@@ -0,0 +1,100 @@
+import json
+
+import pytest
+
+import app as inventory
+from conftest import move
+
+@pytest.fixture
+def stream(monkeypatch):
+    """A fresh publisher with short timings, so tests never wait on the defaults"""
+    monkeypatch.setattr(inventory, 'STREAM_POLL_SECONDS', 0.05)
+    monkeypatch.setattr(inventory, 'STREAM_HEARTBEAT_SECONDS', 0.05)
+    fresh = inventory.StockStream(buffer_size=8, max_clients=2)
+    monkeypatch.setattr(inventory, 'stock_stream', fresh)
+    return fresh
+
+def connect(client, **kwargs):
+    response = client.get('/stream/stock', buffered=False, **kwargs)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    chunks = iter(response.response)
+    assert next(chunks) == b'retry: 3000\n\n'
+    return response, chunks
+
+def next_event(chunks):
+    """The next stock event as (id, payload), skipping keep-alives"""
+    for chunk in chunks:
+        if chunk.startswith(b':'):
+            continue
+        lines = dict(line.split(': ', 1) for line in chunk.decode().strip().split('\n'))
+        assert lines['event'] == 'stock'
+        return int(lines['id']), json.loads(lines['data'])
+
+def version(client):
+    return int(client.get('/report').headers['X-Stock-Version'])
+
+def test_first_events_carry_the_changed_balances(stock, stream):
+    response, chunks = connect(stock)
+    try:
+        move(stock, product_id='P', from_location='A', to_location='B', qty=4)
+        event_id, payload = next_event(chunks)
+        assert event_id == payload['version'] == version(stock)
+        assert sorted((b['location_id'], b['qty']) for b in payload['balances']) == [('A', 6), ('B', 4)]
+        assert {b['product_id'] for b in payload['balances']} == {'P'}
+
+        move(stock, product_id='P', from_location='B', to_location='C', qty=1)
+        next_id, payload = next_event(chunks)
+        assert next_id > event_id
+        assert sorted((b['location_id'], b['qty']) for b in payload['balances']) == [('B', 3), ('C', 1)]
+    finally:
+        response.close()
+
+def test_idle_stream_sends_heartbeats(stock, stream):
+    response, chunks = connect(stock)
+    try:
+        assert next(chunks) == b': keep-alive\n\n'
+    finally:
+        response.close()
+
+def test_last_event_id_resumes_after_that_version(stock, stream):
+    start = version(stock)
+    move(stock, product_id='P', from_location='A', to_location='B', qty=4)
+    middle = version(stock)
+    move(stock, product_id='P', from_location='B', to_location='C', qty=1)
+
+    response, chunks = connect(stock, headers={'Last-Event-ID': str(start)})
+    try:
+        assert next_event(chunks)[0] == middle
+        assert next_event(chunks)[0] == version(stock)
+    finally:
+        response.close()
+
+    response, chunks = connect(stock, query_string={'since_version': middle})
+    try:
+        event_id, payload = next_event(chunks)
+        assert event_id == version(stock)
+        assert sorted((b['location_id'], b['qty']) for b in payload['balances']) == [('B', 3), ('C', 1)]
+    finally:
+        response.close()
+
+def test_non_integer_resume_point_is_rejected(stock, stream):
+    assert stock.get('/stream/stock', headers={'Last-Event-ID': 'abc'}).status_code == 400
+    assert stock.get('/stream/stock?since_version=1.5').status_code == 400
+    assert stream.stats()['clients'] == 0
+
+def test_clients_beyond_the_limit_are_rejected(stock, stream):
+    first, _ = connect(stock)
+    second, _ = connect(stock)
+    try:
+        rejected = stock.get('/stream/stock')
+        assert rejected.status_code == 503
+        assert rejected.get_json() == {'error': 'Too many stream clients'}
+    finally:
+        first.close()
+    # A disconnect frees its slot
+    third, _ = connect(stock)
+    assert stream.stats()['clients'] == 2
+    second.close()
+    third.close()
+    assert stream.stats()['clients'] == 0
@@ -0,0 +1,67 @@
+import pytest
+
+import app as inventory
+
+def location_ids():
+    return [r['location_id'] for r in inventory.execute_query('SELECT location_id FROM location ORDER BY location_id')]
+
+def add_location(location_id):
+    inventory.execute_query(
+        'INSERT INTO location (location_id, name) VALUES (?, ?)', (location_id, location_id), commit=True)
+
+def test_exception_rolls_back_every_statement(db_path):
+    with pytest.raises(RuntimeError):
+        with inventory.transaction():
+            add_location('A')
+            add_location('B')
+            raise RuntimeError('fail after two writes')
+    assert location_ids() == []
+
+def test_nested_blocks_join_the_outer_transaction(db_path):
+    with pytest.raises(RuntimeError):
+        with inventory.transaction() as outer:
+            with inventory.transaction() as inner:
+                assert inner is outer
+                add_location('A')
+            raise RuntimeError
+    assert location_ids() == []
+
+def test_after_commit_runs_only_once_committed(db_path):
+    calls = []
+    with inventory.transaction():
+        add_location('A')
+        inventory.after_commit(lambda: calls.append(location_ids()))
+        assert calls == []
+    assert calls == [['A']]
+
+    with pytest.raises(RuntimeError):
+        with inventory.transaction():
+            inventory.after_commit(lambda: calls.append('rolled back'))
+            raise RuntimeError
+    assert calls == [['A']]
+
+    inventory.after_commit(lambda: calls.append('no transaction'))
+    assert calls[-1] == 'no transaction'
+
+def test_error_response_rolls_back_the_request(db_path):
+    @inventory.transactional
+    def view():
+        add_location('A')
+        return {'error': 'second step failed'}, 400
+
+    before = inventory.data_version.value
+    with inventory.app.test_request_context():
+        assert view() == ({'error': 'second step failed'}, 400)
+    assert location_ids() == []
+    assert inventory.data_version.value == before
+
+def test_failed_product_update_leaves_no_partial_rows(stock, monkeypatch):
+    # The product row is written before relocate_stock fails
+    def broken(*args, **kwargs):
+        raise RuntimeError('relocation failed')
+
+    monkeypatch.setattr(inventory, 'relocate_stock', broken)
+    response = stock.put('/products/P', json={'name': 'renamed', 'location_id': 'B'})
+    assert response.status_code == 500
+    product = stock.get('/products/P').get_json()
+    assert (product['name'], product['location_id']) == ('P', 'A')
@@ -0,0 +1,55 @@
+import sqlite3
+
+import app as inventory
+from conftest import balances, move
+
+def repair(db_path):
+    result = inventory.verify_ledger(db_path, workers=1)
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        actions = inventory.repair_ledger(conn, result)
+        conn.execute('COMMIT')
+    finally:
+        conn.close()
+    return result, actions
+
+def set_timestamp(db_path, movement_id, timestamp):
+    conn = sqlite3.connect(db_path)
+    conn.execute('UPDATE product_movement SET timestamp = ? WHERE movement_id = ?', (timestamp, movement_id))
+    conn.commit()
+    conn.close()
+
+def test_consistent_ledger_has_nothing_to_repair(stock, db_path):
+    move(stock, product_id='P', from_location='A', to_location='B', qty=4)
+    result, actions = repair(db_path)
+    assert result['rows'] == 2
+    assert actions == []
+
+def test_restamped_init_movement_is_moved_back(stock, db_path):
+    shipped = move(stock, product_id='P', from_location='A', qty=8)
+    # What update_product used to do on every total_quantity edit
+    set_timestamp(db_path, 'INIT-P', '2999-01-01T00:00:00')
+
+    result, actions = repair(db_path)
+    assert [(i['location_id'], i['balance']) for i in result['negative_balances']] == [('A', -8)]
+    assert len(actions) == 1 and actions[0].startswith('P: INIT movement moved from 2999-01-01T00:00:00 to ')
+    init = stock.get('/movements/INIT-P').get_json()['timestamp']
+    assert init < stock.get(f'/movements/{shipped}').get_json()['timestamp']
+    assert inventory.verify_ledger(db_path, workers=1)['negative_balances'] == []
+    assert balances(db_path) == {'A': 2}
+
+def test_other_negative_balances_are_left_for_review(stock, db_path):
+    # Stock taken from B before anything arrived there, not caused by INIT-P
+    conn = sqlite3.connect(db_path)
+    conn.execute('''
+    INSERT INTO product_movement (movement_id, timestamp, from_location, to_location, product_id, qty)
+    VALUES ('M1', '2000-01-01T00:00:00', 'B', NULL, 'P', 1)''')
+    conn.commit()
+    conn.close()
+    init = stock.get('/movements/INIT-P').get_json()['timestamp']
+
+    result, actions = repair(db_path)
+    assert [(i['location_id'], i['balance']) for i in result['negative_balances']] == [('B', -1)]
+    assert actions == []
+    assert stock.get('/movements/INIT-P').get_json()['timestamp'] == init
@@ -2,16 +2,22 @@ import React, { useEffect, useState } from 'react';
 import api from '../api';
 import MovementForm from '../components/MovementForm';
 
+const PAGE_SIZE = 200;
+
 export default function Movements() {
   const [movements, setMovements] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [showForm, setShowForm] = useState(false);
   const [editing, setEditing] = useState(null);
   const [error, setError] = useState('');
 
-  const fetchMovements = async () => {
+  const fetchMovements = async (after = null) => {
     try {
-      const res = await api.get('/movements');
-      setMovements(res.data);
+      const params = { limit: PAGE_SIZE };
+      if (after) params.after = after;
+      const res = await api.get('/movements', { params });
+      setMovements(prev => (after ? [...prev, ...res.data] : res.data));
+      setNextCursor(res.headers['x-next-cursor'] || null);
     } catch (err) {
       setError('Failed to load movements');
     }
@@ -78,6 +84,11 @@ export default function Movements() {
               ))}
             </tbody>
           </table>
+          {nextCursor && (
+            <div className="flex justify-center mt-4">
+              <button className="bg-blue-100 hover:bg-blue-200 text-blue-800 px-6 py-2 rounded-lg font-bold shadow transition-all duration-150" onClick={() => fetchMovements(nextCursor)}>Load more</button>
+            </div>
+          )}
         </div>
       </div>
     </div>
@@ -2,12 +2,86 @@ import React, { useEffect, useState } from 'react';
 import api from '../api';
 import ReportTable from '../components/ReportTable';
 
+// Name a product or location that a streamed balance added to the report
+function applyName(rows, idField, nameField, id, name) {
+  return rows.map(r => r[idField] === id && !r[nameField] ? { ...r, [nameField]: name } : r);
+}
+
+function applyBalances(rows, balances) {
+  const key = r => `${r.product_id}\u0000${r.location_id}`;
+  const changed = new Map(balances.map(b => [key(b), b]));
+  const productNames = new Map(rows.map(r => [r.product_id, r.product_name]));
+  const locationNames = new Map(rows.map(r => [r.location_id, r.location_name]));
+  const next = [];
+  let added = false;
+  for (const r of rows) {
+    const b = changed.get(key(r));
+    if (!b) next.push(r);
+    else if (b.qty !== 0) next.push({ ...r, qty: b.qty });
+    changed.delete(key(r));
+  }
+  for (const b of changed.values()) {
+    if (b.qty === 0) continue;
+    next.push({
+      product_id: b.product_id,
+      product_name: productNames.get(b.product_id),
+      location_id: b.location_id,
+      location_name: locationNames.get(b.location_id),
+      qty: b.qty,
+    });
+    added = true;
+  }
+  if (added) {
+    // Keep the report's product, location order
+    next.sort((a, b) => key(a) < key(b) ? -1 : key(a) > key(b) ? 1 : 0);
+  }
+  return next;
+}
+
 export default function Report() {
   const [rows, setRows] = useState([]);
   const [error, setError] = useState('');
 
   useEffect(() => {
-    api.get('/report').then(res => setRows(res.data)).catch(() => setError('Failed to load report'));
+    let source = null;
+    let closed = false;
+    const known = { product: new Set(), location: new Set() };
+
+    // Look up names the report did not have; until then the row shows the ID
+    const resolveNames = balances => {
+      for (const b of balances) {
+        if (b.qty === 0) continue;
+        for (const kind of ['product', 'location']) {
+          const id = b[`${kind}_id`];
+          if (known[kind].has(id)) continue;
+          known[kind].add(id);
+          api.get(`/${kind}s/${encodeURIComponent(id)}`).then(res => {
+            if (!closed) setRows(prev => applyName(prev, `${kind}_id`, `${kind}_name`, id, res.data.name));
+          }).catch(() => {});
+        }
+      }
+    };
+
+    api.get('/report').then(res => {
+      setRows(res.data);
+      for (const r of res.data) {
+        known.product.add(r.product_id);
+        known.location.add(r.location_id);
+      }
+      if (closed) return;
+      // Apply balance changes as they are committed instead of re-fetching the report
+      const version = res.headers['x-stock-version'];
+      source = new EventSource(`${api.defaults.baseURL}/stream/stock?since_version=${version}`);
+      source.addEventListener('stock', event => {
+        const { balances } = JSON.parse(event.data);
+        setRows(prev => applyBalances(prev, balances));
+        resolveNames(balances);
+      });
+    }).catch(() => setError('Failed to load report'));
+    return () => {
+      closed = true;
+      if (source) source.close();
+    };
   }, []);
 
   // Calculate total products and total stock